@@ -0,0 +1,162 @@
+"""GUIなしで書き出すコマンドラインの入口 (ファームやmayapy用)
+
+    mayapy My_export_USD_Mtlx_batch.py scene.mb --root |grpA --root |key --frames 1 100 --output D:/usd
+    mayapy My_export_USD_Mtlx_batch.py scene.mb --root |grpA --frames 1 100 --output D:/usd --dry-run --plan plan.json
+    mayapy My_export_USD_Mtlx_batch.py scene.mb --plan plan.json --output D:/usd
+
+Qtは一切読み込まない。起動から書き出し完了までの各段階の時間を表示し、--timings でjsonに書き出す。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+START_TIME = time.perf_counter()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="USD/MaterialXをGUIなしで書き出す")
+    parser.add_argument("scene", nargs="?", help="開くシーン。省略すると現在のシーンを使う")
+    parser.add_argument("--root", dest="roots", action="append",
+                        help="書き出すグループ・ライト・カメラ (複数指定可)")
+    parser.add_argument("--output", required=True, help="書き出し先フォルダ")
+    parser.add_argument("--frames", type=float, nargs=2, metavar=("START", "END"), help="フレームレンジ")
+    parser.add_argument("--houdini-py", action="store_true", help="Houdini用Pythonを書き出す")
+    parser.add_argument("--houdini-loader", choices=("chain", "single", "lazy"), default="chain",
+                        help="Houdiniローダーの構成 (single/lazyは1つのsublayerとマスク)")
+    parser.add_argument("--batch", action="store_true", help="グループ内のメッシュをまとめて書き出す")
+    parser.add_argument("--incremental", action="store_true", help="変更のあるアセットのみ書き出す")
+    parser.add_argument("--format", choices=("usda", "usdc"), help="アセットのファイル形式")
+    parser.add_argument("--layer-format", choices=("usda", "usdc"), default="usda", help="コンバインUSDの形式")
+    parser.add_argument("--keep-static-samples", action="store_true",
+                        help="動きのないアセットもタイムサンプル付きで書き出す")
+    parser.add_argument("--clip-frames", type=int, help="クリップ分割フレーム数")
+    parser.add_argument("--instance-duplicates", action="store_true",
+                        help="同じ形状のメッシュはインスタンスとして書き出す")
+    parser.add_argument("--payloads", action="store_true",
+                        help="グループとアセットをペイロードとして参照する (遅延ロード)")
+    parser.add_argument("--usdz", action="store_true", help="アセットをUSDZにもパッケージする")
+    parser.add_argument("--reduce-samples", action="store_true",
+                        help="線形補間で再現できるタイムサンプルを間引く")
+    parser.add_argument("--sample-tolerance", action="append", default=[], metavar="CHANNEL=VALUE",
+                        help="間引きの許容誤差 (xform/camera/light/points、複数指定可)")
+    parser.add_argument("--post-workers", type=int, help="書き出し後の処理 (検証・範囲・チェックサム) のスレッド数")
+    parser.add_argument("--stage", action="store_true",
+                        help="ローカルのスクラッチに書き出してから書き出し先へ転送して公開する")
+    parser.add_argument("--scratch", help="--stage のスクラッチフォルダ (省略時はUSD_EXPORT_SCRATCHか一時フォルダ)")
+    parser.add_argument("--streams", type=int, default=4, help="--stage の転送の並列数")
+    parser.add_argument("--publish", choices=("manifest", "swap"), default="manifest",
+                        help="--stage の公開方法 (マニフェストを最後に置き換える / フォルダごと入れ替える)")
+    parser.add_argument("--dry-run", action="store_true", help="書き出し計画と見積もりを表示するだけで書き出さない")
+    parser.add_argument("--plan", help="--dry-runでは計画の保存先、それ以外では従って書き出す計画のjson")
+    parser.add_argument("--workers", type=int, default=1, help="並列ワーカー数 (mayapy)")
+    parser.add_argument("--materialx", action="store_true", help="メッシュのMaterialXライブラリも書き出す")
+    parser.add_argument("--profile", action="store_true", help="プロファイルを記録する")
+    parser.add_argument("--timings", help="起動時間の内訳を書き出すjson")
+    args = parser.parse_args(argv)
+    if not args.roots and (args.dry_run or not args.plan):
+        parser.error("--root を指定してください (--plan で書き出す場合を除く)")
+    if args.materialx and not args.roots:
+        parser.error("--materialx には --root が必要です")
+    if args.plan and not args.dry_run and args.workers > 1:
+        parser.error("計画に従った書き出しは --workers 1 のみ対応しています")
+    if args.houdini_loader == "lazy" and not args.payloads:
+        parser.error("--houdini-loader lazy には --payloads が必要です")
+    if args.profile and args.workers > 1:
+        parser.error("--profile は --workers 1 のみ対応しています (ワーカーのプロセスは計測できません)")
+    args.sample_tolerances = None
+    if args.reduce_samples or args.sample_tolerance:
+        args.sample_tolerances = {}
+        for item in args.sample_tolerance:
+            channel, _, value = item.partition("=")
+            if channel not in ("xform", "camera", "light", "points") or not value:
+                parser.error(f"--sample-tolerance の形式が正しくありません: {item}")
+            args.sample_tolerances[channel] = float(value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    timings = {}
+    last = [START_TIME]
+
+    def lap(name):
+        now = time.perf_counter()
+        timings[name] = now - last[0]
+        last[0] = now
+
+    import maya.cmds as cmds
+    # Commands only exist once Maya is initialized; inside a GUI session they already do
+    standalone = not hasattr(cmds, "ls")
+    if standalone:
+        import maya.standalone
+        maya.standalone.initialize(name="python")
+    lap("maya_initialize")
+    try:
+        cmds.loadPlugin("mayaUsdPlugin", quiet=True)
+        lap("plugin_load")
+        if args.scene:
+            cmds.file(args.scene, open=True, force=True)
+        lap("scene_open")
+
+        import My_export_USD_Mtlx_core as core
+        lap("core_import")
+
+        if args.roots:
+            cmds.select(args.roots, replace=True)
+        options = dict(export_houdini_py=args.houdini_py, houdini_loader=args.houdini_loader,
+                       frame_range=tuple(args.frames) if args.frames else None, batch_export=args.batch, file_format=args.format, layer_format=args.layer_format,
+                       detect_static=not args.keep_static_samples, clip_frames=args.clip_frames,
+                       instance_duplicates=args.instance_duplicates, use_payloads=args.payloads)
+        staging = None
+        if args.stage and not args.dry_run:
+            staging = core.StagedOutput(args.output, scratch_dir=args.scratch, streams=args.streams,
+                                        publish_mode=args.publish)
+            options["staging"] = staging
+        if args.dry_run:
+            plan = core.execution(args.output, dry_run=True, **options)
+            if plan is not None and args.plan:
+                plan.save(args.plan)
+            lap("plan")
+        elif args.workers > 1:
+            core.execution_parallel(args.output, workers=args.workers, scene=args.scene, incremental=args.incremental,
+                                    post_workers=args.post_workers, package_usdz=args.usdz,
+                                    sample_tolerances=args.sample_tolerances, **options)
+            lap("usd_export")
+        else:
+            plan = core.ExportPlan.load(args.plan) if args.plan else None
+            if args.plan and plan is None:
+                raise RuntimeError(f"書き出し計画を読み込めませんでした: {args.plan}")
+            core.execution(args.output, incremental=args.incremental, post_workers=args.post_workers,
+                           package_usdz=args.usdz, sample_tolerances=args.sample_tolerances, profile=args.profile,
+                           plan=plan, **options)
+            lap("usd_export")
+
+        if args.materialx and not args.dry_run:
+            shapes = cmds.listRelatives(args.roots, allDescendents=True, fullPath=True, type="mesh") or []
+            meshes = list(dict.fromkeys(shape.rsplit('|', 1)[0] for shape in shapes))
+            materialx_dir = os.path.join(staging.local_dir if staging else args.output, "materialx")
+            os.makedirs(materialx_dir, exist_ok=True)
+            exporter = core.MaterialXExporter(incremental=args.incremental)
+            exporter.write_library(meshes, materialx_dir)
+            exporter.finish()
+            lap("materialx_export")
+            if staging is not None:
+                # Only the material files are new since the USD publish
+                staging.publish()
+                lap("materialx_publish")
+    finally:
+        if standalone:
+            maya.standalone.uninitialize()
+
+    timings["total"] = time.perf_counter() - START_TIME
+    print("# 時間の内訳: " + "  ".join(f"{name} {seconds:.2f}秒" for name, seconds in timings.items()))
+    if args.timings:
+        with open(args.timings, "w", encoding="utf-8") as f:
+            json.dump(timings, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
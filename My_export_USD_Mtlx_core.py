@@ -0,0 +1,3332 @@
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+from pxr import Gf, Sdf, Tf, Usd, UsdGeom, UsdUtils, Vt
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+import bisect
+import collections
+import contextlib
+import glob
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    # mayapy has bundled numpy since Maya 2022; without it large arrays are not reduced
+    numpy = None
+
+
+class SceneIndex:
+    """シーン内の全シェイプを1回のlsで取得し、トランスフォームとの対応をハッシュで保持する"""
+
+    def __init__(self):
+        self.shape_types = {}
+        self.parents = {}
+        self.transform_shapes = {}
+        self.mesh_transforms = []
+        self.build()
+
+    def build(self):
+        with profile_stage("scene_index"):
+            self._build()
+
+    def _build(self):
+        listing = cmds.ls(dag=True, allPaths=True, type="shape", long=True, noIntermediate=True, showType=True) or []
+        for shape, shape_type in zip(listing[0::2], listing[1::2]):
+            transform = shape.rsplit('|', 1)[0]
+            self.shape_types[shape] = shape_type
+            self.parents[shape] = transform
+            self.transform_shapes.setdefault(transform, []).append(shape)
+
+        # Sorted long paths keep every group's descendants in one contiguous range
+        self.mesh_transforms = sorted({self.parents[shape] for shape, shape_type in self.shape_types.items()
+                                       if shape_type == "mesh"})
+
+    def shape_type(self, transform):
+        shapes = self.transform_shapes.get(transform)
+        return self.shape_types[shapes[0]] if shapes else None
+
+    def children(self, transform):
+        return self.transform_shapes.get(transform, [])
+
+    def meshes_under(self, group):
+        prefix = group + '|'
+        start = bisect.bisect_left(self.mesh_transforms, prefix)
+        end = bisect.bisect_left(self.mesh_transforms, group + '}')  # '}' sorts right after '|'
+        # A mesh transform selected directly is its own group, as with listRelatives(allDescendents)
+        i = bisect.bisect_left(self.mesh_transforms, group)
+        own = [group] if i < len(self.mesh_transforms) and self.mesh_transforms[i] == group else []
+        return own + self.mesh_transforms[start:end]
+
+
+class SceneClassifier:
+    def __init__(self, index=None):
+        self.selected = cmds.ls(selection=True)
+        self.index = index
+        self.geometry = []
+        self.lights = []
+        self.cameras = []
+
+    def classify(self):
+        with profile_stage("classify"):
+            self._classify()
+
+    def _classify(self):
+        if self.index is not None:
+            self._classify_indexed()
+            return
+
+        default_cameras = {"persp", "top", "front", "side"}
+
+        for t in self.selected:
+            if cmds.nodeType(t) != "transform":
+                continue
+        
+            shapes = cmds.listRelatives(t, shapes=True, path=True) or []
+            if not shapes:
+                continue
+        
+            shape = shapes[0]
+            shape_type = cmds.nodeType(shape)
+        
+            if shape_type == 'mesh':
+                self.geometry.append(t)
+            elif 'light' in shape_type.lower():
+                self.lights.append(t)
+            elif shape_type == 'camera':
+                cam_name = t.split('|')[-1] 
+                if cam_name not in default_cameras:
+                    self.cameras.append(t)
+
+    def _classify_indexed(self):
+        default_cameras = {"persp", "top", "front", "side"}
+
+        for t in (cmds.ls(self.selected, long=True) if self.selected else []):
+            shape_type = self.index.shape_type(t)
+            if shape_type is None:
+                continue
+
+            if shape_type == 'mesh':
+                self.geometry.append(t)
+            elif 'light' in shape_type.lower():
+                self.lights.append(t)
+            elif shape_type == 'camera':
+                if t.split('|')[-1] not in default_cameras:
+                    self.cameras.append(t)
+
+# Crate is much smaller and faster to parse for animated geometry
+DEFAULT_FORMATS = {"geo": "usdc", "light": "usda", "cam": "usda"}
+
+
+def resolve_format(kind, file_format=None):
+    return file_format or DEFAULT_FORMATS[kind]
+
+
+def frame_range_args(frame_range):
+    """frame_rangeがNoneのときはタイムサンプルを書かず、デフォルト値だけを書き出す"""
+    return {"frameRange": (frame_range[0], frame_range[1])} if frame_range else {}
+
+
+class USDExporter:
+    def __init__(self, obj_name, output_dir, file_format="usda"):
+        self.obj_name = obj_name
+        self.output_dir = output_dir
+        self.file_format = file_format
+
+    def get_export_path(self):
+        return os.path.join(self.output_dir, f"{self.obj_name}.{self.file_format}")
+
+    def export_geo(self, full_obj_path, frame_range=None):
+        export_path = self.get_export_path()
+        with profile_stage("export_geo", asset=self.obj_name, path=export_path):
+            cmds.select(full_obj_path, replace=True)
+            cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", **frame_range_args(frame_range))
+        
+        return export_path
+        
+    def export_light(self, full_obj_path, frame_range=None):
+        export_path = self.get_export_path()
+        with profile_stage("export_light", asset=self.obj_name, path=export_path):
+            cmds.select(full_obj_path, replace=True)
+            cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", **frame_range_args(frame_range))
+
+        print(f"# ライトは正常に書き出されました: {export_path}")
+        return export_path
+
+    def export_cam(self, full_obj_path, frame_range=None):
+        export_path = self.get_export_path()
+        with profile_stage("export_cam", asset=self.obj_name, path=export_path):
+            cmds.select(full_obj_path, replace=True)
+            cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", **frame_range_args(frame_range))
+
+        print(f"# カメラは正常に書き出されました: {export_path}")
+        return export_path
+
+
+# Maya light shapes and the UsdLux prim each is written as
+USD_LIGHT_TYPES = {"directionalLight": "DistantLight", "pointLight": "SphereLight",
+                   "spotLight": "SphereLight", "areaLight": "RectLight"}
+CAMERA_PLUGS = ("focalLength", "horizontalFilmAperture", "verticalFilmAperture", "horizontalFilmOffset",
+                "verticalFilmOffset", "nearClipPlane", "farClipPlane", "fStop", "focusDistance", "orthographicWidth")
+LIGHT_PLUGS = ("intensity", "colorR", "colorG", "colorB", "emitDiffuse", "emitSpecular", "useRayTraceShadows",
+               "shadColorR", "shadColorG", "shadColorB")
+LIGHT_TYPE_PLUGS = {"directionalLight": ("lightAngle",), "pointLight": ("lightRadius",),
+                    "spotLight": ("lightRadius", "coneAngle", "penumbraAngle", "dropoff"), "areaLight": ("normalize",)}
+# A Maya area light spans -1..1 in its local space; UsdLuxRectLight defaults to 1x1
+AREA_LIGHT_SIZE = 2.0
+INCH_TO_MM = 25.4
+LINEAR_UNIT_METERS = {"mm": 0.001, "cm": 0.01, "m": 1.0, "km": 1000.0, "in": 0.0254, "ft": 0.3048, "yd": 0.9144,
+                      "mi": 1609.344}
+TIME_UNIT_FPS = {"game": 15.0, "film": 24.0, "pal": 25.0, "ntsc": 30.0, "show": 48.0, "palf": 50.0, "ntscf": 60.0}
+# Bumped whenever the baked layout changes, so that manifests re-export lights and cameras
+BAKER_VERSION = 2
+# Per-channel tolerances of the time-sample reduction (scene units, mm, or light input units)
+SAMPLE_TOLERANCES = {"xform": 1e-4, "camera": 1e-3, "light": 1e-3, "points": 1e-4}
+# Without numpy, samples with more components than this cost more to compare than they save
+SAMPLE_COMPONENT_LIMIT = 3000
+POINT_ARRAY_TYPES = (Sdf.ValueTypeNames.Point3fArray, Sdf.ValueTypeNames.Vector3fArray,
+                     Sdf.ValueTypeNames.Normal3fArray, Sdf.ValueTypeNames.Float3Array)
+
+
+def sample_plugs(readers, frames=None):
+    """{キー: 値を読む関数}を全フレームについて1回の走査で評価し、{キー: [フレームごとの値]}を返す
+
+    各フレームはMDGContextをカレントにして評価するので、タイムスライダーは動かさない。framesがなければ現在の値だけ読む。
+    """
+    samples = {key: [] for key in readers}
+    if not frames:
+        for key, read in readers.items():
+            samples[key].append(read())
+        return samples
+    unit = om.MTime.uiUnit()
+    for frame in frames:
+        previous = om.MDGContext(om.MTime(frame, unit)).makeCurrent()
+        try:
+            for key, read in readers.items():
+                samples[key].append(read())
+        finally:
+            previous.makeCurrent()
+    return samples
+
+
+def _plug_reader(plug):
+    return plug.asDouble
+
+
+def _matrix_reader(plug):
+    def read():
+        matrix = om.MFnMatrixData(plug.asMObject()).matrix()
+        return tuple(matrix.getElement(row, col) for row in range(4) for col in range(4))
+    return read
+
+
+def _node_readers(node):
+    """トランスフォームのワールド行列とシェイプの属性を読む関数を返す"""
+    dag = om.MSelectionList().add(node).getDagPath(0)
+    transform = om.MFnDependencyNode(dag.node())
+    readers = {"worldMatrix": _matrix_reader(transform.findPlug("worldMatrix", False).elementByLogicalIndex(0))}
+    shape = om.MFnDependencyNode(om.MDagPath(dag).extendToShape().node())
+    if shape.typeName == "camera":
+        names = CAMERA_PLUGS
+    else:
+        names = LIGHT_PLUGS + LIGHT_TYPE_PLUGS.get(shape.typeName, ())
+    for name in names:
+        readers[name] = _plug_reader(shape.findPlug(name, False))
+    return shape, readers
+
+
+def camera_values(raw, orthographic):
+    """サンプルしたMayaの属性をUsdGeomCameraの属性に変換する (アパーチャはインチからmm)"""
+    values = {
+        "focalLength": (Sdf.ValueTypeNames.Float, raw["focalLength"]),
+        "horizontalApertureOffset": (Sdf.ValueTypeNames.Float, raw["horizontalFilmOffset"] * INCH_TO_MM),
+        "verticalApertureOffset": (Sdf.ValueTypeNames.Float, raw["verticalFilmOffset"] * INCH_TO_MM),
+        "clippingRange": (Sdf.ValueTypeNames.Float2, Gf.Vec2f(raw["nearClipPlane"], raw["farClipPlane"])),
+        "fStop": (Sdf.ValueTypeNames.Float, raw["fStop"]),
+        "focusDistance": (Sdf.ValueTypeNames.Float, raw["focusDistance"]),
+    }
+    if orthographic:
+        # Orthographic width is in centimeters; USD apertures are in tenths of a scene unit
+        width = raw["orthographicWidth"] * 10.0
+        height = width * raw["verticalFilmAperture"] / raw["horizontalFilmAperture"]
+    else:
+        width = raw["horizontalFilmAperture"] * INCH_TO_MM
+        height = raw["verticalFilmAperture"] * INCH_TO_MM
+    values["horizontalAperture"] = (Sdf.ValueTypeNames.Float, width)
+    values["verticalAperture"] = (Sdf.ValueTypeNames.Float, height)
+    return values
+
+
+def light_values(raw, light_type):
+    """サンプルしたMayaの属性をUsdLuxの属性に変換する (mayaUSDExportと同じ属性を書く)"""
+    values = {
+        "inputs:intensity": (Sdf.ValueTypeNames.Float, raw["intensity"]),
+        "inputs:color": (Sdf.ValueTypeNames.Color3f, Gf.Vec3f(raw["colorR"], raw["colorG"], raw["colorB"])),
+        "inputs:diffuse": (Sdf.ValueTypeNames.Float, 1.0 if raw["emitDiffuse"] else 0.0),
+        "inputs:specular": (Sdf.ValueTypeNames.Float, 1.0 if raw["emitSpecular"] else 0.0),
+        "inputs:shadow:enable": (Sdf.ValueTypeNames.Bool, bool(raw["useRayTraceShadows"])),
+        "inputs:shadow:color": (Sdf.ValueTypeNames.Color3f,
+                                Gf.Vec3f(raw["shadColorR"], raw["shadColorG"], raw["shadColorB"])),
+    }
+    if light_type == "directionalLight":
+        values["inputs:angle"] = (Sdf.ValueTypeNames.Float, raw["lightAngle"])
+    elif light_type in ("pointLight", "spotLight"):
+        values["inputs:radius"] = (Sdf.ValueTypeNames.Float, raw["lightRadius"])
+        values["treatAsPoint"] = (Sdf.ValueTypeNames.Bool, raw["lightRadius"] == 0.0)
+    elif light_type == "areaLight":
+        values["inputs:width"] = (Sdf.ValueTypeNames.Float, AREA_LIGHT_SIZE)
+        values["inputs:height"] = (Sdf.ValueTypeNames.Float, AREA_LIGHT_SIZE)
+        values["inputs:normalize"] = (Sdf.ValueTypeNames.Bool, bool(raw["normalize"]))
+    if light_type == "spotLight":
+        # A positive penumbra widens the cone, a negative one fades inside it; softness is the faded fraction
+        cone = math.degrees(raw["coneAngle"]) / 2.0
+        penumbra = math.degrees(raw["penumbraAngle"])
+        angle = cone + max(penumbra, 0.0)
+        values["inputs:shaping:cone:angle"] = (Sdf.ValueTypeNames.Float, angle)
+        values["inputs:shaping:cone:softness"] = (Sdf.ValueTypeNames.Float,
+                                                  min(abs(penumbra) / angle, 1.0) if angle else 0.0)
+        values["inputs:shaping:focus"] = (Sdf.ValueTypeNames.Float, raw["dropoff"])
+    return values
+
+
+def _author_channel(layer, prim, name, value_type, samples, frames):
+    attr = Sdf.AttributeSpec(prim, name, value_type)
+    if not frames or all(value == samples[0] for value in samples[1:]):
+        attr.default = samples[0]
+        return
+    for frame, value in zip(frames, samples):
+        layer.SetTimeSample(attr.path, frame, value)
+
+
+def stage_metadata():
+    """mayaUSDExportと同じupAxis・metersPerUnit・timeCodesPerSecondを返す"""
+    unit = cmds.currentUnit(q=True, linear=True)
+    time_unit = cmds.currentUnit(q=True, time=True)
+    match = re.match(r"([\d.]+)fps$", time_unit)
+    fps = float(match.group(1)) if match else TIME_UNIT_FPS.get(time_unit, 24.0)
+    return {"upAxis": cmds.upAxis(q=True, axis=True).upper(), "metersPerUnit": LINEAR_UNIT_METERS.get(unit, 0.01),
+            "timeCodesPerSecond": fps, "framesPerSecond": fps}
+
+
+def can_bake(node, kind):
+    """カメラと、USD_LIGHT_TYPESにあるライトだけを直接ベイクできる"""
+    if kind == "cam":
+        return True
+    shapes = cmds.listRelatives(node, shapes=True, fullPath=True) or []
+    return bool(shapes) and cmds.nodeType(shapes[0]) in USD_LIGHT_TYPES
+
+
+def bake_cameras_lights(nodes, output_dir, node_ranges, file_format="usda"):
+    """カメラとライトをmayaUSDExportを使わずにベイクし、{ノード: (名前, パス)}を返す
+
+    全ノードの行列と属性をフレームごとに1回の走査でサンプルし、UsdGeomCamera / UsdLuxのプリムを
+    /<名前> に直接書く。combine_cam / combine_lightが参照するレイアウトと同じ。
+    フレームレンジがNoneのノード (静的と判定されたもの) は現在の値だけを書く。
+    """
+    frames_by_range = collections.defaultdict(list)
+    for node in nodes:
+        frames_by_range[node_ranges.get(node)].append(node)
+    metadata = stage_metadata()
+
+    results = {}
+    for frame_range, range_nodes in frames_by_range.items():
+        frames = list(range(math.floor(frame_range[0]), math.ceil(frame_range[1]) + 1)) if frame_range else None
+        shapes = {}
+        node_keys = {}
+        readers = {}
+        for node in range_nodes:
+            shapes[node], node_readers = _node_readers(node)
+            node_keys[node] = list(node_readers)
+            readers.update({(node, key): read for key, read in node_readers.items()})
+        samples = sample_plugs(readers, frames)
+
+        for node in range_nodes:
+            name = node.split('|')[-1]
+            export_path = USDExporter(name, output_dir, file_format).get_export_path()
+            shape = shapes[node]
+            kind = "cam" if shape.typeName == "camera" else "light"
+            with profile_stage(f"bake_{kind}", asset=name, path=export_path):
+                layer = Sdf.Layer.CreateAnonymous(f".{file_format}")
+                for key, value in metadata.items():
+                    layer.pseudoRoot.SetInfo(key, value)
+                if frames:
+                    layer.startTimeCode, layer.endTimeCode = frames[0], frames[-1]
+                prim_name = Tf.MakeValidIdentifier(name)
+                prim = Sdf.PrimSpec(layer, prim_name, Sdf.SpecifierDef)
+                layer.defaultPrim = prim_name
+
+                per_frame = [{key: samples[(node, key)][i] for key in node_keys[node]}
+                             for i in range(len(frames or [None]))]
+                if kind == "cam":
+                    prim.typeName = "Camera"
+                    orthographic = shape.findPlug("orthographic", False).asBool()
+                    projection = Sdf.AttributeSpec(prim, "projection", Sdf.ValueTypeNames.Token,
+                                                   variability=Sdf.VariabilityUniform)
+                    projection.default = "orthographic" if orthographic else "perspective"
+                    converted = [camera_values(raw, orthographic) for raw in per_frame]
+                else:
+                    prim.typeName = USD_LIGHT_TYPES[shape.typeName]
+                    converted = [light_values(raw, shape.typeName) for raw in per_frame]
+                    schemas = ["ShadowAPI"] + (["ShapingAPI"] if shape.typeName == "spotLight" else [])
+                    prim.SetInfo("apiSchemas", Sdf.TokenListOp.Create(prependedItems=schemas))
+
+                for attr_name, (value_type, _) in converted[0].items():
+                    _author_channel(layer, prim, attr_name, value_type,
+                                    [values[attr_name][1] for values in converted], frames)
+                _author_channel(layer, prim, "xformOp:transform", Sdf.ValueTypeNames.Matrix4d,
+                                [Gf.Matrix4d(*raw["worldMatrix"]) for raw in per_frame], frames)
+                order = Sdf.AttributeSpec(prim, "xformOpOrder", Sdf.ValueTypeNames.TokenArray,
+                                          variability=Sdf.VariabilityUniform)
+                order.default = ["xformOp:transform"]
+                layer.Export(export_path)
+
+            label = "カメラ" if kind == "cam" else "ライト"
+            print(f"# {label}は正常に書き出されました: {export_path}")
+            results[node] = (name, export_path)
+    return results
+
+
+LAYER_METADATA_KEYS = (
+    "upAxis", "metersPerUnit", "startTimeCode", "endTimeCode",
+    "timeCodesPerSecond", "framesPerSecond", "doc"
+)
+
+
+def dag_to_prim_path(dag_path):
+    """mayaUSDExportが書き出すプリムパスをDAGパスから求める"""
+    names = [Tf.MakeValidIdentifier(n.replace(":", "_")) for n in dag_path.split('|') if n]
+    return Sdf.Path("/" + "/".join(names))
+
+
+def extract_prim_layer(src_layer, prim_path):
+    """バッチレイヤーから1つのプリムと祖先だけを持つレイヤーを切り出す"""
+    dst_layer = Sdf.Layer.CreateAnonymous(".usda")
+    for key in LAYER_METADATA_KEYS:
+        if src_layer.pseudoRoot.HasInfo(key):
+            dst_layer.pseudoRoot.SetInfo(key, src_layer.pseudoRoot.GetInfo(key))
+
+    # Ancestors keep their own xform ops but no other children
+    for ancestor in prim_path.GetPrefixes()[:-1]:
+        src_spec = src_layer.GetPrimAtPath(ancestor)
+        dst_spec = Sdf.CreatePrimInLayer(dst_layer, ancestor)
+        dst_spec.specifier = src_spec.specifier
+        dst_spec.typeName = src_spec.typeName
+        for prop in src_spec.properties:
+            Sdf.CopySpec(src_layer, prop.path, dst_layer, prop.path)
+
+    Sdf.CopySpec(src_layer, prim_path, dst_layer, prim_path)
+    dst_layer.defaultPrim = prim_path.GetPrefixes()[0].name
+    return dst_layer
+
+
+def export_geo_batch(mesh_transforms, output_dir, frame_range=None, file_format="usda"):
+    """グループ内の全メッシュを1回のmayaUSDExportで書き出し、メッシュごとのファイルに分割する
+
+    まとめたファイルはローカルの一時フォルダに書き、書き出し先には分割したファイルだけを置く。
+    """
+    # Local temp, so that the intermediate never lands on (or is left behind on) the share
+    batch_dir = tempfile.mkdtemp(prefix="usd_batch_")
+    batch_path = os.path.join(batch_dir, "_batch_geo.usdc")
+    try:
+        with profile_stage("export_geo_batch", path=batch_path):
+            cmds.select(mesh_transforms, replace=True)
+            cmds.mayaUSDExport(file=batch_path, selection=True, shadingMode="none", **frame_range_args(frame_range))
+        exported_files = _split_batch_layer(batch_path, mesh_transforms, output_dir, frame_range, file_format)
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+    print(f"# {len(exported_files)}個のメッシュをまとめて書き出しました: {output_dir}")
+    return exported_files
+
+
+def _split_batch_layer(batch_path, mesh_transforms, output_dir, frame_range, file_format):
+    src_layer = Sdf.Layer.OpenAsAnonymous(batch_path)
+    exported_files = []
+    try:
+        for mesh in mesh_transforms:
+            mesh_name = mesh.split('|')[-1]
+            prim_path = dag_to_prim_path(mesh)
+            if not src_layer.GetPrimAtPath(prim_path):
+                # Fall back to a single export when the prim name could not be resolved
+                exporter = USDExporter(mesh_name, output_dir, file_format)
+                exported_files.append((mesh_name, exporter.export_geo(mesh, frame_range=frame_range)))
+                continue
+            export_path = USDExporter(mesh_name, output_dir, file_format).get_export_path()
+            with profile_stage("split_batch", asset=mesh_name, path=export_path):
+                extract_prim_layer(src_layer, prim_path).Export(export_path)
+            exported_files.append((mesh_name, export_path))
+    finally:
+        # The layer memory-maps the .usdc on Windows, which blocks removing it; a traceback would keep it alive
+        del src_layer
+    return exported_files
+
+
+def export_group_meshes(mesh_transforms, output_dir, frame_range=None, batch_export=False, file_format="usda"):
+    if batch_export:
+        return export_geo_batch(mesh_transforms, output_dir, frame_range=frame_range, file_format=file_format)
+
+    exported_files = []
+    for mesh in mesh_transforms:
+        mesh_name = mesh.split('|')[-1]
+        exporter = USDExporter(mesh_name, output_dir, file_format)
+        file_path = exporter.export_geo(mesh, frame_range=frame_range)
+        # exporter.write_materialx_usd(mesh)
+        exported_files.append((mesh_name, file_path))
+    return exported_files
+
+
+def clip_chunks(frame_range, clip_frames):
+    """フレームレンジをclip_framesごとに分割する。各チャンクは次のチャンクの先頭フレームまで含め、境界でも補間できるようにする"""
+    start, end = frame_range
+    chunks = []
+    chunk_start = start
+    while True:
+        chunk_end = min(chunk_start + clip_frames, end)
+        chunks.append((chunk_start, chunk_end))
+        if chunk_end >= end:
+            return chunks
+        chunk_start = chunk_end
+
+
+def export_geo_clips(mesh_transforms, output_dir, frame_range, clip_frames, batch_export=False, file_format="usda",
+                     clip_window=None):
+    """アニメーションするメッシュをフレームチャンクごとのクリップに書き出し、バリュークリップで束ねる
+
+    メッシュごとのファイルはクリップのメタデータとトポロジーレイヤーだけを持ち、
+    読み込み時には現在のフレームを含むチャンクだけが開かれる。
+    clip_windowを指定すると、その範囲に重なるチャンク (と存在しないチャンク) だけを書き出し直す。
+    """
+    clip_files = {mesh: [] for mesh in mesh_transforms}
+    for start, end in clip_chunks(frame_range, clip_frames):
+        # Named by frames, so chunks from another clip length or frame range are never reused
+        chunk_dir = os.path.join(output_dir, "clips", f"{start:g}_{end:g}")
+        chunk_files = [USDExporter(mesh.split('|')[-1], chunk_dir, "usdc").get_export_path() for mesh in mesh_transforms]
+        in_window = clip_window is None or (start <= clip_window[1] and end >= clip_window[0])
+        if in_window or not all(os.path.exists(path) for path in chunk_files):
+            os.makedirs(chunk_dir, exist_ok=True)
+            export_group_meshes(mesh_transforms, chunk_dir, frame_range=(start, end), batch_export=batch_export,
+                                file_format="usdc")
+        for mesh, path in zip(mesh_transforms, chunk_files):
+            clip_files[mesh].append(path)
+
+    exported_files = []
+    for mesh in mesh_transforms:
+        mesh_name = mesh.split('|')[-1]
+        export_path = USDExporter(mesh_name, output_dir, file_format).get_export_path()
+        layer = Sdf.Layer.FindOrOpen(export_path) if os.path.exists(export_path) else Sdf.Layer.CreateNew(export_path)
+        layer.Clear()
+        root = dag_to_prim_path(mesh).GetPrefixes()[0]
+        with profile_stage("stitch_clips", asset=mesh_name, path=export_path):
+            UsdUtils.StitchClips(layer, clip_files[mesh], root)
+            layer.defaultPrim = root.name
+            layer.Save()
+        exported_files.append((mesh_name, export_path))
+
+    print(f"# {len(exported_files)}個のメッシュを{clip_frames}フレームごとのクリップで書き出しました: {output_dir}")
+    return exported_files
+
+
+def write_combine_usd(
+    file_info_list,
+    output_dir,
+    combine_filename="combine_geo.usda",
+    root_name="Root",
+    kind="geo",
+    add_prim_path=False,
+    instances=None,
+    use_payloads=False):
+    """参照をまとめたレイヤーをSdfで作成する。形式はファイルの拡張子 (.usda / .usdc) で決まる
+
+    instancesに含まれる名前はinstanceableな参照になり、値が行列ならそのトランスフォームを持つ。
+    ジオメトリは参照先の範囲をextentsHintとして各プリムに書き、その和をルートに書く。
+    use_payloadsのときはペイロードにする。グループをまとめるレイヤー (kind="scene") には
+    アンロードの間だけ見える範囲のプロキシも書く。
+    """
+    instances = instances or {}
+    layer = Sdf.Layer.CreateAnonymous(".usda")
+    root_name = Tf.MakeValidIdentifier(root_name)
+    root = Sdf.PrimSpec(layer, root_name, Sdf.SpecifierDef, "Xform")
+    layer.defaultPrim = root_name
+    root_bounds = Gf.Range3d()
+
+    for name, path in file_info_list:
+        rel_path = path if add_prim_path else os.path.basename(path)
+        prim_name = Tf.MakeValidIdentifier(name)
+
+        prim = Sdf.PrimSpec(root, prim_name, Sdf.SpecifierDef)
+        prim.SetInfo("kind", "component")
+        target = Sdf.Path(f"/{prim_name}") if add_prim_path else Sdf.Path()
+        if use_payloads:
+            prim.payloadList.Prepend(Sdf.Payload(f"./{rel_path}", target))
+        else:
+            prim.referenceList.Prepend(Sdf.Reference(f"./{rel_path}", target))
+
+        if kind in ("geo", "scene"):
+            bounds, placed = asset_bounds(os.path.join(output_dir, rel_path))
+            if not bounds.IsEmpty():
+                # The hint (and proxy) sit outside the arc, so they are there while a payload is unloaded
+                if use_payloads:
+                    # Unloaded payloads contribute no type, and untyped prims are not imageable
+                    prim.typeName = "Xform"
+                    if kind == "scene":
+                        author_bounds_proxy(prim, bounds)
+                    else:
+                        author_extents_hint(prim, bounds)
+                else:
+                    author_extents_hint(prim, bounds)
+                if instances.get(name) is not None:
+                    placed = Gf.BBox3d(bounds, Gf.Matrix4d(*instances[name])).ComputeAlignedRange()
+                root_bounds.UnionWith(placed)
+
+        if name in instances:
+            prim.SetInfo("instanceable", True)
+            if instances[name] is not None:
+                prim.typeName = "Xform"
+                op = Sdf.AttributeSpec(prim, "xformOp:transform", Sdf.ValueTypeNames.Matrix4d)
+                op.default = Gf.Matrix4d(*instances[name])
+                order = Sdf.AttributeSpec(prim, "xformOpOrder", Sdf.ValueTypeNames.TokenArray, variability=Sdf.VariabilityUniform)
+                order.default = ["xformOp:transform"]
+
+    if use_payloads and kind == "geo":
+        # Only arrives with the loaded payload, so the group's proxy hides once the real meshes are there
+        hide_proxy = Sdf.PrimSpec(root, BOUNDS_PROXY_NAME, Sdf.SpecifierOver)
+        visibility = Sdf.AttributeSpec(hide_proxy, "visibility", Sdf.ValueTypeNames.Token)
+        visibility.default = "invisible"
+
+    if not root_bounds.IsEmpty():
+        author_extents_hint(root, root_bounds)
+        # The root carries no transform, so both ranges are the same
+        layer.customLayerData = {"bounds": {"root": range_to_array(root_bounds), "world": range_to_array(root_bounds)}}
+
+    combine_path = os.path.join(output_dir, combine_filename)
+    with profile_stage("write_combine", path=combine_path):
+        layer.Export(combine_path)
+
+    print(f"コンバインUSDは正常に書き出されました: {combine_path}")
+    return combine_path
+
+def range_to_array(bounds):
+    return Vt.Vec3dArray([bounds.GetMin(), bounds.GetMax()])
+
+
+def array_to_range(values):
+    return Gf.Range3d(Gf.Vec3d(values[0]), Gf.Vec3d(values[1]))
+
+
+def compute_asset_bounds(stage, mesh_prim_path=None, frame_range=None):
+    """フレームレンジ全体での範囲を求める。root: defaultPrimの座標系 (extentsHint用)、world: ステージ全体、
+    local: メッシュ自身の座標系"""
+    root = stage.GetDefaultPrim()
+    mesh_prim = stage.GetPrimAtPath(mesh_prim_path) if mesh_prim_path else None
+    if frame_range:
+        times = [Usd.TimeCode(frame) for frame in range(math.floor(frame_range[0]), math.ceil(frame_range[1]) + 1)]
+    else:
+        times = [Usd.TimeCode.EarliestTime()]
+
+    cache = UsdGeom.BBoxCache(times[0], [UsdGeom.Tokens.default_, UsdGeom.Tokens.render])
+    bounds = {"root": Gf.Range3d(), "world": Gf.Range3d(), "local": Gf.Range3d()}
+    for time_code in times:
+        cache.SetTime(time_code)
+        bounds["root"].UnionWith(cache.ComputeUntransformedBound(root).ComputeAlignedRange())
+        bounds["world"].UnionWith(cache.ComputeWorldBound(root).ComputeAlignedRange())
+        if mesh_prim:
+            bounds["local"].UnionWith(cache.ComputeUntransformedBound(mesh_prim).ComputeAlignedRange())
+    return bounds
+
+
+def author_asset_bounds(stage, node=None, frame_range=None):
+    """書き出したアセットの範囲を求め、ルートのextentsHintとcustomLayerDataに書く (保存は呼び出し側)
+
+    アニメーションするアセットはフレームレンジ全体の範囲になる。コンバインUSDはcustomLayerDataだけを読む。
+    """
+    bounds = compute_asset_bounds(stage, dag_to_prim_path(node) if node else None, frame_range)
+    if bounds["root"].IsEmpty():
+        return None
+
+    layer = stage.GetRootLayer()
+    author_extents_hint(Sdf.CreatePrimInLayer(layer, stage.GetDefaultPrim().GetPath()), bounds["root"])
+    data = dict(layer.customLayerData)
+    data["bounds"] = {key: range_to_array(value) for key, value in bounds.items() if not value.IsEmpty()}
+    layer.customLayerData = data
+    return bounds
+
+
+def asset_bounds(path):
+    """参照先の (defaultPrimの座標系での範囲, ステージ上の範囲) を返す
+
+    書き出し時にcustomLayerDataへ記録した範囲をレイヤーのメタデータだけ読んで返すので、ジオメトリは開かない。
+    記録がない古いファイルはステージを開いて先頭フレームで計算する。
+    """
+    if not os.path.exists(path):
+        return Gf.Range3d(), Gf.Range3d()
+    header = Sdf.Layer.OpenAsAnonymous(path, metadataOnly=True)
+    recorded = header.customLayerData.get("bounds") if header else None
+    if recorded and "root" in recorded:
+        return array_to_range(recorded["root"]), array_to_range(recorded.get("world", recorded["root"]))
+
+    stage = Usd.Stage.Open(path)
+    if not stage.GetDefaultPrim():
+        return Gf.Range3d(), Gf.Range3d()
+    bounds = compute_asset_bounds(stage)
+    return bounds["root"], bounds["world"]
+
+
+def author_extents_hint(prim, bounds):
+    hint = prim.attributes.get("extentsHint") or Sdf.AttributeSpec(prim, "extentsHint", Sdf.ValueTypeNames.Float3Array)
+    hint.default = [Gf.Vec3f(bounds.GetMin()), Gf.Vec3f(bounds.GetMax())]
+
+
+# Child prim of a payload prim holding its wireframe proxy
+BOUNDS_PROXY_NAME = "bounds_proxy"
+# Corner indices of the 12 box edges, for the wireframe proxy
+BOX_EDGES = ((0, 1), (1, 3), (3, 2), (2, 0), (4, 5), (5, 7), (7, 6), (6, 4), (0, 4), (1, 5), (2, 6), (3, 7))
+
+
+def author_bounds_proxy(prim, bounds):
+    """extentsHintと、proxy用途のワイヤーフレームの箱を書く
+
+    箱の表示はペイロード側のレイヤーがinvisibleで上書きするので、箱が見えるのはアンロードの間だけ。
+    """
+    author_extents_hint(prim, bounds)
+    corners = [Gf.Vec3f(bounds.GetCorner(i)) for i in range(8)]
+
+    proxy = Sdf.PrimSpec(prim, BOUNDS_PROXY_NAME, Sdf.SpecifierDef, "BasisCurves")
+    purpose = Sdf.AttributeSpec(proxy, "purpose", Sdf.ValueTypeNames.Token, variability=Sdf.VariabilityUniform)
+    purpose.default = "proxy"
+    curve_type = Sdf.AttributeSpec(proxy, "type", Sdf.ValueTypeNames.Token, variability=Sdf.VariabilityUniform)
+    curve_type.default = "linear"
+    counts = Sdf.AttributeSpec(proxy, "curveVertexCounts", Sdf.ValueTypeNames.IntArray)
+    counts.default = [2] * len(BOX_EDGES)
+    points = Sdf.AttributeSpec(proxy, "points", Sdf.ValueTypeNames.Point3fArray)
+    points.default = [corners[i] for edge in BOX_EDGES for i in edge]
+    extent = Sdf.AttributeSpec(proxy, "extent", Sdf.ValueTypeNames.Float3Array)
+    extent.default = [Gf.Vec3f(bounds.GetMin()), Gf.Vec3f(bounds.GetMax())]
+
+
+def write_houdini_loader_script(
+    geo_combine_list,
+    output_dir,
+    script_name="create_loader.py",
+    stage_path="/stage",
+    mode="chain",
+    layer_files=None,
+    extra_prims=(),
+    publish_dir=None):
+    """Houdini用のローダースクリプトを書き出す
+
+    mode="chain"はグループごとのsublayerを連結する。"single"/"lazy"はlayer_files (geo_combineと
+    ライト・カメラのコンバイン) を1つのsublayerで読み込み、グループごとのロード/ポピュレーションを
+    Configure Stageで切り替えられるようにする。"lazy"では初期状態でグループのペイロードを読み込まない。
+    スクリプトに埋め込むパスはpublish_dir (ステージングの公開先) を優先する。
+    """
+    if mode == "chain":
+        lines = chained_loader_lines(geo_combine_list, publish_dir or output_dir, stage_path)
+    else:
+        lines = single_loader_lines(geo_combine_list, publish_dir or output_dir, stage_path, layer_files or [],
+                                    extra_prims=extra_prims, lazy=(mode == "lazy"))
+
+    script_path = os.path.join(output_dir, script_name)
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+
+    print(f"Houdini loader script written to: {script_path}")
+
+
+def chained_loader_lines(geo_combine_list, output_dir, stage_path):
+    lines = [
+        "import hou",
+        "",
+        "def create_loader():",
+        f'    stage = hou.node("{stage_path}")',
+        ""
+    ]
+    
+    prev_node_var = None
+    for i, (name, usd_path) in enumerate(geo_combine_list, start=1):
+        node_var = f"node{i}"
+        lines.append(f'    {node_var} = stage.createNode("sublayer", node_name="{name}_sublayer")')
+        lines.append(f'    {node_var}.parm("filepath1").set("{output_dir}'+"/"+f'{usd_path}")')
+        
+        if prev_node_var is not None:
+            lines.append(f'    {node_var}.setInput(0, {prev_node_var})')
+        prev_node_var = node_var
+
+    lines.append(f'    {prev_node_var}.setDisplayFlag(True)')
+    lines.append("    stage.layoutChildren()")
+    lines.append('create_loader()')
+    return lines
+
+
+def single_loader_lines(geo_combine_list, output_dir, stage_path, layer_files, extra_prims=(), lazy=False):
+    groups = ",\n".join(f'    "{Tf.MakeValidIdentifier(name)}": {{"populate": True, "load": {not lazy}}}'
+                         for name, _ in geo_combine_list)
+    export_dir = output_dir.replace("\\", "/")
+    return [
+        "import os",
+        "import hou",
+        "",
+        "# Layers are resolved from this script's folder, so the export folder can be moved",
+        f'EXPORT_DIR = "{export_dir}"',
+        "ROOT_DIR = os.path.dirname(os.path.abspath(__file__)) if \"__file__\" in globals() else EXPORT_DIR",
+        f"LAYERS = {list(layer_files)!r}",
+        f"EXTRA_PRIMS = {list(extra_prims)!r}",
+        "# populate: compose the group at all / load: load its payloads",
+        "GROUPS = {",
+        groups,
+        "}",
+        "",
+        "",
+        "def set_parm(node, names, value):",
+        "    # Parameter names differ between Houdini versions",
+        "    for name in names:",
+        "        parm = node.parm(name)",
+        "        if parm is not None:",
+        "            parm.set(value)",
+        "            return True",
+        "    print(f\"Warning: {node.path()} has none of {names}\")",
+        "    return False",
+        "",
+        "",
+        "def create_loader():",
+        f'    stage = hou.node("{stage_path}")',
+        '    layers = stage.createNode("sublayer", node_name="scene_sublayer")',
+        '    layers.parm("num_files").set(len(LAYERS))',
+        "    for i, rel_path in enumerate(LAYERS, start=1):",
+        '        layers.parm(f"filepath{i}").set(os.path.join(ROOT_DIR, rel_path).replace("\\\\", "/"))',
+        "",
+        '    configure = stage.createNode("configurestage", node_name="group_masks")',
+        "    configure.setInput(0, layers)",
+        "    populated = [name for name, mask in GROUPS.items() if mask[\"populate\"]]",
+        "    if len(populated) < len(GROUPS):",
+        '        set_parm(configure, ("setpopulationmask", "populationmask_enable"), True)',
+        '        paths = [f"/Root/{name}" for name in populated + EXTRA_PRIMS]',
+        '        set_parm(configure, ("populationmask", "populationpattern"), " ".join(paths))',
+        "    loaded = [name for name, mask in GROUPS.items() if mask[\"populate\"] and mask[\"load\"]]",
+        "    if len(loaded) < len(GROUPS):",
+        '        set_parm(configure, ("setloadmask", "loadmask_enable"), True)',
+        '        set_parm(configure, ("loadpaths", "loadmask"), " ".join(f"/Root/{name}" for name in loaded))',
+        "",
+        "    configure.setDisplayFlag(True)",
+        "    stage.layoutChildren()",
+        "    return configure",
+        "",
+        "",
+        "create_loader()",
+        "",
+    ]
+
+
+EXPORT_OPTIONS = {"shadingMode": "none"}
+# Batch mode exports this many meshes per mayaUSDExport call, so progress and cancel still work within a group
+BATCH_STEP_MESHES = 16
+
+
+class ExportManifest:
+    """出力フォルダに書き出し済みアセットの指紋を記録し、変更のないアセットを判定する"""
+    filename = "export_manifest.json"
+    version = 1
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.filename)
+        self.assets = {}
+        self.combines = {}
+        self.load()
+
+    def _key(self, path):
+        return os.path.relpath(path, self.output_dir).replace("\\", "/")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"# Warning: マニフェストを読み込めませんでした: {e}")
+            return
+        if data.get("version") != self.version:
+            return
+        self.assets = data.get("assets", {})
+        self.combines = data.get("combines", {})
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "assets": self.assets, "combines": self.combines},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, export_path, fingerprint):
+        return self.assets.get(self._key(export_path)) == fingerprint and os.path.exists(export_path)
+
+    def record(self, export_path, fingerprint):
+        self.assets[self._key(export_path)] = fingerprint
+
+    def combine_is_current(self, combine_path, signature):
+        return self.combines.get(self._key(combine_path)) == signature and os.path.exists(combine_path)
+
+    def record_combine(self, combine_path, signature):
+        self.combines[self._key(combine_path)] = signature
+
+    def member_fingerprints(self, paths):
+        keys = [self._key(path) for path in paths]
+        return [self.assets.get(key) or self.combines.get(key) for key in keys]
+
+
+def _hash_mesh(hasher, shape):
+    sel = om.MSelectionList()
+    sel.add(shape)
+    fn_mesh = om.MFnMesh(sel.getDagPath(0))
+    counts, indices = fn_mesh.getVertices()
+    hasher.update(array("i", counts).tobytes())
+    hasher.update(array("i", indices).tobytes())
+    points = fn_mesh.getPoints(om.MSpace.kObject)
+    hasher.update(array("d", [c for p in points for c in (p.x, p.y, p.z)]).tobytes())
+    us, vs = fn_mesh.getUVs()
+    hasher.update(array("f", us).tobytes())
+    hasher.update(array("f", vs).tobytes())
+
+
+def _hash_attributes(hasher, node, frame=None):
+    attrs = set(cmds.listAttr(node, keyable=True) or []) | set(cmds.listAttr(node, channelBox=True) or [])
+    at_frame = {"time": frame} if frame is not None else {}
+    for attr in sorted(attrs):
+        try:
+            value = cmds.getAttr(f"{node}.{attr}", **at_frame)
+        except (RuntimeError, ValueError):
+            continue
+        hasher.update(f"{attr}={value!r};".encode("utf-8"))
+
+
+def _hash_animation(hasher, node, shapes):
+    # Animated ancestors end up in the per-asset file as parent xforms
+    parts = node.split('|')
+    ancestors = ['|'.join(parts[:i]) for i in range(2, len(parts))]
+    curves = set(cmds.listConnections([node] + ancestors, source=True, destination=False, type="animCurve") or [])
+    # cmds.ls() with an empty list would match every node in the scene
+    history = (cmds.listHistory(shapes) or []) if shapes else []
+    expressions = []
+    if history:
+        curves.update(cmds.ls(history, type="animCurve") or [])
+        expressions = cmds.ls(history, type="expression") or []
+
+    for curve in sorted(curves):
+        keys = cmds.keyframe(curve, q=True, timeChange=True, valueChange=True) or []
+        in_angles = cmds.keyTangent(curve, q=True, inAngle=True) or []
+        out_angles = cmds.keyTangent(curve, q=True, outAngle=True) or []
+        hasher.update(f"{curve}={keys!r}{in_angles!r}{out_angles!r};".encode("utf-8"))
+    for expr in sorted(expressions):
+        hasher.update(cmds.expression(expr, q=True, string=True).encode("utf-8"))
+
+
+def fingerprint_asset(node, kind, frame_range=None, options=None):
+    """トポロジー・ポイント・トランスフォーム・アニメーション・フレームレンジ・書き出し設定から指紋を計算する"""
+    with profile_stage("fingerprint", asset=node.split('|')[-1]):
+        return _fingerprint_asset(node, kind, frame_range, options)
+
+
+def _fingerprint_asset(node, kind, frame_range, options):
+    hasher = hashlib.sha1()
+    settings = sorted((options or EXPORT_OPTIONS).items())
+    hasher.update(repr((kind, tuple(frame_range or ()), settings)).encode("utf-8"))
+
+    # Animated values are read at the first frame, so moving the time slider keeps the fingerprint;
+    # changes within the range are covered by the curves and expressions hashed below
+    frame = frame_range[0] if frame_range else None
+    previous = om.MDGContext(om.MTime(frame, om.MTime.uiUnit())).makeCurrent() if frame is not None else None
+    try:
+        transform = om.MFnDependencyNode(om.MSelectionList().add(node).getDependNode(0))
+        world_matrix = _matrix_reader(transform.findPlug("worldMatrix", False).elementByLogicalIndex(0))
+        hasher.update(array("d", world_matrix()).tobytes())
+        _hash_attributes(hasher, node, frame)
+
+        shapes = cmds.listRelatives(node, shapes=True, fullPath=True) or []
+        for shape in shapes:
+            if cmds.nodeType(shape) == "mesh":
+                _hash_mesh(hasher, shape)
+            else:
+                _hash_attributes(hasher, shape, frame)
+    finally:
+        if previous is not None:
+            previous.makeCurrent()
+    _hash_animation(hasher, node, shapes)
+    return hasher.hexdigest()
+
+
+TIME_DEPENDENT_TYPES = {
+    om.MFn.kAnimCurveTimeToAngular, om.MFn.kAnimCurveTimeToDistance,
+    om.MFn.kAnimCurveTimeToUnitless, om.MFn.kAnimCurveTimeToTime, om.MFn.kTime
+}
+
+
+class AnimationDetector:
+    """上流のDGに時間で変化するノードがあるかで、アセットがフレームレンジ内で変化するかを判定する
+
+    キーアニメーション・デフォーマー・コンストレイント・エクスプレッション・シミュレーションは
+    いずれも時間カーブかtime1に行き着くため、上流をたどるだけで検出できる。
+    """
+
+    def __init__(self):
+        self.cache = {}
+
+    def _time_dependent(self, path):
+        if path not in self.cache:
+            sel = om.MSelectionList()
+            sel.add(path)
+            it = om.MItDependencyGraph(sel.getDependNode(0), om.MFn.kInvalid, om.MItDependencyGraph.kUpstream,
+                                       om.MItDependencyGraph.kDepthFirst, om.MItDependencyGraph.kNodeLevel)
+            found = False
+            while not it.isDone():
+                if it.currentNode().apiType() in TIME_DEPENDENT_TYPES:
+                    found = True
+                    break
+                it.next()
+            self.cache[path] = found
+        return self.cache[path]
+
+    def is_animated(self, node):
+        # Parent xforms are written into every per-asset file, so they count too
+        parts = node.split('|')
+        ancestors = ['|'.join(parts[:i]) for i in range(2, len(parts))]
+        shapes = cmds.listRelatives(node, shapes=True, fullPath=True) or []
+        return any(self._time_dependent(path) for path in ancestors + [node] + shapes)
+
+
+def find_duplicate_meshes(mesh_transforms, detector):
+    """同じトポロジー・ポイント・UVを持つ静的なメッシュを探し、{コピー: プロトタイプ}を返す
+
+    Mayaのインスタンスはシェイプが同じUUIDになるため、ハッシュは1回だけ計算する。
+    """
+    hashes_by_uuid = {}
+    members = {}
+    for mesh in mesh_transforms:
+        shapes = cmds.listRelatives(mesh, shapes=True, fullPath=True, noIntermediate=True) or []
+        # Child transforms are written into the same file, so such meshes are not shareable
+        if len(shapes) != 1 or cmds.listRelatives(mesh, children=True, type="transform"):
+            continue
+        if detector.is_animated(mesh):
+            continue
+        uuid = cmds.ls(shapes[0], uuid=True)[0]
+        if uuid not in hashes_by_uuid:
+            hasher = hashlib.sha1()
+            _hash_mesh(hasher, shapes[0])
+            hashes_by_uuid[uuid] = hasher.hexdigest()
+        members.setdefault(hashes_by_uuid[uuid], []).append(mesh)
+
+    duplicates = {}
+    for meshes in members.values():
+        for copy in meshes[1:]:
+            duplicates[copy] = meshes[0]
+    return duplicates
+
+
+def instance_offset(prototype, copy):
+    """プロトタイプのファイルを参照したときにコピーの位置になる行列 (USDの行ベクトル表記)
+
+    参照先のルートプリム (最上位の祖先) のトランスフォームはこの行列で置き換わるため、それも含める。
+    """
+    root = '|' + prototype.split('|')[1]
+    root_matrix = om.MMatrix(cmds.xform(root, q=True, matrix=True, worldSpace=True))
+    prototype_matrix = om.MMatrix(cmds.xform(prototype, q=True, matrix=True, worldSpace=True))
+    copy_matrix = om.MMatrix(cmds.xform(copy, q=True, matrix=True, worldSpace=True))
+    offset = root_matrix * prototype_matrix.inverse() * copy_matrix
+    return [offset.getElement(row, col) for row in range(4) for col in range(4)]
+
+
+def resolve_instances(mesh_transforms, duplicates, exported):
+    """exportedは{メッシュ: (名前, パス)}。コピーはプロトタイプのファイルを参照させ、コンバインUSD用のinstancesを作る"""
+    prototypes = set(duplicates.values())
+    file_info_list = []
+    instances = {}
+    for mesh in mesh_transforms:
+        name = mesh.split('|')[-1]
+        if mesh in duplicates:
+            prototype = duplicates[mesh]
+            file_info_list.append((name, exported[prototype][1]))
+            instances[name] = instance_offset(prototype, mesh)
+        else:
+            file_info_list.append(exported[mesh])
+            if mesh in prototypes:
+                instances[name] = None
+    return file_info_list, instances
+
+
+def validate_stage(stage):
+    """書き出したアセットの問題点のリストを返す"""
+    root = stage.GetDefaultPrim()
+    if not root:
+        return ["defaultPrimがありません"]
+    issues = []
+    for prim in Usd.PrimRange(root):
+        if prim.IsA(UsdGeom.Mesh):
+            mesh = UsdGeom.Mesh(prim)
+            if not mesh.GetPointsAttr().HasValue():
+                issues.append(f"{prim.GetPath()}: pointsがありません")
+            if not mesh.GetFaceVertexCountsAttr().HasValue():
+                issues.append(f"{prim.GetPath()}: faceVertexCountsがありません")
+    return issues
+
+
+def sample_channel(spec):
+    """属性をSAMPLE_TOLERANCESのどの種類で間引くかを返す。間引かない属性はNone"""
+    name = spec.name
+    if spec.typeName in (Sdf.ValueTypeNames.Quatf, Sdf.ValueTypeNames.Quatd, Sdf.ValueTypeNames.Quath):
+        # Quaternions are slerped, so a linear check does not apply
+        return None
+    if name.startswith("xformOp:"):
+        return "xform"
+    owner = spec.owner.typeName
+    if owner == "Camera":
+        return "camera"
+    if name.startswith("inputs:") or owner.endswith("Light"):
+        return "light"
+    if spec.typeName in POINT_ARRAY_TYPES and name != "extent":
+        return "points"
+    return None
+
+
+def _components(value):
+    if isinstance(value, (bool, int, float)):
+        yield float(value)
+        return
+    if isinstance(value, str):
+        raise TypeError(value)
+    # Vectors, matrix rows and Vt arrays are all sequences of numbers or of vectors
+    for item in value:
+        yield from _components(item)
+
+
+def sample_vector(value):
+    """値を比較用の数値の配列にする (numpyがあればVt配列をコピーせずに見る)。数値でない値はNone"""
+    if numpy is None:
+        try:
+            return array("d", _components(value))
+        except TypeError:
+            return None
+    try:
+        vector = numpy.atleast_1d(numpy.asarray(value))
+        return vector if vector.dtype.kind in "iuf" else vector.astype(numpy.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def sample_size(value):
+    """値の成分の数。間引くかどうかを決めるのに使う"""
+    if isinstance(value, (bool, int, float, str)) or not len(value):
+        return 1
+    return len(value) * sample_size(value[0])
+
+
+def lerp_error(start, sample, end, t):
+    """startとendをtで線形補間した値とsampleの最大の差"""
+    if not len(start) == len(sample) == len(end):
+        # Topology changes can never be interpolated
+        return math.inf
+    if numpy is not None:
+        return float(numpy.abs(sample - (start + (end - start) * t)).max(initial=0.0))
+    return max((abs(y - (x + (z - x) * t)) for x, y, z in zip(start, sample, end)), default=0.0)
+
+
+def reduce_samples(times, vectors, tolerance):
+    """線形補間で許容誤差内に再現できないサンプルだけを残す (Douglas-Peucker)
+
+    両端と誤差が最大のサンプルを再帰的に残すので、保持されたキーや不連続な変化はそのまま残る。
+    戻り値は(残すインデックスのリスト, 消したサンプルの最大誤差)。
+    """
+    keep = {0, len(times) - 1}
+    max_error = 0.0
+    segments = [(0, len(times) - 1)]
+    while segments:
+        first, last = segments.pop()
+        worst, worst_index = -1.0, None
+        span = times[last] - times[first]
+        for i in range(first + 1, last):
+            error = lerp_error(vectors[first], vectors[i], vectors[last], (times[i] - times[first]) / span)
+            if error > worst:
+                worst, worst_index = error, i
+        if worst_index is None:
+            continue
+        if worst > tolerance:
+            keep.add(worst_index)
+            segments += [(first, worst_index), (worst_index, last)]
+        else:
+            max_error = max(max_error, worst)
+    return sorted(keep), max_error
+
+
+def reduce_time_samples(layer, tolerances=None):
+    """レイヤー内のアニメーション属性のタイムサンプルを種類ごとの許容誤差で間引く
+
+    戻り値は{種類: {"attributes", "before", "after", "max_error", "skipped"}}。変更はSave()しない。
+    numpyがない場合、SAMPLE_COMPONENT_LIMITより大きい値の属性は間引かずにskippedに数える。
+    """
+    tolerances = dict(SAMPLE_TOLERANCES, **(tolerances or {}))
+    paths = []
+    layer.Traverse(Sdf.Path.absoluteRootPath,
+                   lambda path: paths.append(path) if path.IsPropertyPath() and layer.GetNumTimeSamplesForPath(path) > 2 else None)
+    stats = {}
+    for path in paths:
+        spec = layer.GetAttributeAtPath(path)
+        channel = sample_channel(spec) if spec else None
+        if channel not in tolerances:
+            continue
+        times = layer.ListTimeSamplesForPath(path)
+        entry = stats.setdefault(channel, {"attributes": 0, "before": 0, "after": 0, "max_error": 0.0, "skipped": 0})
+        if numpy is None and sample_size(layer.QueryTimeSample(path, times[0])) > SAMPLE_COMPONENT_LIMIT:
+            entry["skipped"] += 1
+            continue
+        vectors = [sample_vector(layer.QueryTimeSample(path, time)) for time in times]
+        if any(vector is None for vector in vectors):
+            continue
+        keep, max_error = reduce_samples(times, vectors, tolerances[channel])
+        for i in set(range(len(times))) - set(keep):
+            layer.EraseTimeSample(path, times[i])
+
+        entry["attributes"] += 1
+        entry["before"] += len(times)
+        entry["after"] += len(keep)
+        entry["max_error"] = max(entry["max_error"], max_error)
+    return stats
+
+
+def merge_sample_stats(results):
+    total = {}
+    for result in results:
+        for channel, entry in (result.get("samples") or {}).items():
+            merged = total.setdefault(channel, {"attributes": 0, "before": 0, "after": 0, "max_error": 0.0, "skipped": 0})
+            for key in ("attributes", "before", "after", "skipped"):
+                merged[key] += entry.get(key, 0)
+            merged["max_error"] = max(merged["max_error"], entry["max_error"])
+    return total
+
+
+def report_sample_reduction(results):
+    for channel, entry in sorted(merge_sample_stats(results).items()):
+        if entry["attributes"]:
+            print(f"# タイムサンプルを間引きました [{channel}]: {entry['attributes']}個の属性 "
+                  f"{entry['before']} -> {entry['after']} (最大誤差 {entry['max_error']:.3g})")
+        if entry["skipped"]:
+            print(f"# Warning: numpyがないため、大きな配列の{entry['skipped']}個の属性 [{channel}] は間引きませんでした")
+
+
+def file_checksum(path):
+    hasher = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def postprocess_asset(export_path, kind, node=None, frame_range=None, manifest=None, fingerprint=None,
+                      checksum=False, package_usdz=False, sample_tolerances=None):
+    """書き出し後のCPUだけの処理: 検証・タイムサンプルの間引き・範囲・チェックサム・USDZ・マニフェストへの記録
+
+    Mayaに触れないので、PostProcessPipelineで次のアセットの書き出しと並行して実行できる。
+    検証で問題が見つかったアセットはマニフェストに記録せず、次回も書き出し直す。
+    """
+    name = os.path.splitext(os.path.basename(export_path))[0]
+    result = {"path": export_path, "issues": [], "checksum": None, "samples": None}
+    layer = Sdf.Layer.FindOrOpen(export_path)
+    # The file was just rewritten by Maya, so a cached layer would be stale
+    layer.Reload()
+    stage = Usd.Stage.Open(layer)
+    with profile_stage("validate", asset=name):
+        result["issues"] = validate_stage(stage)
+    if result["issues"]:
+        return result
+
+    modified = False
+    if sample_tolerances is not None and frame_range:
+        with profile_stage("reduce_samples", asset=name):
+            result["samples"] = reduce_time_samples(layer, sample_tolerances)
+        modified = any(entry["attributes"] for entry in result["samples"].values())
+    if kind == "geo":
+        with profile_stage("bounds", asset=name, path=export_path):
+            modified = author_asset_bounds(stage, node, frame_range) is not None or modified
+    if modified:
+        layer.Save()
+    if checksum:
+        with profile_stage("checksum", asset=name):
+            result["checksum"] = file_checksum(export_path)
+    if package_usdz:
+        usdz_path = os.path.splitext(export_path)[0] + ".usdz"
+        with profile_stage("usdz", asset=name, path=usdz_path):
+            UsdUtils.CreateNewUsdzPackage(Sdf.AssetPath(export_path), usdz_path)
+    if manifest is not None and fingerprint is not None:
+        manifest.record(export_path, fingerprint)
+    return result
+
+
+def export_assets(nodes, output_dir, kind, frame_range=None, manifest=None, batch_export=False, file_format=None,
+                  detector=None, clip_frames=None, clip_window=None, post=None, sample_tolerances=None):
+    """マニフェストと指紋が一致するアセットを除いて書き出し、(名前, パス)のリストを返す
+
+    detectorを渡すと、フレームレンジ内で変化しないアセットはタイムサンプルなしで書き出す。
+    clip_framesを渡すと、アニメーションするメッシュはバリュークリップとして書き出す。
+    postを渡すと、書き出し後の処理をそのPostProcessPipelineに渡す。渡さなければその場で実行する。
+    sample_tolerancesを渡すと、書き出したタイムサンプルをその許容誤差で間引く ({}ならSAMPLE_TOLERANCES)。
+    """
+    file_format = resolve_format(kind, file_format)
+    # Ranges decoded from JSON (worker jobs, saved plans) arrive as lists, and the baker uses them as keys
+    frame_range = tuple(frame_range) if frame_range else None
+    clip_frames = clip_frames if kind == "geo" else None
+    # A window run rewrites only some chunks, so it must not pass for (or be skipped as) a full clip export
+    clip_window = tuple(clip_window) if clip_window and clip_frames else None
+    options = dict(EXPORT_OPTIONS, format=file_format, static_detection=detector is not None,
+                   clip_frames=clip_frames, clip_window=clip_window, baker=BAKER_VERSION if kind != "geo" else None,
+                   sample_tolerances=sorted(sample_tolerances.items()) if sample_tolerances is not None else None)
+    exported = {}
+    fingerprints = {}
+    pending = []
+    for node in nodes:
+        name = node.split('|')[-1]
+        if manifest is not None:
+            export_path = USDExporter(name, output_dir, file_format).get_export_path()
+            fingerprints[node] = fingerprint_asset(node, kind, frame_range, options)
+            if manifest.is_current(export_path, fingerprints[node]):
+                exported[node] = (name, export_path)
+                continue
+        pending.append(node)
+
+    node_ranges = {node: frame_range for node in pending}
+    if detector is not None and frame_range:
+        for node in pending:
+            if not detector.is_animated(node):
+                node_ranges[node] = None
+        static_count = sum(1 for r in node_ranges.values() if r is None)
+        if static_count:
+            print(f"# {static_count}/{len(pending)}個のアセットは静的なためタイムサンプルなしで書き出します: {output_dir}")
+
+    results = {}
+    if kind == "geo":
+        # Static and animated meshes go through separate (batch) exports
+        static = [node for node in pending if node_ranges[node] is None]
+        animated = [node for node in pending if node_ranges[node] is not None]
+        for chunk, export_range in ((static, None), (animated, frame_range)):
+            if not chunk:
+                continue
+            if export_range and clip_frames:
+                exported_files = export_geo_clips(chunk, output_dir, export_range, clip_frames,
+                                                  batch_export=batch_export, file_format=file_format,
+                                                  clip_window=clip_window)
+            else:
+                exported_files = export_group_meshes(chunk, output_dir, frame_range=export_range,
+                                                     batch_export=batch_export, file_format=file_format)
+            results.update(zip(chunk, exported_files))
+    elif pending:
+        # Known lights and cameras are sampled together in one pass over the frame range
+        baked = [node for node in pending if can_bake(node, kind)]
+        if baked:
+            results.update(bake_cameras_lights(baked, output_dir, node_ranges, file_format=file_format))
+        # Other light types (e.g. aiSkyDomeLight) keep mayaUSDExport's translation
+        for node in pending:
+            if node not in results:
+                name = node.split('|')[-1]
+                exporter = USDExporter(name, output_dir, file_format)
+                export = exporter.export_light if kind == "light" else exporter.export_cam
+                results[node] = (name, export(node, frame_range=node_ranges[node]))
+
+    inline_results = []
+    for node in pending:
+        name, export_path = results[node]
+        exported[node] = (name, export_path)
+        if post is not None:
+            post.submit(export_path, kind, node=node, frame_range=node_ranges[node], manifest=manifest,
+                        fingerprint=fingerprints.get(node), sample_tolerances=sample_tolerances)
+        else:
+            inline_results.append(postprocess_asset(export_path, kind, node=node, frame_range=node_ranges[node],
+                                                    manifest=manifest, fingerprint=fingerprints.get(node),
+                                                    sample_tolerances=sample_tolerances))
+    report_issues(inline_results)
+    report_sample_reduction(inline_results)
+
+    if manifest is not None and len(pending) < len(nodes):
+        print(f"# 変更のない{len(nodes) - len(pending)}個のアセットをスキップしました: {output_dir}")
+    return [exported[node] for node in nodes]
+
+
+def write_combine_usd_if_changed(manifest, file_info_list, output_dir, **kwargs):
+    combine_path = os.path.join(output_dir, kwargs.get("combine_filename", "combine_geo.usda"))
+    if manifest is None:
+        return write_combine_usd(file_info_list, output_dir, **kwargs)
+
+    members = None
+    if kwargs.get("kind", "geo") in ("geo", "scene"):
+        # Bounds are read from the members, so their content is part of the signature
+        members = manifest.member_fingerprints([os.path.join(output_dir, path) for _, path in file_info_list])
+    signature = hashlib.sha1(repr((list(file_info_list), sorted(kwargs.items()), members)).encode("utf-8")).hexdigest()
+    if manifest.combine_is_current(combine_path, signature):
+        print(f"コンバインUSDのメンバーに変更がないためスキップしました: {combine_path}")
+        return combine_path
+
+    write_combine_usd(file_info_list, output_dir, **kwargs)
+    manifest.record_combine(combine_path, signature)
+    return combine_path
+
+
+def collect_mesh_transforms(group, index=None):
+    if index is not None:
+        return index.meshes_under(group)
+    shapes = cmds.listRelatives(group, allDescendents=True, fullPath=True, type="mesh") or []
+    return list(dict.fromkeys(shape.rsplit('|', 1)[0] for shape in shapes))
+
+
+def export_group(group, output_dir, frame_range=None, manifest=None, batch_export=False, index=None,
+                 file_format=None, layer_format="usda", detector=None, clip_frames=None, clip_window=None,
+                 instance_duplicates=False, use_payloads=False, post=None, sample_tolerances=None):
+    """グループ内のメッシュとグループのコンバインUSDを書き出し、(グループ名, 相対パス)を返す
+
+    postを渡すと後処理をそのPostProcessPipelineで行い、コンバインUSDはその完了を待って書き出す。
+    """
+    group_name = group.split('|')[-1]
+    mesh_transforms = collect_mesh_transforms(group, index=index)
+
+    if not mesh_transforms:
+        print(f"[{group_name}] にメッシュが見つかりませんでした。スキップします。")
+        return None
+
+    group_output_dir = os.path.join(output_dir, group_name)
+    os.makedirs(group_output_dir, exist_ok=True)
+
+    duplicates = find_duplicate_meshes(mesh_transforms, detector or AnimationDetector()) if instance_duplicates else {}
+    unique_meshes = [mesh for mesh in mesh_transforms if mesh not in duplicates]
+
+    # Write each mesh
+    exported_files = export_assets(unique_meshes, group_output_dir, "geo", frame_range=frame_range,
+                                   manifest=manifest, batch_export=batch_export, file_format=file_format,
+                                   detector=detector, clip_frames=clip_frames, clip_window=clip_window, post=post,
+                                   sample_tolerances=sample_tolerances)
+    exported_files, instances = resolve_instances(mesh_transforms, duplicates, dict(zip(unique_meshes, exported_files)))
+    if post is not None:
+        # Bounds and manifest entries of the members are read by the combine
+        post.wait()
+
+    combine_name = f"{group_name}_combine.{layer_format}"
+    write_combine_usd_if_changed(manifest, exported_files, group_output_dir, combine_filename=combine_name, root_name=group_name,
+                                 instances=instances, use_payloads=use_payloads)
+    return (group_name, f"{group_name}/{combine_name}")
+
+
+def classify_selection(index=None):
+    classifier_all = SceneClassifier(index=index)
+    classifier_all.selected = cmds.ls(selection=True, type="transform")
+    classifier_all.classify()
+    return classifier_all
+
+
+ASSET_FOLDERS = {"light": "Lights", "cam": "Cameras"}
+
+
+def write_scene_layers(output_dir, geo_combine_list, light_exported, cam_exported, export_houdini_py=False, manifest=None,
+                       layer_format="usda", use_payloads=False, houdini_loader="chain", publish_dir=None):
+    """ライト・カメラ・全体のコンバインUSDとHoudini用スクリプトを書き出す"""
+    # Light
+    if light_exported:
+        rel_light_exported = []
+        for name, abs_path in light_exported:
+            rel_path = os.path.relpath(abs_path, output_dir).replace("\\", "/")
+            rel_light_exported.append((name, rel_path))
+
+        write_combine_usd_if_changed(
+            manifest,
+            rel_light_exported,
+            output_dir,
+            combine_filename=f"combine_light.{layer_format}",
+            root_name="Root",
+            kind="light",
+            add_prim_path=True
+        )
+    # Camera
+    if cam_exported:
+        rel_cam_exported = []
+        for name, abs_path in cam_exported:
+            rel_path = os.path.relpath(abs_path, output_dir).replace("\\", "/")
+            rel_cam_exported.append((name, rel_path))
+
+        write_combine_usd_if_changed(
+            manifest,
+            rel_cam_exported,
+            output_dir,
+            combine_filename=f"combine_cam.{layer_format}",
+            root_name="Root",
+            kind="cam",
+            add_prim_path=True
+        )
+
+    # All geo combine USD
+    if geo_combine_list:
+        write_combine_usd_if_changed(
+            manifest,
+            geo_combine_list,
+            output_dir,
+            combine_filename=f"geo_combine.{layer_format}",
+            root_name="Root",
+            kind="scene",
+            add_prim_path=True,
+            use_payloads=use_payloads
+        )
+        
+    # python  
+    if geo_combine_list and export_houdini_py:
+        if houdini_loader == "lazy" and not use_payloads:
+            print("# Warning: ペイロードなしでは遅延ロードできないため、lazyローダーはsingleと同じ動作になります。")
+        layer_files = [f"geo_combine.{layer_format}"]
+        layer_files += [f"combine_light.{layer_format}"] if light_exported else []
+        layer_files += [f"combine_cam.{layer_format}"] if cam_exported else []
+        write_houdini_loader_script(
+            geo_combine_list,
+            output_dir,
+            script_name="houdini_loader.py",
+            stage_path="/stage",
+            mode=houdini_loader,
+            layer_files=layer_files,
+            extra_prims=[Tf.MakeValidIdentifier(name) for name, _ in light_exported + cam_exported],
+            publish_dir=publish_dir
+        )
+
+
+_active_profiler = None
+
+
+@contextlib.contextmanager
+def profile_stage(name, asset=None, path=None):
+    """プロファイラーが有効なときだけステージの時間を記録する"""
+    profiler = _active_profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name, asset=asset, path=path):
+        yield
+
+
+class _CountingCmds:
+    """maya.cmdsへの呼び出しをコマンドごとに数えるプロキシ"""
+
+    def __init__(self, module, counter):
+        self._module = module
+        self._counter = counter
+
+    def __getattr__(self, name):
+        func = getattr(self._module, name)
+        counter = self._counter
+
+        def counted(*args, **kwargs):
+            counter[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+
+def peak_memory_bytes():
+    try:
+        import resource
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ExportProfiler:
+    """入れ子のステージ時間・アセットごとの時間・cmdsの呼び出し回数・書き込みバイト数・ピークメモリを記録する
+
+    activate()している間はこのモジュールのcmdsを数えるプロキシに差し替える。
+    """
+    report_filename = "export_profile.json"
+    trace_filename = "export_profile_trace.json"
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.events = []
+        self.cmds_calls = collections.Counter()
+        self.bytes_written = 0
+        self.local = threading.local()
+
+    def activate(self):
+        global _active_profiler, cmds
+        _active_profiler = self
+        if not isinstance(cmds, _CountingCmds):
+            cmds = _CountingCmds(cmds, self.cmds_calls)
+        return self
+
+    def restore_cmds(self):
+        global cmds
+        if isinstance(cmds, _CountingCmds):
+            cmds = cmds._module
+
+    def deactivate(self):
+        global _active_profiler
+        self.restore_cmds()
+        if _active_profiler is self:
+            _active_profiler = None
+
+    @contextlib.contextmanager
+    def stage(self, name, asset=None, path=None):
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.local.depth = depth
+            size = os.path.getsize(path) if path and os.path.isfile(path) else 0
+            self.bytes_written += size
+            self.events.append({"name": name, "asset": asset, "start": start - self.start_time,
+                                "seconds": end - start, "depth": depth, "thread": threading.get_ident(),
+                                "bytes": size})
+
+    def stage_totals(self):
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event["name"], {"count": 0, "seconds": 0.0, "bytes": 0})
+            total["count"] += 1
+            total["seconds"] += event["seconds"]
+            total["bytes"] += event["bytes"]
+        return totals
+
+    def slowest_assets(self, count=10):
+        durations = {}
+        for event in self.events:
+            if event["asset"]:
+                durations[event["asset"]] = durations.get(event["asset"], 0.0) + event["seconds"]
+        return sorted(durations.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def summary(self, count=5):
+        lines = [f"合計 {time.perf_counter() - self.start_time:.2f}秒  cmds {sum(self.cmds_calls.values())}回  "
+                 f"書き込み {self.bytes_written / 1e6:.1f}MB"]
+        peak = peak_memory_bytes()
+        if peak:
+            lines[0] += f"  ピークメモリ {peak / 1e6:.0f}MB"
+        slowest = self.slowest_assets(count)
+        if slowest:
+            lines.append("遅いアセット: " + ", ".join(f"{name} {seconds:.2f}秒" for name, seconds in slowest))
+        return "\n".join(lines)
+
+    def report(self):
+        return {
+            "wall_seconds": time.perf_counter() - self.start_time,
+            "stages": self.stage_totals(),
+            "slowest_assets": self.slowest_assets(),
+            "cmds_calls": dict(self.cmds_calls.most_common()),
+            "bytes_written": self.bytes_written,
+            "peak_memory_bytes": peak_memory_bytes(),
+        }
+
+    def trace(self):
+        """chrome://tracing や Perfetto で開けるトレースイベント"""
+        pid = os.getpid()
+        events = []
+        for event in self.events:
+            args = {"bytes": event["bytes"]}
+            if event["asset"]:
+                args["asset"] = event["asset"]
+            events.append({"name": event["name"], "cat": "export", "ph": "X", "pid": pid, "tid": event["thread"],
+                           "ts": event["start"] * 1e6, "dur": event["seconds"] * 1e6, "args": args})
+        return {"traceEvents": sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+
+    def write_report(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        report_path = os.path.join(output_dir, self.report_filename)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+        with open(os.path.join(output_dir, self.trace_filename), "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f)
+        print(f"# プロファイルを書き出しました: {report_path}")
+        return report_path
+
+
+def report_issues(results):
+    for result in results:
+        for issue in result["issues"]:
+            print(f"# Warning: 検証で問題が見つかりました: {result['path']}: {issue}")
+
+
+CHECKSUM_FILENAME = "checksums.sha1"
+
+
+def write_checksums(output_dir, checksums):
+    """sha1sum形式のチェックサムファイルに{パス: ダイジェスト}を追記・更新する"""
+    path = os.path.join(output_dir, CHECKSUM_FILENAME)
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                digest, _, rel_path = line.rstrip("\n").partition("  ")
+                if rel_path:
+                    entries[rel_path] = digest
+    for file_path, digest in checksums.items():
+        entries[os.path.relpath(file_path, output_dir).replace("\\", "/")] = digest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{digest}  {rel_path}\n" for rel_path, digest in sorted(entries.items()))
+    os.replace(tmp_path, path)
+    return path
+
+
+class PostProcessPipeline:
+    """書き出したアセットの後処理 (postprocess_asset) をスレッドプールで実行する
+
+    submit()は処理中のアセットがmax_pending個を超えるとMaya側を待たせ、溜まる量を抑える。
+    workers=0ではsubmit()の中でそのまま実行する (比較用の逐次処理)。
+    """
+
+    def __init__(self, workers=None, max_pending=None, checksum=True, package_usdz=False):
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.slots = threading.BoundedSemaphore(max_pending or max(self.workers, 1) * 2)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers else None
+        self.checksum = checksum
+        self.package_usdz = package_usdz
+        self.futures = []
+
+    def submit(self, export_path, kind, **kwargs):
+        if self.pool is None:
+            future = Future()
+            try:
+                future.set_result(postprocess_asset(export_path, kind, checksum=self.checksum,
+                                                    package_usdz=self.package_usdz, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self.futures.append(future)
+            return future
+
+        # Back-pressure: block the producer until a slot frees up
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(postprocess_asset, export_path, kind, checksum=self.checksum,
+                                      package_usdz=self.package_usdz, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        return future
+
+    def pending(self):
+        return list(self.futures)
+
+    def wait(self, futures=None):
+        """futures (省略時はこれまでの全て) の完了を待ち、結果を返す。処理中の例外はここで送出される"""
+        return [future.result() for future in (self.futures if futures is None else futures)]
+
+    def join(self, output_dir=None):
+        """全ての後処理を待ってプールを閉じ、チェックサムを書き出す"""
+        results = self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+        report_issues(results)
+        report_sample_reduction(results)
+        checksums = {result["path"]: result["checksum"] for result in results if result["checksum"]}
+        if output_dir and checksums:
+            write_checksums(output_dir, checksums)
+        return results
+
+
+class SceneSnapshot:
+    """書き出し計画のためのシーンの写し。構成・メッシュの規模・アニメーションの有無を一度だけ調べて保持する
+
+    同じシーンで計画を立て直すときは保持した値を使うので、ドライランでシーンを走査し直さない。
+    構成が変わらない編集には、forget_mesh_sizes()とforget_animation()で該当する値だけを捨てる。
+    """
+
+    def __init__(self, index=None):
+        self.index = index or SceneIndex()
+        self.detector = AnimationDetector()
+        self.scene_name = cmds.file(q=True, sceneName=True)
+        self.mesh_sizes = {}
+        self.animated = {}
+
+    def is_current(self):
+        return cmds.file(q=True, sceneName=True) == self.scene_name
+
+    def mesh_size(self, node):
+        """(頂点数, フェース頂点数, UV数)"""
+        if node not in self.mesh_sizes:
+            shapes = [shape for shape in self.index.children(node) if self.index.shape_types[shape] == "mesh"]
+            sel = om.MSelectionList()
+            sel.add(shapes[0])
+            fn_mesh = om.MFnMesh(sel.getDagPath(0))
+            self.mesh_sizes[node] = (fn_mesh.numVertices, fn_mesh.numFaceVertices, fn_mesh.numUVs())
+        return self.mesh_sizes[node]
+
+    def is_animated(self, node):
+        if node not in self.animated:
+            self.animated[node] = self.detector.is_animated(node)
+        return self.animated[node]
+
+    def forget_mesh_sizes(self):
+        # Topology edits without history (delete faces, smooth) send no event, and reading sizes is cheap
+        self.mesh_sizes = {}
+
+    def forget_animation(self):
+        """接続が変わった (キーやデフォーマーの追加・削除) ときに、アニメーションの有無を調べ直す"""
+        self.animated = {}
+        self.detector = AnimationDetector()
+
+
+PLAN_FILENAME = "export_plan.json"
+# Rough costs of the dry-run estimate, rescaled by the last full run recorded in the same folder
+PLAN_BYTES = {"asset": 2048, "point": 12, "face_vertex": 4, "uv": 8, "xform_sample": 128, "value_sample": 16}
+PLAN_SECONDS = {"asset": 0.02, "sample": 0.0005, "byte": 2e-8}
+# Animated channels besides the transform that the baker writes per light or camera
+PLAN_CHANNELS = {"light": 4, "cam": 8}
+
+
+def frame_count(frame_range):
+    return int(math.floor(frame_range[1] - frame_range[0])) + 1 if frame_range else 0
+
+
+def estimate_asset(kind, frames, animated, mesh_size=None):
+    """1アセットの(タイムサンプル数, バイト数)の見積もり"""
+    if kind == "geo":
+        points, face_vertices, uvs = mesh_size
+        static_bytes = (PLAN_BYTES["asset"] + points * PLAN_BYTES["point"] + face_vertices * PLAN_BYTES["face_vertex"]
+                        + uvs * PLAN_BYTES["uv"])
+        if not animated:
+            return 0, static_bytes
+        return 2 * frames, static_bytes + frames * (points * PLAN_BYTES["point"] + PLAN_BYTES["xform_sample"])
+    if not animated:
+        return 0, PLAN_BYTES["asset"]
+    channels = PLAN_CHANNELS[kind]
+    return (channels + 1) * frames, PLAN_BYTES["asset"] + frames * (PLAN_BYTES["xform_sample"]
+                                                                   + channels * PLAN_BYTES["value_sample"])
+
+
+def find_collisions(assets):
+    """同じパスに書き出される複数のノードを{パス: [ノード]}で返す"""
+    nodes_by_path = {}
+    for asset in assets:
+        nodes_by_path.setdefault(asset["path"], []).append(asset["node"])
+    return {path: nodes for path, nodes in nodes_by_path.items() if len(nodes) > 1}
+
+
+class ExportPlan:
+    """何をどこへ書き出すかの計画。JSONに保存でき、ExportJobと並列書き出しはこの計画に従って書き出す
+
+    assetsの要素は{node, name, kind, group, path, animated, samples, bytes}で、pathはoutput_dirからの相対パス。
+    animatedがNoneのアセットは判定を後回しにしたもので、動くものとして見積もり、is_animated()で初めて判定する。
+    書き出し先で最後に記録した実測値 (measured) があれば、見積もりをその比率で補正する。
+    """
+
+    def __init__(self, output_dir, groups=(), assets=(), frame_range=None, file_format=None, detect_static=False,
+                 calibration=None, measured=None, snapshot=None):
+        self.output_dir = output_dir
+        self.groups = list(groups)
+        self.assets = [dict(asset) for asset in assets]
+        self.frame_range = tuple(frame_range) if frame_range else None
+        self.file_format = file_format
+        self.detect_static = detect_static
+        self.calibration = calibration
+        self.measured = measured
+        self.collisions = find_collisions(self.assets)
+        self.by_node = {(asset["kind"], asset["node"]): asset for asset in self.assets}
+        # Not saved; resolves the deferred animation checks
+        self.snapshot = snapshot
+
+    @classmethod
+    def build(cls, output_dir, groups, lights=(), cameras=(), frame_range=None, file_format=None,
+              detect_static=False, snapshot=None, defer_detection=False):
+        """defer_detectionでは上流のDGをたどるアニメーションの判定を、書き出しのステップで行うよう後回しにする"""
+        snapshot = snapshot or SceneSnapshot()
+        frames = frame_count(frame_range)
+        deferred = detect_static and bool(frame_range) and defer_detection
+        assets = []
+
+        def add(node, kind, group, folder):
+            name = node.split('|')[-1]
+            if deferred:
+                animated = None
+            else:
+                animated = bool(frame_range) and (not detect_static or snapshot.is_animated(node))
+            samples, size = estimate_asset(kind, frames, animated is not False,
+                                           snapshot.mesh_size(node) if kind == "geo" else None)
+            assets.append({"node": node, "name": name, "kind": kind, "group": group,
+                           "path": f"{folder}/{name}.{resolve_format(kind, file_format)}",
+                           "animated": animated, "samples": samples, "bytes": size})
+
+        with profile_stage("plan"):
+            for group in groups:
+                for node in snapshot.index.meshes_under(group):
+                    add(node, "geo", group, group.split('|')[-1])
+            for kind, nodes in (("light", lights), ("cam", cameras)):
+                for node in nodes:
+                    add(node, kind, None, ASSET_FOLDERS[kind])
+        previous = cls.load(os.path.join(output_dir, PLAN_FILENAME)) if output_dir else None
+        return cls(output_dir, groups, assets, frame_range=frame_range, file_format=file_format,
+                   detect_static=detect_static, calibration=previous.measured if previous else None,
+                   snapshot=snapshot)
+
+    def nodes(self, kind):
+        return [asset["node"] for asset in self.assets if asset["kind"] == kind]
+
+    def group_meshes(self):
+        meshes = {group: [] for group in self.groups}
+        for asset in self.assets:
+            if asset["kind"] == "geo":
+                meshes[asset["group"]].append(asset["node"])
+        return list(meshes.items())
+
+    def is_animated(self, node):
+        """AnimationDetectorの代わりに計画の判定を返す。計画にないノードは動くものとして扱う"""
+        for kind in ("geo", "light", "cam"):
+            asset = self.by_node.get((kind, node))
+            if asset is not None:
+                if asset["animated"] is None:
+                    self._detect(asset)
+                return asset["animated"]
+        return True
+
+    def _detect(self, asset):
+        """後回しにした判定を行い、そのアセットの見積もりを更新する"""
+        self.snapshot = self.snapshot or SceneSnapshot()
+        node, kind = asset["node"], asset["kind"]
+        asset["animated"] = self.snapshot.is_animated(node)
+        asset["samples"], asset["bytes"] = estimate_asset(kind, frame_count(self.frame_range), asset["animated"],
+                                                          self.snapshot.mesh_size(node) if kind == "geo" else None)
+
+    def asset_seconds(self, asset):
+        return PLAN_SECONDS["asset"] + asset["samples"] * PLAN_SECONDS["sample"] + asset["bytes"] * PLAN_SECONDS["byte"]
+
+    def task_weights(self):
+        """並列書き出しのタスク ((種類, ノード)) ごとの推定時間。グループはメッシュの合計"""
+        weights = {("geo", group): 0.0 for group in self.groups}
+        for asset in self.assets:
+            key = ("geo", asset["group"]) if asset["kind"] == "geo" else (asset["kind"], asset["node"])
+            weights[key] = weights.get(key, 0.0) + self.asset_seconds(asset)
+        return weights
+
+    def estimate(self):
+        """(推定バイト数, 推定秒数)。実測値があればその比率で補正する"""
+        size = sum(asset["bytes"] for asset in self.assets)
+        seconds = sum(self.asset_seconds(asset) for asset in self.assets)
+        measured = self.calibration or {}
+        if measured.get("estimated_bytes") and measured.get("bytes"):
+            size *= measured["bytes"] / measured["estimated_bytes"]
+        if measured.get("estimated_seconds") and measured.get("seconds"):
+            seconds *= measured["seconds"] / measured["estimated_seconds"]
+        return size, seconds
+
+    def summary(self):
+        counts = collections.Counter(asset["kind"] for asset in self.assets)
+        animated = sum(1 for asset in self.assets if asset["animated"])
+        size, seconds = self.estimate()
+        lines = [f"ジオメトリ {counts['geo']}  ライト {counts['light']}  カメラ {counts['cam']}  (アニメーション {animated})",
+                 f"タイムサンプル {sum(asset['samples'] for asset in self.assets)}  "
+                 f"推定サイズ {size / (1 << 20):.1f} MB  推定時間 {int(seconds) // 60:02d}:{int(seconds) % 60:02d}"
+                 + ("" if self.calibration else " (実測なし)")]
+        for path, nodes in self.collisions.items():
+            lines.append(f"名前の衝突: {path} <- {', '.join(nodes)}")
+        return "\n".join(lines)
+
+    def record_run(self, seconds=None):
+        """書き出し後に計画を書き出し先に保存する。secondsを渡すと実測値として次の見積もりに使う"""
+        if seconds is None:
+            # Partial runs (incremental or cancelled) keep the previous measurement
+            self.measured = self.measured or self.calibration
+        else:
+            self.measured = {
+                "seconds": seconds,
+                "estimated_seconds": sum(self.asset_seconds(asset) for asset in self.assets),
+                "bytes": sum(os.path.getsize(path) for path in
+                             (os.path.join(self.output_dir, asset["path"]) for asset in self.assets)
+                             if os.path.exists(path)),
+                "estimated_bytes": sum(asset["bytes"] for asset in self.assets),
+            }
+        return self.save(os.path.join(self.output_dir, PLAN_FILENAME))
+
+    def to_dict(self):
+        return {"output_dir": self.output_dir, "groups": self.groups, "assets": self.assets,
+                "frame_range": list(self.frame_range) if self.frame_range else None, "file_format": self.file_format,
+                "detect_static": self.detect_static, "collisions": self.collisions, "measured": self.measured}
+
+    @classmethod
+    def from_dict(cls, data):
+        frame_range = tuple(data["frame_range"]) if data.get("frame_range") else None
+        return cls(data["output_dir"], data["groups"], data["assets"], frame_range=frame_range,
+                   file_format=data.get("file_format"), detect_static=data.get("detect_static", False),
+                   measured=data.get("measured"))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def plan_from_selection(output_dir, frame_range=None, file_format=None, detect_static=False, snapshot=None,
+                        defer_detection=False):
+    """選択したグループ・ライト・カメラの書き出し計画を立てる。snapshotを渡すとシーンを調べ直さない"""
+    selected_groups = cmds.ls(selection=True, long=True, type="transform")
+    if not selected_groups:
+        cmds.warning("グループが選択されていません。")
+        return None
+    snapshot = snapshot or SceneSnapshot()
+    classifier_all = classify_selection(index=snapshot.index)
+    return ExportPlan.build(output_dir, selected_groups, classifier_all.lights, classifier_all.cameras,
+                            frame_range=frame_range, file_format=file_format, detect_static=detect_static,
+                            snapshot=snapshot, defer_detection=defer_detection)
+
+
+STAGING_ROOT_ENV = "USD_EXPORT_SCRATCH"
+PUBLISHED_FILENAME = ".published.json"
+# Published after everything else, so that a current manifest means a complete folder
+PUBLISH_LAST = (ExportManifest.filename, CHECKSUM_FILENAME, PLAN_FILENAME)
+TRANSFER_BLOCK = 1 << 20
+
+
+def default_scratch_dir(output_dir):
+    """書き出し先ごとのローカルのスクラッチ。変更のないファイルを転送しないよう、実行をまたいで使い回す"""
+    root = os.environ.get(STAGING_ROOT_ENV) or os.path.join(tempfile.gettempdir(), "usd_export_staging")
+    key = hashlib.sha1(os.path.abspath(output_dir).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(root, f"{os.path.basename(os.path.normpath(output_dir))}_{key}")
+
+
+def transfer_file(source, target, verify=True):
+    """sourceをtarget.partにコピーし、(.partのパス, ダイジェスト, バイト数)を返す
+
+    verifyでは書き込んだ.partを読み直してダイジェストを比べる。
+    """
+    part_path = target + ".part"
+    hasher = hashlib.sha1()
+    size = 0
+    try:
+        with open(source, "rb") as src, open(part_path, "wb") as dst:
+            for block in iter(lambda: src.read(TRANSFER_BLOCK), b""):
+                hasher.update(block)
+                dst.write(block)
+                size += len(block)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    digest = hasher.hexdigest()
+    if verify and file_checksum(part_path) != digest:
+        os.remove(part_path)
+        raise IOError(f"転送したファイルのチェックサムが一致しません: {target}")
+    return part_path, digest, size
+
+
+class StagedOutput:
+    """ローカルのスクラッチに書き出してから、書き出し先 (SMB/NFSの共有など) へまとめて転送して公開する
+
+    publish()は変更のあるファイルだけをstreams本の並列コピーで.partに転送・検証し、全て揃ってから
+    深い階層のファイル→コンバインレイヤー→マニフェストの順に置き換える。publish_mode="swap"では
+    今の書き出し先を隣のフォルダに複製して変更を重ね、フォルダごと入れ替える。
+    前回公開したときのサイズと更新時刻が書き出し先で変わっていれば (別の端末からの公開や手での変更)、
+    そのファイルは転送し直す。
+    """
+
+    def __init__(self, output_dir, scratch_dir=None, streams=4, verify=True, publish_mode="manifest"):
+        self.output_dir = output_dir
+        self.local_dir = scratch_dir or default_scratch_dir(output_dir)
+        os.makedirs(self.local_dir, exist_ok=True)
+        self.streams = max(1, streams)
+        self.verify = verify
+        self.publish_mode = publish_mode
+        self.published = self._load_published()
+
+    def _load_published(self):
+        path = os.path.join(self.local_dir, PUBLISHED_FILENAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        # A scratch reused for another destination has published nothing there
+        if data.get("output_dir") != os.path.abspath(self.output_dir):
+            return {}
+        # Entries from before the destination stat was recorded cannot be checked, so they are sent again
+        return {rel: entry for rel, entry in data.get("files", {}).items() if isinstance(entry, list)}
+
+    def _save_published(self):
+        path = os.path.join(self.local_dir, PUBLISHED_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"output_dir": os.path.abspath(self.output_dir), "files": self.published}, f, indent=1)
+
+    def local_files(self):
+        files = {}
+        for root, _, names in os.walk(self.local_dir):
+            for name in names:
+                if name == PUBLISHED_FILENAME or name.endswith((".tmp", ".part")):
+                    continue
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, self.local_dir).replace("\\", "/")] = path
+        return files
+
+    def is_published(self, rel, digest):
+        """前回公開した内容が、書き出し先でもそのまま残っているか"""
+        entry = self.published.get(rel)
+        if entry is None or entry[0] != digest:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.output_dir, rel))
+        except OSError:
+            return False
+        return [stat.st_size, stat.st_mtime_ns] == entry[1:]
+
+    @staticmethod
+    def publish_order(rel_path):
+        # Referenced files land before the layers that reference them
+        return os.path.basename(rel_path) in PUBLISH_LAST, -rel_path.count("/"), rel_path
+
+    def publish(self):
+        """スクラッチの内容を書き出し先に公開し、{"files", "skipped", "bytes", "seconds"}を返す"""
+        start = time.perf_counter()
+        files = self.local_files()
+        with profile_stage("stage_checksum"):
+            digests = {rel: file_checksum(path) for rel, path in files.items()}
+        swap = self.publish_mode == "swap"
+        target_dir = self.output_dir.rstrip("/\\") + ".staging" if swap else self.output_dir
+        if swap:
+            shutil.rmtree(target_dir, ignore_errors=True)
+            # Files the scratch does not know about (MaterialX, other publishes) survive the swap
+            if os.path.isdir(self.output_dir):
+                with profile_stage("stage_seed", path=self.output_dir):
+                    shutil.copytree(self.output_dir, target_dir)
+        changed = sorted((rel for rel in files if not self.is_published(rel, digests[rel])), key=self.publish_order)
+        for directory in sorted({os.path.dirname(rel) for rel in changed}):
+            os.makedirs(os.path.join(target_dir, directory), exist_ok=True)
+
+        transferred = {}
+        with profile_stage("transfer", path=self.output_dir):
+            with ThreadPoolExecutor(max_workers=self.streams) as pool:
+                futures = {rel: pool.submit(transfer_file, files[rel], os.path.join(target_dir, rel), self.verify)
+                           for rel in changed}
+                errors = []
+                for rel, future in futures.items():
+                    try:
+                        transferred[rel] = future.result()
+                    except Exception as e:
+                        errors.append(e)
+            errors += [IOError(f"書き出し中に変更されたファイルがあります: {rel}")
+                       for rel, (_, digest, _) in transferred.items() if digest != digests[rel]]
+            if errors:
+                # Nothing is published unless every file arrived intact
+                for part_path, _, _ in transferred.values():
+                    os.remove(part_path)
+                raise errors[0]
+
+        with profile_stage("publish", path=self.output_dir):
+            for rel in changed:
+                os.replace(transferred[rel][0], os.path.join(target_dir, rel))
+            # Renaming keeps the stat, so it can be taken before the swap; skipped files are now the seeded copies
+            for rel in (files if swap else changed):
+                stat = os.stat(os.path.join(target_dir, rel))
+                self.published[rel] = [digests[rel], stat.st_size, stat.st_mtime_ns]
+            if swap:
+                self._swap(target_dir)
+        self.published = {rel: self.published[rel] for rel in files}
+        self._save_published()
+
+        stats = {"files": len(changed), "skipped": len(files) - len(changed),
+                 "bytes": sum(size for _, _, size in transferred.values()), "seconds": time.perf_counter() - start}
+        print(f"# {stats['files']}個のファイル ({stats['bytes'] / (1 << 20):.1f} MB) を{self.streams}本で転送し、"
+              f"公開しました: {self.output_dir} ({stats['seconds']:.1f}秒、変更なし{stats['skipped']}個)")
+        return stats
+
+    def _swap(self, staging_dir):
+        old_dir = self.output_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.output_dir):
+            os.replace(self.output_dir, old_dir)
+        os.replace(staging_dir, self.output_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class ExportProgress:
+    """ステージごとの完了数と経過時間から進捗と残り時間を求める"""
+
+    def __init__(self):
+        self.stages = {}
+        self.start_time = time.perf_counter()
+
+    def add(self, stage, total):
+        self.stages[stage] = [0, total]
+
+    def advance(self, stage, count=1):
+        self.stages[stage][0] += count
+
+    @property
+    def done(self):
+        return sum(done for done, _ in self.stages.values())
+
+    @property
+    def total(self):
+        return sum(total for _, total in self.stages.values())
+
+    def eta(self):
+        done = self.done
+        if not done:
+            return None
+        elapsed = time.perf_counter() - self.start_time
+        return elapsed / done * (self.total - done)
+
+    def summary(self):
+        parts = [f"{stage} {done}/{total}" for stage, (done, total) in self.stages.items() if total]
+        eta = self.eta()
+        if eta is not None:
+            parts.append(f"残り約 {int(eta) // 60:02d}:{int(eta) % 60:02d}")
+        return "  ".join(parts)
+
+
+class ExportJob:
+    """書き出しをアセット単位のステップに分割し、ファイルの書き込みはバックグラウンドスレッドで行う
+
+    Mayaが次のアセットを書き出している間に、書き出し済みのアセットの後処理をPostProcessPipelineで進める。
+    コンバインUSDはメンバーの後処理 (範囲の記録) が終わってから書き込みスレッドで書く。
+    """
+
+    def __init__(self, output_dir, groups, lights=(), cameras=(), export_houdini_py=False, frame_range=None,
+                 batch_export=False, incremental=False, index=None, file_format=None, layer_format="usda",
+                 detect_static=False, clip_frames=None, clip_window=None, instance_duplicates=False,
+                 use_payloads=False, houdini_loader="chain", post_workers=None, package_usdz=False,
+                 sample_tolerances=None, profiler=None, plan=None, staging=None):
+        # Staged jobs write everything to local scratch and publish to output_dir at the end
+        self.staging = staging
+        if staging is not None:
+            output_dir = staging.local_dir
+        self.output_dir = output_dir
+        if plan is None:
+            plan = ExportPlan.build(output_dir, groups, lights, cameras, frame_range=frame_range,
+                                    file_format=file_format, detect_static=detect_static, snapshot=SceneSnapshot(index),
+                                    defer_detection=True)
+        # Plans are stored with relative paths, so they can be run into another folder
+        plan.output_dir = output_dir
+        self.plan = plan
+        self.group_meshes = plan.group_meshes()
+        self.lights = plan.nodes("light")
+        self.cameras = plan.nodes("cam")
+        self.export_houdini_py = export_houdini_py
+        self.houdini_loader = houdini_loader
+        self.frame_range = frame_range
+        self.batch_export = batch_export
+        self.incremental = incremental
+        self.file_format = file_format
+        self.layer_format = layer_format
+        # The plan detects each asset when its export step first asks, so setup does not walk the DG
+        self.detector = (plan if plan.detect_static else AnimationDetector()) if detect_static else None
+        self.clip_frames = clip_frames
+        self.clip_window = clip_window
+        self.instance_duplicates = instance_duplicates
+        self.use_payloads = use_payloads
+        self.profiler = profiler
+        self.post_workers = post_workers
+        self.package_usdz = package_usdz
+        self.sample_tolerances = sample_tolerances
+        self.cancelled = False
+
+        self.progress = ExportProgress()
+        self.progress.add("geo", sum(len(meshes) for _, meshes in self.group_meshes))
+        self.progress.add("light", len(self.lights))
+        self.progress.add("cam", len(self.cameras))
+
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.write_futures = []
+
+        for path, nodes in plan.collisions.items():
+            cmds.warning(f"同じファイルに書き出されるノードがあります: {path}: {', '.join(nodes)}")
+
+    @classmethod
+    def from_selection(cls, output_dir, profile=False, snapshot=None, **kwargs):
+        # Activated before traversal so that indexing and classification are measured too
+        profiler = ExportProfiler().activate() if profile else None
+        plan = plan_from_selection(output_dir, frame_range=kwargs.get("frame_range"),
+                                   file_format=kwargs.get("file_format"), detect_static=kwargs.get("detect_static", False),
+                                   snapshot=snapshot, defer_detection=True)
+        if plan is None:
+            if profiler is not None:
+                profiler.deactivate()
+            return None
+        return cls.from_plan(plan, output_dir, profiler=profiler, **kwargs)
+
+    @classmethod
+    def from_plan(cls, plan, output_dir=None, **kwargs):
+        """ExportPlan (保存したものでもよい) に従って書き出すジョブを作る"""
+        kwargs = dict(kwargs, frame_range=plan.frame_range, file_format=plan.file_format)
+        return cls(output_dir or plan.output_dir, plan.groups, plan=plan, **kwargs)
+
+    def cancel(self):
+        """次のステップから書き出しを止める。完了したグループ・ライト・カメラだけでコンバインUSDを書き出す"""
+        self.cancelled = True
+
+    def submit_write(self, func, *args, **kwargs):
+        self.write_futures.append(self.writer.submit(func, *args, **kwargs))
+
+    def is_writing(self):
+        return any(not future.done() for future in self.write_futures)
+
+    def wait(self):
+        for future in self.write_futures:
+            future.result()
+
+    def run_steps(self):
+        """Maya側の書き出しを1アセットずつ実行するジェネレーター"""
+        manifest = ExportManifest(self.output_dir) if self.incremental else None
+        post = PostProcessPipeline(workers=self.post_workers, package_usdz=self.package_usdz)
+        selection = cmds.ls(selection=True, long=True)
+        geo_combine_list = []
+
+        for group, mesh_transforms in self.group_meshes:
+            group_name = group.split('|')[-1]
+            if not mesh_transforms:
+                print(f"[{group_name}] にメッシュが見つかりませんでした。スキップします。")
+                continue
+
+            group_output_dir = os.path.join(self.output_dir, group_name)
+            os.makedirs(group_output_dir, exist_ok=True)
+
+            duplicates = {}
+            if self.instance_duplicates:
+                with profile_stage("find_duplicates"):
+                    duplicates = find_duplicate_meshes(mesh_transforms, self.detector or AnimationDetector())
+                self.progress.advance("geo", len(duplicates))
+            unique_meshes = [mesh for mesh in mesh_transforms if mesh not in duplicates]
+
+            step = BATCH_STEP_MESHES if self.batch_export else 1
+            chunks = [unique_meshes[i:i + step] for i in range(0, len(unique_meshes), step)]
+            exported = {}
+            for chunk in chunks:
+                if self.cancelled:
+                    break
+                exported_files = export_assets(chunk, group_output_dir, "geo", frame_range=self.frame_range,
+                                               manifest=manifest, batch_export=self.batch_export,
+                                               file_format=self.file_format, detector=self.detector,
+                                               clip_frames=self.clip_frames, clip_window=self.clip_window, post=post,
+                                               sample_tolerances=self.sample_tolerances)
+                exported.update(zip(chunk, exported_files))
+                self.progress.advance("geo", len(chunk))
+                yield
+            if len(exported) < len(unique_meshes):
+                break
+            exported_files, instances = resolve_instances(mesh_transforms, duplicates, exported)
+
+            combine_name = f"{group_name}_combine.{self.layer_format}"
+            self.submit_write(self.write_group_combine, post.pending(), manifest, exported_files, group_output_dir,
+                              combine_filename=combine_name, root_name=group_name, instances=instances,
+                              use_payloads=self.use_payloads)
+            geo_combine_list.append((group_name, f"{group_name}/{combine_name}"))
+
+        light_exported = yield from self._export_flat(self.lights, "light", manifest, post)
+        cam_exported = yield from self._export_flat(self.cameras, "cam", manifest, post)
+
+        # Final join: every asset is post-processed before the scene layers and the manifest are written
+        self.submit_write(post.join, self.output_dir)
+        self.submit_write(write_scene_layers, self.output_dir, geo_combine_list, light_exported, cam_exported,
+                          export_houdini_py=self.export_houdini_py, manifest=manifest, layer_format=self.layer_format,
+                          use_payloads=self.use_payloads, houdini_loader=self.houdini_loader,
+                          publish_dir=self.staging.output_dir if self.staging is not None else None)
+        if manifest is not None:
+            self.submit_write(manifest.save)
+        self.submit_write(self.record_plan)
+        if self.staging is not None:
+            self.submit_write(self.staging.publish)
+        # Exports change the selection one asset at a time
+        if selection:
+            cmds.select(selection, replace=True)
+        if self.profiler is not None:
+            # Combine layers are still being written, so the report is the writer's last task
+            self.profiler.restore_cmds()
+            self.submit_write(self.finish_profile)
+        self.writer.shutdown(wait=False)
+        if self.cancelled:
+            print("# 書き出しをキャンセルしました。完了したアセットのみコンバインUSDに含めます。")
+
+    @staticmethod
+    def write_group_combine(futures, manifest, *args, **kwargs):
+        for future in futures:
+            future.result()
+        write_combine_usd_if_changed(manifest, *args, **kwargs)
+
+    def record_plan(self):
+        # Only full runs are representative enough to calibrate the next estimate
+        full_run = not self.incremental and not self.cancelled
+        self.plan.record_run(time.perf_counter() - self.progress.start_time if full_run else None)
+
+    def finish_profile(self):
+        self.profiler.deactivate()
+        self.profiler.write_report(self.output_dir)
+        print(self.profiler.summary())
+
+    def _export_flat(self, nodes, kind, manifest, post=None):
+        if not nodes or self.cancelled:
+            return []
+        folder = os.path.join(self.output_dir, ASSET_FOLDERS[kind])
+        os.makedirs(folder, exist_ok=True)
+        # One step: the baker samples every node of this kind in a single pass
+        exported = export_assets(nodes, folder, kind, frame_range=self.frame_range, manifest=manifest,
+                                 file_format=self.file_format, detector=self.detector, post=post,
+                                 sample_tolerances=self.sample_tolerances)
+        self.progress.advance(kind, len(nodes))
+        yield
+        return exported
+
+    def run(self):
+        for _ in self.run_steps():
+            pass
+        self.wait()
+
+
+def execution(output_dir, export_houdini_py=False, frame_range=None, batch_export=False, incremental=False,
+              file_format=None, layer_format="usda", detect_static=False, clip_frames=None, clip_window=None,
+              instance_duplicates=False, use_payloads=False, houdini_loader="chain", post_workers=None,
+              package_usdz=False, sample_tolerances=None, profile=False, plan=None, dry_run=False, staging=None):
+    """選択 (planを渡すとその計画) を書き出し、使った計画を返す
+
+    dry_runでは計画と見積もりを表示するだけで、何も書き出さない。
+    stagingにStagedOutputを渡すと、ローカルに書き出してから書き出し先へ転送して公開する。
+    """
+    if dry_run:
+        plan = plan or plan_from_selection(output_dir, frame_range=frame_range, file_format=file_format,
+                                           detect_static=detect_static)
+        if plan is not None:
+            print(f"# 書き出し計画: {output_dir}\n{plan.summary()}")
+        return plan
+
+    options = dict(export_houdini_py=export_houdini_py, batch_export=batch_export, incremental=incremental,
+                   layer_format=layer_format, detect_static=detect_static, clip_frames=clip_frames,
+                   clip_window=clip_window, instance_duplicates=instance_duplicates, use_payloads=use_payloads,
+                   houdini_loader=houdini_loader, post_workers=post_workers, package_usdz=package_usdz,
+                   sample_tolerances=sample_tolerances, staging=staging)
+    if plan is not None:
+        job = ExportJob.from_plan(plan, output_dir, profiler=ExportProfiler().activate() if profile else None,
+                                  **options)
+    else:
+        job = ExportJob.from_selection(output_dir, frame_range=frame_range, file_format=file_format,
+                                       profile=profile, **options)
+    if job is None:
+        return None
+    job.run()
+    return job.plan
+
+
+# Assets exported per export_assets call while live-syncing
+LIVE_SYNC_BATCH = 8
+
+
+class LiveSync:
+    """書き出したルート以下の編集を追跡し、変更のあったアセットだけを書き出し直す
+
+    アセットのノード・シェイプ・親 (とマテリアル) のダーティ/属性変更と、ルート以下のDAGの変更を
+    コールバックで受けてキューに入れる。process()はキューをバッチで書き出し、そのアセットを含む
+    コンバインレイヤーだけを更新する。start()は全アセットをキューに入れるので、最初のprocess()が
+    マニフェストによる差分書き出しでの初回の同期になる。
+    書き出しのオプション (clip_frames・instance_duplicates・sample_tolerancesなど) はExportJobと同じ。
+    """
+
+    def __init__(self, output_dir, groups, lights=(), cameras=(), frame_range=None, file_format=None,
+                 layer_format="usda", detect_static=False, use_payloads=False, export_houdini_py=False,
+                 houdini_loader="chain", materials=False, on_change=None, batch_export=False, clip_frames=None,
+                 clip_window=None, instance_duplicates=False, sample_tolerances=None):
+        self.output_dir = output_dir
+        self.groups = list(groups)
+        self.lights = list(lights)
+        self.cameras = list(cameras)
+        self.frame_range = frame_range
+        self.file_format = file_format
+        self.layer_format = layer_format
+        self.detect_static = detect_static
+        self.use_payloads = use_payloads
+        self.export_houdini_py = export_houdini_py
+        self.houdini_loader = houdini_loader
+        self.materials = materials
+        self.on_change = on_change
+        self.batch_export = batch_export
+        self.clip_frames = clip_frames
+        self.clip_window = clip_window
+        self.instance_duplicates = instance_duplicates
+        self.sample_tolerances = sample_tolerances
+
+        self.manifest = None
+        self.group_meshes = {}
+        # {group: {copy: prototype}}; copies are not exported but reference their prototype
+        self.group_duplicates = {}
+        self.mesh_group = {}
+        self.material_meshes = {}
+        self.watched = {}
+        self.callback_ids = []
+        # (kind, node) in arrival order; kind is geo, light, cam or material
+        self.queue = {}
+        self.exported = {}
+        self.changed_groups = set()
+        self.stale = set()
+        self.structure_changed = True
+        self.busy = False
+
+    @classmethod
+    def from_selection(cls, output_dir, **kwargs):
+        selected_groups = cmds.ls(selection=True, long=True, type="transform")
+        if not selected_groups:
+            cmds.warning("グループが選択されていません。")
+            return None
+        classifier_all = classify_selection(index=SceneIndex())
+        return cls(output_dir, selected_groups, classifier_all.lights, classifier_all.cameras, **kwargs)
+
+    @property
+    def pending(self):
+        return len(self.queue) + len(self.changed_groups)
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest = ExportManifest(self.output_dir)
+        index = SceneIndex()
+        for group in self.groups:
+            self.group_meshes[group] = index.meshes_under(group)
+        self._watch()
+        for group, meshes in self.group_meshes.items():
+            self._queue(("geo", mesh) for mesh in meshes)
+        self._queue(("light", node) for node in self.lights)
+        self._queue(("cam", node) for node in self.cameras)
+        self._queue(("material", material) for material in self.material_meshes)
+        print(f"# ライブ同期を開始しました: {self.output_dir} ({self.pending}個)")
+
+    def stop(self):
+        self._unwatch()
+        self.queue.clear()
+        if self.manifest is not None:
+            self.manifest.save()
+        print(f"# ライブ同期を終了しました: {self.output_dir}")
+
+    def _watched_nodes(self, node):
+        # Parent xforms are baked into every asset, so edits on them count too
+        parts = node.split('|')
+        ancestors = ['|'.join(parts[:i]) for i in range(2, len(parts))]
+        return ancestors + [node] + (cmds.listRelatives(node, shapes=True, fullPath=True) or [])
+
+    def _watch(self):
+        self._unwatch()
+        self.mesh_group = {mesh: group for group, meshes in self.group_meshes.items() for mesh in meshes}
+        watched = {}
+        assets = [("geo", mesh) for mesh in self.mesh_group] + [("light", node) for node in self.lights]
+        assets += [("cam", node) for node in self.cameras]
+        for kind, node in assets:
+            for watched_node in self._watched_nodes(node):
+                watched.setdefault(watched_node, []).append((kind, node))
+        if self.materials:
+            exporter = MaterialXExporter()
+            self.material_meshes = {}
+            for mesh in self.mesh_group:
+                for material in exporter.get_assigned_material(mesh)[:1]:
+                    self.material_meshes.setdefault(material, mesh)
+                    watched.setdefault(material, [("material", material)])
+        self.watched = watched
+
+        for node in watched:
+            sel = om.MSelectionList()
+            sel.add(node)
+            obj = sel.getDependNode(0)
+            self.callback_ids.append(om.MNodeMessage.addNodeDirtyPlugCallback(obj, self._on_dirty, node))
+            self.callback_ids.append(om.MNodeMessage.addAttributeChangedCallback(obj, self._on_attribute_changed, node))
+        self.callback_ids.append(om.MDagMessage.addChildAddedCallback(self._on_dag_changed))
+        self.callback_ids.append(om.MDagMessage.addChildRemovedCallback(self._on_dag_changed))
+
+    def _unwatch(self):
+        if self.callback_ids:
+            om.MMessage.removeCallbacks(self.callback_ids)
+        self.callback_ids = []
+
+    def _queue(self, items):
+        added = False
+        for item in items:
+            self.queue[item] = None
+            added = True
+        if added and self.on_change is not None:
+            self.on_change()
+
+    def _on_dirty(self, node, plug, client_data):
+        # Our own exports evaluate other frames, which dirties animated nodes
+        if not self.busy:
+            self._queue(self.watched.get(client_data, ()))
+
+    def _on_attribute_changed(self, message, plug, other_plug, client_data):
+        if not self.busy:
+            self._queue(self.watched.get(client_data, ()))
+
+    def _on_dag_changed(self, child, parent, client_data):
+        if self.busy:
+            return
+        parent_path = parent.fullPathName()
+        for group in self.group_meshes:
+            if parent_path == group or parent_path.startswith(group + '|'):
+                self.changed_groups.add(group)
+                if self.on_change is not None:
+                    self.on_change()
+
+    def _refresh_group(self, group):
+        """DAGが変わったグループのメッシュを取り直し、増えたメッシュをキューに入れる"""
+        self.changed_groups.discard(group)
+        meshes = collect_mesh_transforms(group) if cmds.ls(group, long=True) else []
+        previous = set(self.group_meshes.get(group, []))
+        self.group_duplicates.pop(group, None)
+        for mesh in previous - set(meshes):
+            self.exported.pop(("geo", mesh), None)
+            self.queue.pop(("geo", mesh), None)
+        self.group_meshes[group] = meshes
+        self.stale.add(group)
+        self.structure_changed = True
+        self._watch()
+        self._queue(("geo", mesh) for mesh in meshes if mesh not in previous)
+
+    def process(self, budget=None):
+        """キューをバッチで書き出し、関係するコンバインレイヤーを更新する。書き出した (確認した) 数を返す
+
+        budgetを渡すとその秒数を超えたところで止め、残りは次の呼び出しに回す。
+        """
+        if self.busy:
+            return 0
+        self.busy = True
+        deadline = time.perf_counter() + budget if budget is not None else None
+        count = 0
+        try:
+            for group in list(self.changed_groups):
+                self._refresh_group(group)
+            # Keys or deformers may have been added since the last batch
+            detector = AnimationDetector() if self.detect_static else None
+            while self.queue and (deadline is None or time.perf_counter() < deadline):
+                batch = [item for item, _ in zip(self.queue, range(LIVE_SYNC_BATCH))]
+                for item in batch:
+                    del self.queue[item]
+                self._export_batch(batch, detector)
+                count += len(batch)
+            self._write_layers()
+            self.manifest.save()
+        finally:
+            self.busy = False
+        return count
+
+    def _update_duplicates(self, groups, detector, batch):
+        """グループのコピーを探し直し、コピーでなくなったまま書き出されていないメッシュをキューに入れる"""
+        detector = detector or AnimationDetector()
+        for group in groups:
+            duplicates = find_duplicate_meshes(self.group_meshes[group], detector)
+            self.group_duplicates[group] = duplicates
+            self._queue(("geo", mesh) for mesh in self.group_meshes[group]
+                        if mesh not in duplicates and ("geo", mesh) not in self.exported and ("geo", mesh) not in batch)
+
+    def _export_batch(self, batch, detector):
+        if self.instance_duplicates:
+            groups = {self.mesh_group.get(node) for kind, node in batch if kind == "geo"} - {None}
+            self._update_duplicates(groups, detector, batch)
+        by_folder = {}
+        for kind, node in batch:
+            if kind == "material":
+                self._write_material(node)
+                continue
+            if not cmds.ls(node, long=True):
+                # Deleted; the DAG callback drops it from its group
+                continue
+            group = self.mesh_group.get(node) if kind == "geo" else None
+            if kind == "geo" and group is None:
+                continue
+            if node in self.group_duplicates.get(group, ()):
+                # Only the instance offset in the combine layer changes
+                self.exported.pop((kind, node), None)
+                self.stale.add(group)
+                continue
+            folder = group.split('|')[-1] if kind == "geo" else ASSET_FOLDERS[kind]
+            by_folder.setdefault((kind, folder, group), []).append(node)
+
+        for (kind, folder, group), nodes in by_folder.items():
+            folder_path = os.path.join(self.output_dir, folder)
+            os.makedirs(folder_path, exist_ok=True)
+            exported = export_assets(nodes, folder_path, kind, frame_range=self.frame_range, manifest=self.manifest,
+                                     batch_export=self.batch_export, file_format=self.file_format, detector=detector,
+                                     clip_frames=self.clip_frames, clip_window=self.clip_window,
+                                     sample_tolerances=self.sample_tolerances)
+            for node, entry in zip(nodes, exported):
+                self.exported[(kind, node)] = entry
+            self.stale.add(group if kind == "geo" else kind)
+
+    def _write_material(self, material):
+        mesh = self.material_meshes.get(material)
+        if mesh is None or not cmds.ls(mesh, long=True):
+            return
+        materialx_dir = os.path.join(self.output_dir, "materialx")
+        os.makedirs(materialx_dir, exist_ok=True)
+        MaterialXExporter().write_materialx(mesh, materialx_dir)
+
+    def _write_layers(self):
+        """メンバーが揃ったコンバインレイヤーだけを書き直す。変更のないレイヤーはマニフェストでスキップされる"""
+        pending = {self.mesh_group.get(node) if kind == "geo" else kind for kind, node in self.queue}
+        for group in [group for group in self.stale if group in self.group_meshes and group not in pending]:
+            self.stale.discard(group)
+            group_name = group.split('|')[-1]
+            duplicates = self.group_duplicates.get(group, {})
+            meshes = [mesh for mesh in self.group_meshes[group] if ("geo", duplicates.get(mesh, mesh)) in self.exported]
+            exported = {mesh: self.exported[("geo", mesh)] for mesh in meshes if mesh not in duplicates}
+            file_info_list, instances = resolve_instances(meshes, duplicates, exported)
+            if file_info_list:
+                write_combine_usd_if_changed(self.manifest, file_info_list, os.path.join(self.output_dir, group_name),
+                                             combine_filename=f"{group_name}_combine.{self.layer_format}",
+                                             root_name=group_name, instances=instances, use_payloads=self.use_payloads)
+            self.stale.add("scene")
+
+        # The scene layers reference every group, so they wait until nothing is queued
+        if not (self.stale & {"scene", "light", "cam"}) or pending - {"material"}:
+            return
+        self.stale -= {"scene", "light", "cam"}
+        geo_combine_list = [(group.split('|')[-1], f"{group.split('|')[-1]}/{group.split('|')[-1]}_combine.{self.layer_format}")
+                            for group, meshes in self.group_meshes.items()
+                            if any(("geo", mesh) in self.exported for mesh in meshes)]
+        light_exported = [self.exported[("light", node)] for node in self.lights if ("light", node) in self.exported]
+        cam_exported = [self.exported[("cam", node)] for node in self.cameras if ("cam", node) in self.exported]
+        write_scene_layers(self.output_dir, geo_combine_list, light_exported, cam_exported,
+                           export_houdini_py=self.export_houdini_py and self.structure_changed, manifest=self.manifest,
+                           layer_format=self.layer_format, use_payloads=self.use_payloads,
+                           houdini_loader=self.houdini_loader)
+        self.structure_changed = False
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "My_export_USD_Mtlx_worker.py")
+
+
+def find_mayapy():
+    exe_name = "mayapy.exe" if os.name == "nt" else "mayapy"
+    maya_location = os.environ.get("MAYA_LOCATION")
+    if maya_location and os.path.exists(os.path.join(maya_location, "bin", exe_name)):
+        return os.path.join(maya_location, "bin", exe_name)
+    return shutil.which("mayapy") or exe_name
+
+
+def plan_parallel_export(groups, lights, cameras, workers, index=None, plan=None):
+    """グループはメッシュ数、ライトとカメラは1として重み付けし、負荷が均等になるようワーカーに割り振る
+
+    planを渡すと、その推定時間で重み付けする。
+    """
+    if plan is not None:
+        weights = plan.task_weights()
+        weighted = [(weights.get(("geo", g), 0.0), {"kind": "geo", "node": g}) for g in groups]
+        weighted += [(weights.get((kind, node), 0.0), {"kind": kind, "node": node})
+                     for kind, nodes in (("light", lights), ("cam", cameras)) for node in nodes]
+    else:
+        index = index or SceneIndex()
+        weighted = [(max(len(index.meshes_under(g)), 1), {"kind": "geo", "node": g}) for g in groups]
+        weighted += [(1, {"kind": "light", "node": light}) for light in lights]
+        weighted += [(1, {"kind": "cam", "node": cam}) for cam in cameras]
+    weighted.sort(key=lambda item: item[0], reverse=True)
+
+    # Longest-processing-time first: always feed the least loaded worker
+    heap = [(0, i) for i in range(max(1, min(workers, len(weighted))))]
+    chunks = [[] for _ in heap]
+    for weight, task in weighted:
+        load, i = heapq.heappop(heap)
+        chunks[i].append(task)
+        heapq.heappush(heap, (load + weight, i))
+    return [chunk for chunk in chunks if chunk]
+
+
+def prepare_worker_scene(job_dir):
+    """ワーカーが開くシーンを返す。未保存の変更がある場合は一時ファイルに書き出す"""
+    scene = cmds.file(q=True, sceneName=True)
+    if scene and not cmds.file(q=True, modified=True):
+        return scene
+    temp_scene = os.path.join(job_dir, "export_scene.mb")
+    cmds.file(temp_scene, exportAll=True, type="mayaBinary", preserveReferences=True, force=True)
+    return temp_scene
+
+
+def run_worker_tasks(job):
+    """ワーカー内でタスクを順に書き出し、結果をJSONに変換できる形で返す
+
+    tasksはタスクごとの結果、postは後処理の結果、manifestはこのワーカーが書き換えたマニフェストの項目。
+    """
+    output_dir = job["output_dir"]
+    frame_range = tuple(job["frame_range"]) if job.get("frame_range") else None
+    file_format = job.get("file_format")
+    detector = AnimationDetector() if job.get("detect_static") else None
+    index = SceneIndex()
+    sample_tolerances = job.get("sample_tolerances")
+    manifest = ExportManifest(output_dir) if job.get("incremental") else None
+    loaded = (dict(manifest.assets), dict(manifest.combines)) if manifest is not None else ({}, {})
+    post = PostProcessPipeline(workers=job.get("post_workers"), package_usdz=job.get("package_usdz", False))
+    results = []
+    for task in job["tasks"]:
+        kind = task["kind"]
+        if kind == "geo":
+            group_combine = export_group(task["node"], output_dir, frame_range=frame_range,
+                                         batch_export=job.get("batch_export", False), index=index,
+                                         file_format=file_format, layer_format=job.get("layer_format", "usda"),
+                                         detector=detector, clip_frames=job.get("clip_frames"),
+                                         clip_window=job.get("clip_window"),
+                                         instance_duplicates=job.get("instance_duplicates", False),
+                                         use_payloads=job.get("use_payloads", False), manifest=manifest, post=post,
+                                         sample_tolerances=sample_tolerances)
+            results.append({"kind": kind, "node": task["node"], "result": list(group_combine) if group_combine else None})
+        else:
+            folder = os.path.join(output_dir, ASSET_FOLDERS[kind])
+            os.makedirs(folder, exist_ok=True)
+            name, path = export_assets([task["node"]], folder, kind, frame_range=frame_range, file_format=file_format,
+                                       detector=detector, manifest=manifest, post=post,
+                                       sample_tolerances=sample_tolerances)[0]
+            results.append({"kind": kind, "node": task["node"], "result": [name, path]})
+    post_results = post.join()
+
+    # Only this worker's entries go back, so a stale copy never overwrites another worker's
+    changed = {"assets": {}, "combines": {}}
+    if manifest is not None:
+        for key, entries, before in (("assets", manifest.assets, loaded[0]), ("combines", manifest.combines, loaded[1])):
+            changed[key] = {path: value for path, value in entries.items() if before.get(path) != value}
+    return {"tasks": results, "post": post_results, "manifest": changed}
+
+
+def run_worker(mayapy, job_path, result_path):
+    proc = subprocess.run([mayapy, WORKER_SCRIPT, job_path, result_path],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        raise RuntimeError(f"ワーカーが失敗しました ({job_path}):\n{proc.stdout[-2000:]}")
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def execution_parallel(output_dir, export_houdini_py=False, frame_range=None, batch_export=False,
+                       workers=None, mayapy=None, scene=None, file_format=None, layer_format="usda",
+                       detect_static=False, clip_frames=None, clip_window=None, instance_duplicates=False,
+                       use_payloads=False, houdini_loader="chain", incremental=False, post_workers=None,
+                       package_usdz=False, sample_tolerances=None, staging=None):
+    """選択したグループ・ライト・カメラをヘッドレスのmayapyワーカーで並列に書き出す
+
+    ワーカーのマニフェストの更新と後処理の結果 (チェックサム・検証) はここでまとめて書き出す。
+    """
+    start = time.perf_counter()
+    publish_dir = None
+    if staging is not None:
+        output_dir, publish_dir = staging.local_dir, staging.output_dir
+    manifest = ExportManifest(output_dir) if incremental else None
+    plan = plan_from_selection(output_dir, frame_range=frame_range, file_format=file_format,
+                               detect_static=detect_static)
+    if plan is None:
+        return
+    selected_groups, lights, cameras = plan.groups, plan.nodes("light"), plan.nodes("cam")
+    chunks = plan_parallel_export(selected_groups, lights, cameras, workers or os.cpu_count() or 1, plan=plan)
+
+    job_dir = tempfile.mkdtemp(prefix="usd_export_jobs_")
+    try:
+        scene = scene or prepare_worker_scene(job_dir)
+        jobs = []
+        for i, tasks in enumerate(chunks):
+            job_path = os.path.join(job_dir, f"job_{i:03d}.json")
+            with open(job_path, "w", encoding="utf-8") as f:
+                json.dump({"scene": scene, "output_dir": output_dir, "frame_range": list(frame_range) if frame_range else None,
+                           "batch_export": batch_export, "file_format": file_format, "layer_format": layer_format,
+                           "detect_static": detect_static, "clip_frames": clip_frames, "clip_window": clip_window,
+                           "instance_duplicates": instance_duplicates, "use_payloads": use_payloads,
+                           "incremental": incremental, "post_workers": post_workers, "package_usdz": package_usdz,
+                           "sample_tolerances": sample_tolerances, "tasks": tasks}, f, indent=1)
+            jobs.append((job_path, os.path.join(job_dir, f"result_{i:03d}.json")))
+
+        print(f"# {len(chunks)}個のワーカーで書き出します: {scene}")
+        results = {}
+        post_results = []
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(run_worker, mayapy or find_mayapy(), job_path, result_path)
+                       for job_path, result_path in jobs]
+            for future in futures:
+                worker_result = future.result()
+                for entry in worker_result["tasks"]:
+                    results[(entry["kind"], entry["node"])] = entry["result"]
+                post_results += worker_result["post"]
+                if manifest is not None:
+                    manifest.assets.update(worker_result["manifest"]["assets"])
+                    manifest.combines.update(worker_result["manifest"]["combines"])
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    report_issues(post_results)
+    report_sample_reduction(post_results)
+    checksums = {result["path"]: result["checksum"] for result in post_results if result["checksum"]}
+    if checksums:
+        write_checksums(output_dir, checksums)
+
+    # Merge back in selection order so the combine layers match a sequential run
+    geo_combine_list = [tuple(results[("geo", g)]) for g in selected_groups if results.get(("geo", g))]
+    light_exported = [tuple(results[("light", n)]) for n in lights]
+    cam_exported = [tuple(results[("cam", n)]) for n in cameras]
+    write_scene_layers(output_dir, geo_combine_list, light_exported, cam_exported, export_houdini_py=export_houdini_py,
+                       manifest=manifest, layer_format=layer_format, use_payloads=use_payloads,
+                       houdini_loader=houdini_loader, publish_dir=publish_dir)
+    if manifest is not None:
+        manifest.save()
+    # Incremental runs skip assets, so only full runs calibrate the next estimate
+    plan.record_run(None if incremental else time.perf_counter() - start)
+    if staging is not None:
+        staging.publish()
+
+
+# Surface inputs read as constants, with the defaults that are left out of the document
+MATERIAL_INPUT_DEFAULTS = {
+    "baseColor": (0.8, 0.8, 0.8),
+    "specularRoughness": 0.2,
+    "metalness": 0.0,
+    "transmission": 0.0,
+    "coat": 0.0,
+}
+
+
+class ShadingNode:
+    def __init__(self, name, node_type):
+        self.name = name
+        self.type = node_type
+        self.inputs = {}  # attr -> (source ShadingNode, source attr)
+        self.values = {}
+
+
+class ShadingNetwork:
+    """マテリアルの上流ネットワークを一括クエリで集めたグラフ"""
+    def __init__(self, material, nodes):
+        self.material = material
+        self.nodes = nodes
+
+    @classmethod
+    def collect(cls, material):
+        history = cmds.listHistory(material) or [material]
+        if material not in history:
+            history.append(material)
+        node_types = cmds.ls(history, showType=True) or []
+        nodes = {name: ShadingNode(name, node_type) for name, node_type in zip(node_types[::2], node_types[1::2])}
+
+        # One query returns (destination plug, source plug) pairs for the whole network
+        pairs = cmds.listConnections(list(nodes), source=True, destination=False, connections=True, plugs=True) or []
+        for dst_plug, src_plug in zip(pairs[::2], pairs[1::2]):
+            dst_node, dst_attr = dst_plug.split(".", 1)
+            src_node, src_attr = src_plug.split(".", 1)
+            if dst_node in nodes and src_node in nodes:
+                nodes[dst_node].inputs[dst_attr] = (nodes[src_node], src_attr)
+
+        network = cls(material, nodes)
+        surface = nodes[material]
+        for node in nodes.values():
+            if node.type == "file":
+                node.values["fileTextureName"] = cmds.getAttr(f"{node.name}.fileTextureName")
+        for attr in MATERIAL_INPUT_DEFAULTS:
+            # Inputs driven by other nodes (ramp, remapValue, ...) export their evaluated value
+            if network.texture_path(attr) is None:
+                surface.values[attr] = _get_attr_or_none(f"{material}.{attr}")
+        return network
+
+    def source(self, node, attr, node_type=None):
+        """attr (またはその子プラグ) に接続された上流ノードを返す"""
+        for dst_attr, (src, src_attr) in node.inputs.items():
+            if dst_attr == attr or (dst_attr.startswith(attr) and len(dst_attr) == len(attr) + 1):
+                if node_type is None or src.type == node_type:
+                    return src
+        return None
+
+    def texture_path(self, attr):
+        surface = self.nodes[self.material]
+        if attr == "normalCamera":
+            for node_type, input_attr in (("aiNormalMap", "input"), ("bump2d", "bumpValue")):
+                normal_node = self.source(surface, attr, node_type)
+                file_node = normal_node and self.source(normal_node, input_attr, "file")
+                if file_node:
+                    return file_node.values["fileTextureName"]
+            return None
+        file_node = self.source(surface, attr, "file")
+        return file_node.values["fileTextureName"] if file_node else None
+
+    def input_value(self, attr):
+        """デフォルト値と異なる値を返す（floatやcolor3）"""
+        value = self.nodes[self.material].values.get(attr)
+        if isinstance(value, list):
+            value = value[0]
+        if value is None or value == MATERIAL_INPUT_DEFAULTS[attr]:
+            return None
+        return value
+
+
+def _get_attr_or_none(plug):
+    try:
+        return cmds.getAttr(plug)
+    except (RuntimeError, ValueError):
+        return None
+
+
+UDIM_TOKENS = ("<UDIM>", "<udim>")
+TEXTURE_DIR = "textures"
+
+
+def expand_udim(path):
+    """<UDIM>トークンを含むパスを実在するタイルのパスに展開する"""
+    for token in UDIM_TOKENS:
+        if token in path:
+            prefix, suffix = path.split(token, 1)
+            return sorted(glob.glob(glob.escape(prefix) + "[1-9][0-9][0-9][0-9]" + glob.escape(suffix)))
+    return [path] if os.path.isfile(path) else []
+
+
+class TextureLocalizer:
+    """テクスチャを内容のハッシュごとのフォルダへコピー (またはハードリンク) し、重複と再コピーを避ける
+
+    ソースのハッシュはサイズと更新時刻と一緒にインデックスに保存し、変更のないファイルは読み直さない。
+    """
+    index_filename = "texture_index.json"
+
+    def __init__(self, output_dir, workers=8, hard_link=True):
+        self.texture_dir = os.path.join(output_dir, TEXTURE_DIR)
+        self.index_path = os.path.join(self.texture_dir, self.index_filename)
+        self.workers = workers
+        self.hard_link = hard_link
+        self.index = {}
+        self.localized = {}
+        self.claimed = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"# Warning: テクスチャのインデックスを読み込めませんでした: {e}")
+
+    def _digest(self, path):
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime]:
+            return entry[2]
+        hasher = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+        self.index[path] = [stat.st_size, stat.st_mtime, hasher.hexdigest()]
+        return self.index[path][2]
+
+    def _place(self, source, local):
+        """同じハッシュのファイルが既にあれば何もしない"""
+        if os.path.exists(local):
+            return False
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        tmp_path = local + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            if not self.hard_link:
+                raise OSError
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, local)
+        return True
+
+    def localize(self, texture_paths):
+        """{元のパス: ローカルのパス}を返す。UDIMのパスはトークンを残したまま置き換える"""
+        tiles = {}
+        for path in dict.fromkeys(texture_paths):
+            if path in self.localized:
+                continue
+            tiles[path] = expand_udim(path)
+            if not tiles[path]:
+                print(f"# Warning: テクスチャが見つかりません: {path}")
+        files = sorted({tile for paths in tiles.values() for tile in paths})
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            digests = dict(zip(files, pool.map(self._digest, files)))
+
+            copies = {}
+            for path, paths in tiles.items():
+                if not paths:
+                    continue
+                if paths == [path]:
+                    # Identical files share one copy, whatever their names
+                    folder = os.path.join(self.texture_dir, digests[path][:16])
+                    if folder not in self.claimed:
+                        existing = [name for name in os.listdir(folder) if not name.endswith(".tmp")] if os.path.isdir(folder) else []
+                        self.claimed[folder] = os.path.join(folder, existing[0] if existing else os.path.basename(path))
+                    copies.setdefault(self.claimed[folder], path)
+                    self.localized[path] = self.claimed[folder]
+                    continue
+                # A UDIM set keeps its tile names together in one folder keyed by every tile
+                hasher = hashlib.sha1()
+                for tile in paths:
+                    hasher.update(f"{os.path.basename(tile)}={digests[tile]};".encode("utf-8"))
+                folder = os.path.join(self.texture_dir, hasher.hexdigest()[:16])
+                copies.update((os.path.join(folder, os.path.basename(tile)), tile) for tile in paths)
+                self.localized[path] = os.path.join(folder, os.path.basename(path))
+            copied = sum(pool.map(self._place, copies.values(), copies))
+
+        if files:
+            print(f"# テクスチャ {len(copies)} 件中 {copied} 件をコピーしました: {self.texture_dir}")
+            os.makedirs(self.texture_dir, exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+        return {path: self.localized[path] for path in texture_paths if path in self.localized}
+
+
+MATERIALX_HEADER = ['<?xml version="1.0" encoding="utf-8"?>', '<materialx version="1.38">']
+FILENAME_VALUE = re.compile(r'(type="filename" value=")([^"]*)(")')
+
+
+class MaterialXExporter:
+    """1回の書き出しの間、マテリアルごとの解決結果をキャッシュする"""
+    def __init__(self, incremental=False, localize_textures=False, texture_workers=8):
+        self.incremental = incremental
+        self.localize_textures = localize_textures
+        self.texture_workers = texture_workers
+        self.materials = {}
+        self.written = set()
+        self.manifests = {}
+        self.localizers = {}
+
+    def get_assigned_material(self, obj):
+        shapes = cmds.listRelatives(obj, shapes=True, fullPath=True) or []
+        for shape in shapes:
+            sg = cmds.listConnections(shape, type="shadingEngine")
+            if sg:
+                materials = cmds.ls(cmds.listConnections(sg), materials=True)
+                if materials:
+                    return materials
+        return []
+
+    def build_material_elements(self, mat):
+        """マテリアルのnodegraph・shader・material要素の行と、最初のテクスチャパスを返す"""
+        shader_name = f"SR_{mat}"
+        graph_name = f"NG_{mat}"
+    
+        network = ShadingNetwork.collect(mat)
+
+        base_color_path = network.texture_path("baseColor")
+        roughness_path = network.texture_path("specularRoughness")
+        metalness_path = network.texture_path("metalness")
+        normal_path = network.texture_path("normalCamera")
+        transmission_path = network.texture_path("transmission")
+        coat_path = network.texture_path("coat")
+    
+        base_color_value = network.input_value("baseColor")
+        roughness_value = network.input_value("specularRoughness")
+        metalness_value = network.input_value("metalness")
+        transmission_value = network.input_value("transmission")
+        coat_value = network.input_value("coat")
+    
+        lines = [
+            f'  <nodegraph name="{graph_name}">'
+        ]
+    
+        if base_color_path:
+            lines.append(f'    <image name="baseColor_tex" type="color3">')
+            lines.append(f'      <input name="file" type="filename" value="{base_color_path}" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="base_color_output" type="color3" nodename="baseColor_tex" />')
+        elif base_color_value:
+            r, g, b = base_color_value
+            lines.append(f'    <constant name="baseColor_val" type="color3">')
+            lines.append(f'      <input name="value" type="color3" value="{r},{g},{b}" />')
+            lines.append(f'    </constant>')
+            lines.append(f'    <output name="base_color_output" type="color3" nodename="baseColor_val" />')
+    
+        if roughness_path:
+            lines.append(f'    <image name="roughness_tex" type="float">')
+            lines.append(f'      <input name="file" type="filename" value="{roughness_path}" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="roughness_output" type="float" nodename="roughness_tex" />')
+        elif roughness_value is not None:
+            lines.append(f'    <constant name="roughness_val" type="float">')
+            lines.append(f'      <input name="value" type="float" value="{roughness_value}" />')
+            lines.append(f'    </constant>')
+            lines.append(f'    <output name="roughness_output" type="float" nodename="roughness_val" />')
+    
+        if metalness_path:
+            lines.append(f'    <image name="metalness_tex" type="float">')
+            lines.append(f'      <input name="file" type="filename" value="{metalness_path}" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="metalness_output" type="float" nodename="metalness_tex" />')
+        elif metalness_value is not None:
+            lines.append(f'    <constant name="metalness_val" type="float">')
+            lines.append(f'      <input name="value" type="float" value="{metalness_value}" />')
+            lines.append(f'    </constant>')
+            lines.append(f'    <output name="metalness_output" type="float" nodename="metalness_val" />')
+
+        if transmission_path:
+            lines.append(f'    <image name="transmission_tex" type="float">')
+            lines.append(f'      <input name="file" type="filename" value="{transmission_path}" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="transmission_output" type="float" nodename="transmission_tex" />')
+        elif transmission_value is not None:
+            lines.append(f'    <constant name="transmission_val" type="float">')
+            lines.append(f'      <input name="value" type="float" value="{transmission_value}" />')
+            lines.append(f'    </constant>')
+            lines.append(f'    <output name="transmission_output" type="float" nodename="transmission_val" />')
+
+        if coat_path:
+            lines.append(f'    <image name="coat_tex" type="float">')
+            lines.append(f'      <input name="file" type="filename" value="{coat_path}" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="coat_output" type="float" nodename="coat_tex" />')
+        elif coat_value is not None:
+            lines.append(f'    <constant name="coat_val" type="float">')
+            lines.append(f'      <input name="value" type="float" value="{coat_value}" />')
+            lines.append(f'    </constant>')
+            lines.append(f'    <output name="coat_output" type="float" nodename="coat_val" />')
+  
+        if normal_path:
+            lines.append(f'    <texcoord name="st" type="vector2" />')
+            lines.append(f'    <image name="normal_tex" type="vector3" GLSLFX_usage="normal">')
+            lines.append(f'      <input name="file" type="filename" value="{normal_path}" />')
+            lines.append(f'      <input name="texcoord" type="vector2" nodename="st" />')
+            lines.append(f'    </image>')
+            lines.append(f'    <output name="normal_output" type="vector3" nodename="normal_tex" />')
+    
+        lines.append(f'  </nodegraph>')
+        lines.append(f'  <standard_surface name="{shader_name}" type="surfaceshader">')
+    
+        if base_color_path or base_color_value:
+            lines.append(f'    <input name="base_color" type="color3" output="base_color_output" nodegraph="{graph_name}" />')
+        if roughness_path or roughness_value is not None:
+            lines.append(f'    <input name="specular_roughness" type="float" output="roughness_output" nodegraph="{graph_name}" />')
+        if metalness_path or metalness_value is not None:
+            lines.append(f'    <input name="metalness" type="float" output="metalness_output" nodegraph="{graph_name}" />')
+        if transmission_path or transmission_value is not None:
+            lines.append(f'    <input name="transmission" type="float" output="transmission_output" nodegraph="{graph_name}" />')
+        if coat_path or coat_value is not None:
+            lines.append(f'    <input name="coat" type="float" output="coat_output" nodegraph="{graph_name}" />')
+        if normal_path:
+            lines.append(f'    <input name="normal" type="vector3" output="normal_output" nodegraph="{graph_name}" />')
+    
+        lines.append(f'  </standard_surface>')
+        lines.append(f'  <surfacematerial name="{mat}" type="material">')
+        lines.append(f'    <input name="surfaceshader" type="surfaceshader" nodename="{shader_name}" />')
+        lines.append(f'  </surfacematerial>')
+        first_path = base_color_path or roughness_path or metalness_path or normal_path
+        return lines, first_path
+
+    def resolve_material(self, mat):
+        if mat not in self.materials:
+            with profile_stage("materialx_resolve", asset=mat):
+                self.materials[mat] = self.build_material_elements(mat)
+        return self.materials[mat]
+
+    def default_output_dir(self, texture_path):
+        return os.path.dirname(texture_path) if texture_path else "C:/temp"
+
+    def localize(self, element_lines, outdir):
+        """テクスチャを出力フォルダにまとめ、.mtlx内のパスを相対パスに置き換える"""
+        if outdir not in self.localizers:
+            self.localizers[outdir] = TextureLocalizer(outdir, workers=self.texture_workers)
+        paths = [match.group(2) for line in element_lines for match in FILENAME_VALUE.finditer(line)]
+        with profile_stage("texture_localize"):
+            local_paths = self.localizers[outdir].localize(paths)
+
+        def relink(match):
+            local_path = local_paths.get(match.group(2))
+            if not local_path:
+                return match.group(0)
+            return match.group(1) + os.path.relpath(local_path, outdir).replace("\\", "/") + match.group(3)
+        return [FILENAME_VALUE.sub(relink, line) for line in element_lines]
+
+    def prepare_elements(self, element_lines, output_dir):
+        if not self.localize_textures:
+            return element_lines
+        if not output_dir:
+            print("# Warning: 出力先が未設定のため、テクスチャのコピーはスキップします")
+            return element_lines
+        return self.localize(element_lines, output_dir)
+
+    def write_document(self, filepath, element_lines):
+        """MaterialXファイルを書き出す。同じ書き出し中の再書き込みと、内容が前回と同じファイルはスキップする"""
+        outdir = os.path.dirname(filepath)
+        if filepath in self.written:
+            return outdir
+
+        content = "\n".join(MATERIALX_HEADER + element_lines + ['</materialx>'])
+        fingerprint = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        manifest = None
+        if self.incremental:
+            if outdir not in self.manifests:
+                self.manifests[outdir] = ExportManifest(outdir)
+            manifest = self.manifests[outdir]
+            if manifest.is_current(filepath, fingerprint):
+                print(f"# 変更がないためスキップしました: {filepath}")
+                self.written.add(filepath)
+                return outdir
+
+        try:
+            with profile_stage("materialx_write", path=filepath):
+                with open(filepath, "w", encoding="utf-8") as f:
+                    f.write(content)
+            print(f"MaterialXを書き出しました: {filepath}")
+        except Exception as e:
+            print(f"# Error: 書き出しに失敗しました: {e}")
+            return None
+
+        if manifest:
+            manifest.record(filepath, fingerprint)
+        self.written.add(filepath)
+        return outdir
+
+    def write_materialx(self, obj, output_dir=None):
+        material_list = self.get_assigned_material(obj)
+        if not material_list:
+            print(f"# Warning: マテリアルが割り当てられていません: {obj}")
+            return None
+
+        mat = material_list[0]
+        element_lines, first_path = self.resolve_material(mat)
+        outdir = output_dir or self.default_output_dir(first_path)
+        filepath = os.path.join(outdir, f"{mat}.mtlx")
+        if filepath in self.written:
+            return outdir
+        return self.write_document(filepath, self.prepare_elements(element_lines, output_dir))
+
+    def write_library(self, objects, output_dir=None, library_name="materials.mtlx"):
+        """全マテリアルを1つの.mtlxライブラリにまとめ、オブジェクトとマテリアルの対応をjsonで書き出す"""
+        assignments = {}
+        element_lines = []
+        first_path = None
+        for obj in objects:
+            material_list = self.get_assigned_material(obj)
+            if not material_list:
+                print(f"# Warning: マテリアルが割り当てられていません: {obj}")
+                continue
+            mat = material_list[0]
+            if mat not in assignments.values():
+                lines, texture_path = self.resolve_material(mat)
+                element_lines += lines
+                first_path = first_path or texture_path
+            assignments[obj] = mat
+
+        if not assignments:
+            return None
+
+        outdir = output_dir or self.default_output_dir(first_path)
+        result = self.write_document(os.path.join(outdir, library_name), self.prepare_elements(element_lines, output_dir))
+        if result:
+            mapping_path = os.path.join(outdir, f"{os.path.splitext(library_name)[0]}_assignments.json")
+            with open(mapping_path, "w", encoding="utf-8") as f:
+                json.dump({"library": library_name, "assignments": assignments}, f, indent=1, sort_keys=True)
+        return result
+
+    def finish(self):
+        for manifest in self.manifests.values():
+            manifest.save()
@@ -1,455 +1,108 @@
+"""USD/MaterialX書き出しウィンドウ
+
+    import My_export_USD_Mtlx_w6_GUI as exporter_gui
+    exporter_gui.show_exporter_gui()
+
+importしただけではウィンドウは開かない。My_export_USD_Mtlx_core.py を同じフォルダ (PYTHONPATH上) に置くこと。
+"""
 from PySide6.QtWidgets import (
     QApplication, QDialog, QWidget, QVBoxLayout, QLabel, QPushButton,
     QFileDialog, QTabWidget, QCheckBox, QHBoxLayout, QDoubleSpinBox, QLineEdit,
-    QRadioButton, QButtonGroup
+    QRadioButton, QButtonGroup, QSpinBox, QProgressBar, QComboBox
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QObject, Qt, QTimer
 from PySide6.QtGui import QDoubleValidator
 from maya import OpenMayaUI as omui
 from shiboken6 import wrapInstance
+import maya.api.OpenMaya as om
 import maya.cmds as cmds
 import os
 import subprocess
+import time
 
+from My_export_USD_Mtlx_core import (
+    ExportJob, ExportProfiler, LiveSync, MaterialXExporter, SceneSnapshot, StagedOutput, execution_parallel,
+    plan_from_selection
+)
 
-class SceneClassifier:
-    def __init__(self):
-        self.selected = cmds.ls(selection=True)
-        self.geometry = []
-        self.lights = []
-        self.cameras = []
-
-    def classify(self):
-        default_cameras = {"persp", "top", "front", "side"}
-
-        for t in self.selected:
-            if cmds.nodeType(t) != "transform":
-                continue
-        
-            shapes = cmds.listRelatives(t, shapes=True, path=True) or []
-            if not shapes:
-                continue
-        
-            shape = shapes[0]
-            shape_type = cmds.nodeType(shape)
-        
-            if shape_type == 'mesh':
-                self.geometry.append(t)
-            elif 'light' in shape_type.lower():
-                self.lights.append(t)
-            elif shape_type == 'camera':
-                cam_name = t.split('|')[-1] 
-                if cam_name not in default_cameras:
-                    self.cameras.append(t)
-
-class USDExporter:
-    def __init__(self, obj_name, output_dir):
-        self.obj_name = obj_name
-        self.output_dir = output_dir
-
-    def export_geo(self, full_obj_path, frame_range=None):
-        file_name = f"{self.obj_name}.usda"
-        export_path = os.path.join(self.output_dir, file_name)
-        cmds.select(full_obj_path, replace=True)
-        cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", frameRange=(frame_range[0], frame_range[1]))
-        
-        return export_path
-        
-    def export_light(self, full_obj_path, frame_range=None):
-        file_name = f"{self.obj_name}.usda"
-        export_path = os.path.join(self.output_dir, file_name)
-        cmds.select(full_obj_path, replace=True)
-        cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", frameRange=(frame_range[0], frame_range[1]))
-
-        print(f"# ライトは正常に書き出されました: {export_path}")
-        return export_path
-
-    def export_cam(self, full_obj_path, frame_range=None):
-        file_name = f"{self.obj_name}.usda"
-        export_path = os.path.join(self.output_dir, file_name)
-        cmds.select(full_obj_path, replace=True)
-        cmds.mayaUSDExport(file=export_path, selection=True, shadingMode="none", frameRange=(frame_range[0], frame_range[1]))
-
-        print(f"# カメラは正常に書き出されました: {export_path}")
-        return export_path
-
-
-
-
-def write_combine_usd(
-    file_info_list,
-    output_dir,
-    combine_filename="combine_geo.usda",
-    root_name="Root",
-    kind="geo",
-    add_prim_path=False):
-    lines = [
-        '#usda 1.0',
-        f'def Xform "{root_name}" {{'
-    ]
-
-    for name, path in file_info_list:
-        rel_path = path if add_prim_path else os.path.basename(path)
-        mtl_rel = f"{name}_mtl.usda" if kind == "geo" else ""
-
-        lines.append(f'    def "{name}"')
-        lines.append('    (')
-        lines.append('        kind = "component"')
-        lines.append('        prepend references = [')
-
-        if add_prim_path:
-            lines.append(f'            @./{rel_path}@</{name}>')
-        else:
-            lines.append(f'            @./{rel_path}@')
-
-        lines.append('        ]')
-        lines.append('    ) {}')
-
-    lines.append('}')
-
-    combine_path = os.path.join(output_dir, combine_filename)
-    with open(combine_path, 'w', encoding='utf-8') as f:
-        f.write("\n".join(lines))
-
-    print(f"コンバインUSDは正常に書き出されました: {combine_path}")
-    return combine_path
-
-def write_houdini_loader_script(
-    geo_combine_list,
-    output_dir,
-    script_name="create_loader.py",
-    stage_path="/stage"):
-
-    lines = [
-        "import hou",
-        "",
-        "def create_loader():",
-        f'    stage = hou.node("{stage_path}")',
-        ""
-    ]
-    
-    prev_node_var = None
-    for i, (name, usd_path) in enumerate(geo_combine_list, start=1):
-        node_var = f"node{i}"
-        lines.append(f'    {node_var} = stage.createNode("sublayer", node_name="{name}_sublayer")')
-        lines.append(f'    {node_var}.parm("filepath1").set("{output_dir}'+"/"+f'{usd_path}")')
-        
-        if prev_node_var is not None:
-            lines.append(f'    {node_var}.setInput(0, {prev_node_var})')
-        prev_node_var = node_var
-
-    lines.append(f'    {prev_node_var}.setDisplayFlag(True)')
-    lines.append("    stage.layoutChildren()")
-    lines.append('create_loader()')
-
-    script_path = os.path.join(output_dir, script_name)
-    with open(script_path, 'w', encoding='utf-8') as f:
-        f.write("\n".join(lines))
-
-    print(f"Houdini loader script written to: {script_path}")
-
-
-
-
-def execution(output_dir, export_houdini_py=False, frame_range=None):
-    selected_groups = cmds.ls(selection=True, long=True, type="transform")
-    if not selected_groups:
-        cmds.warning("グループが選択されていません。")
-        return
-
-    geo_combine_list = []
-
-    for group in selected_groups:
-        group_name = group.split('|')[-1]
-
-        descendants = cmds.listRelatives(group, allDescendents=True, fullPath=True) or []
-        mesh_transforms = []
-        for d in descendants:
-            if cmds.nodeType(d) == "mesh":
-                parent = cmds.listRelatives(d, parent=True, fullPath=True)[0]
-                if parent not in mesh_transforms:
-                    mesh_transforms.append(parent)
+# Maya-side export steps run inside this budget before returning to the event loop
+STEP_BUDGET_SEC = 0.05
+# Scene events arriving within this window (e.g. every frame during playback) cause one refresh
+REFRESH_DEBOUNCE_MS = 200
+# Live sync waits this long after the last edit, so a drag or a burst of edits is exported once
+LIVE_SYNC_DELAY_MS = 500
 
-        if not mesh_transforms:
-            print(f"[{group_name}] にメッシュが見つかりませんでした。スキップします。")
-            continue
 
-        group_output_dir = os.path.join(output_dir, group_name)
-        os.makedirs(group_output_dir, exist_ok=True)
+def maya_main_window():
+    return wrapInstance(int(omui.MQtUtil.mainWindow()), QWidget)
 
-        # Write each mesh
-        exported_files = []
-        for mesh in mesh_transforms:
-            mesh_name = mesh.split('|')[-1]
-            exporter = USDExporter(mesh_name, group_output_dir)
-            file_path = exporter.export_geo(mesh, frame_range=frame_range)
-            # exporter.write_materialx_usd(mesh)
-            exported_files.append((mesh_name, file_path))
 
-        combine_name = f"{group_name}_combine.usda"
-        write_combine_usd(exported_files, group_output_dir, combine_filename=combine_name, root_name=group_name)
-        combine_path = f"{group_name}/{combine_name}" 
-        geo_combine_list.append((group_name, combine_path))
+class SceneEventSubscriptions(QObject):
+    """scriptJobとAPIのメッセージコールバックをまとめて管理し、続けて届くイベントを1回の更新にまとめる
+
+    ウィジェットが非表示の間は更新を保留し、再表示されたときに1回だけ実行する。
+    """
+    live_jobs = set()
+
+    def __init__(self, widget, callback, delay_ms=REFRESH_DEBOUNCE_MS):
+        super().__init__(widget)
+        self.widget = widget
+        self.callback = callback
+        self.jobs = []
+        self.callback_ids = []
+        self.dirty = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def subscribe(self, **kwargs):
+        """eventやattributeChangeなどscriptJobのフラグを1つ渡す"""
+        (flag, target), = kwargs.items()
+        job = cmds.scriptJob(**{flag: [target, self.notify]}, protected=True)
+        self.jobs.append(job)
+        SceneEventSubscriptions.live_jobs.add(job)
+        return job
+
+    def subscribe_message(self, add_callback, *args):
+        """scriptJobのイベントがない変更 (ノードの削除など) はOpenMayaのメッセージで受ける
+
+            subscribe_message(om.MDGMessage.addNodeRemovedCallback, "dagNode")
+        """
+        callback_id = add_callback(self.notify, *args)
+        self.callback_ids.append(callback_id)
+        return callback_id
+
+    def notify(self, *args):
+        self.dirty = True
+        if self.widget.isVisible():
+            self.timer.start()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.callback()
 
-    classifier_all = SceneClassifier()
-    classifier_all.selected = cmds.ls(selection=True, type="transform")
-    classifier_all.classify()
+    def resume(self):
+        if self.dirty:
+            self.timer.start()
 
-    # Light
-    light_exported = []
+    def clear(self):
+        self.timer.stop()
+        for job in self.jobs:
+            if cmds.scriptJob(exists=job):
+                cmds.scriptJob(kill=job, force=True)
+            SceneEventSubscriptions.live_jobs.discard(job)
+        self.jobs = []
+        if self.callback_ids:
+            om.MMessage.removeCallbacks(self.callback_ids)
+        self.callback_ids = []
 
-    if classifier_all.lights:
-        light_folder = os.path.join(output_dir, "Lights")
-        os.makedirs(light_folder, exist_ok=True)
-    
-        for light in classifier_all.lights:
-            light_name = light.split('|')[-1]
-            exporter = USDExporter(light_name, light_folder)
-            light_path = exporter.export_light(light, frame_range=frame_range)
-            light_exported.append((light_name, light_path))
-    
-        if light_exported:
-            rel_light_exported = []
-            for name, abs_path in light_exported:
-                rel_path = os.path.relpath(abs_path, output_dir).replace("\\", "/")
-                rel_light_exported.append((name, rel_path))
-    
-            write_combine_usd(
-                rel_light_exported,
-                output_dir,
-                combine_filename="combine_light.usda",
-                root_name="Root",
-                kind="light",
-                add_prim_path=True
-            )
-    # Camera
-    cam_exported = []
-    
-    if classifier_all.cameras:
-        cam_folder = os.path.join(output_dir, "Cameras")
-        os.makedirs(cam_folder, exist_ok=True)
-    
-        for cam in classifier_all.cameras:
-            cam_name = cam.split('|')[-1]  
-            exporter = USDExporter(cam_name, cam_folder)
-            cam_path = exporter.export_cam(cam, frame_range=frame_range) 
-            cam_exported.append((cam_name, cam_path))
-    
-        if cam_exported:
-            rel_cam_exported = []
-            for name, abs_path in cam_exported:
-                rel_path = os.path.relpath(abs_path, output_dir).replace("\\", "/")
-                rel_cam_exported.append((name, rel_path))
-    
-            write_combine_usd(
-                rel_cam_exported,
-                output_dir,
-                combine_filename="combine_cam.usda",
-                root_name="Root",
-                kind="cam",
-                add_prim_path=True
-            )
-
-    # All geo combine USD
-    if geo_combine_list:
-        write_combine_usd(
-            geo_combine_list,
-            output_dir,
-            combine_filename="geo_combine.usda",
-            root_name="Root",
-            kind="scene",
-            add_prim_path=True
-        )
-        
-    # python  
-    if geo_combine_list and export_houdini_py:
-        write_houdini_loader_script(
-            geo_combine_list,
-            output_dir,
-            script_name="houdini_loader.py",
-            stage_path="/stage"
-        )
-
-
-class MaterialXExporter:
-    def __init__(self):
-        pass
-
-    def get_assigned_material(self, obj):
-        shapes = cmds.listRelatives(obj, shapes=True, fullPath=True) or []
-        for shape in shapes:
-            sg = cmds.listConnections(shape, type="shadingEngine")
-            if sg:
-                materials = cmds.ls(cmds.listConnections(sg), materials=True)
-                if materials:
-                    return materials
-        return []
-
-    def get_texture_path(self, material, attr):
-        if attr == "normalCamera":
-            normal_nodes = cmds.listConnections(f"{material}.{attr}", type="aiNormalMap") or []
-            for normal_node in normal_nodes:
-                file_nodes = cmds.listConnections(f"{normal_node}.input", type="file") or []
-                for file_node in file_nodes:
-                    return cmds.getAttr(f"{file_node}.fileTextureName")
-
-            bump_nodes = cmds.listConnections(f"{material}.{attr}", type="bump2d") or []
-            for bump_node in bump_nodes:
-                file_nodes = cmds.listConnections(f"{bump_node}.bumpValue", type="file") or []
-                for file_node in file_nodes:
-                    return cmds.getAttr(f"{file_node}.fileTextureName")
-        else:
-            file_nodes = cmds.listConnections(f"{material}.{attr}", type="file") or []
-            for file_node in file_nodes:
-                return cmds.getAttr(f"{file_node}.fileTextureName")
-        return None
-
-    def get_input_value(self, material, attr, default):
-        """デフォルト値と異なる値を返す（floatやcolor3）"""
-        try:
-            value = cmds.getAttr(f"{material}.{attr}")
-            if isinstance(value, list):
-                value = value[0] 
-            if value != default:
-                return value
-        except:
-            pass
-        return None
-
-    def write_materialx(self, obj, output_dir=None):
-        material_list = self.get_assigned_material(obj)
-        if not material_list:
-            print(f"# Warning: マテリアルが割り当てられていません: {obj}")
-            return None
-    
-        mat = material_list[0]
-        shader_name = f"SR_{mat}"
-        graph_name = f"NG_{mat}"
-    
-        base_color_path = self.get_texture_path(mat, "baseColor")
-        roughness_path = self.get_texture_path(mat, "specularRoughness")
-        metalness_path = self.get_texture_path(mat, "metalness")
-        normal_path = self.get_texture_path(mat, "normalCamera")
-        transmission_path = self.get_texture_path(mat, "transmission")
-        coat_path = self.get_texture_path(mat, "coat")
-    
-        base_color_value = self.get_input_value(mat, "baseColor", (0.8, 0.8, 0.8))
-        roughness_value = self.get_input_value(mat, "specularRoughness", 0.2)
-        metalness_value = self.get_input_value(mat, "metalness", 0.0)
-        transmission_value = self.get_input_value(mat, "transmission", 0.0)
-        coat_value = self.get_input_value(mat, "coat", 0.0)
-    
-        lines = [
-            '<?xml version="1.0" encoding="utf-8"?>',
-            '<materialx version="1.38">',
-            f'  <nodegraph name="{graph_name}">'
-        ]
-    
-        if base_color_path:
-            lines.append(f'    <image name="baseColor_tex" type="color3">')
-            lines.append(f'      <input name="file" type="filename" value="{base_color_path}" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="base_color_output" type="color3" nodename="baseColor_tex" />')
-        elif base_color_value:
-            r, g, b = base_color_value
-            lines.append(f'    <constant name="baseColor_val" type="color3">')
-            lines.append(f'      <input name="value" type="color3" value="{r},{g},{b}" />')
-            lines.append(f'    </constant>')
-            lines.append(f'    <output name="base_color_output" type="color3" nodename="baseColor_val" />')
-    
-        if roughness_path:
-            lines.append(f'    <image name="roughness_tex" type="float">')
-            lines.append(f'      <input name="file" type="filename" value="{roughness_path}" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="roughness_output" type="float" nodename="roughness_tex" />')
-        elif roughness_value is not None:
-            lines.append(f'    <constant name="roughness_val" type="float">')
-            lines.append(f'      <input name="value" type="float" value="{roughness_value}" />')
-            lines.append(f'    </constant>')
-            lines.append(f'    <output name="roughness_output" type="float" nodename="roughness_val" />')
-    
-        if metalness_path:
-            lines.append(f'    <image name="metalness_tex" type="float">')
-            lines.append(f'      <input name="file" type="filename" value="{metalness_path}" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="metalness_output" type="float" nodename="metalness_tex" />')
-        elif metalness_value is not None:
-            lines.append(f'    <constant name="metalness_val" type="float">')
-            lines.append(f'      <input name="value" type="float" value="{metalness_value}" />')
-            lines.append(f'    </constant>')
-            lines.append(f'    <output name="metalness_output" type="float" nodename="metalness_val" />')
-
-        if transmission_path:
-            lines.append(f'    <image name="transmission_tex" type="float">')
-            lines.append(f'      <input name="file" type="filename" value="{transmission_path}" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="transmission_output" type="float" nodename="transmission_tex" />')
-        elif transmission_value is not None:
-            lines.append(f'    <constant name="transmission_val" type="float">')
-            lines.append(f'      <input name="value" type="float" value="{transmission_value}" />')
-            lines.append(f'    </constant>')
-            lines.append(f'    <output name="transmission_output" type="float" nodename="transmission_val" />')
-
-        if coat_path:
-            lines.append(f'    <image name="coat_tex" type="float">')
-            lines.append(f'      <input name="file" type="filename" value="{coat_path}" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="coat_output" type="float" nodename="coat_tex" />')
-        elif coat_value is not None:
-            lines.append(f'    <constant name="coat_val" type="float">')
-            lines.append(f'      <input name="value" type="float" value="{coat_value}" />')
-            lines.append(f'    </constant>')
-            lines.append(f'    <output name="coat_output" type="float" nodename="coat_val" />')
-  
-        if normal_path:
-            lines.append(f'    <texcoord name="st" type="vector2" />')
-            lines.append(f'    <image name="normal_tex" type="vector3" GLSLFX_usage="normal">')
-            lines.append(f'      <input name="file" type="filename" value="{normal_path}" />')
-            lines.append(f'      <input name="texcoord" type="vector2" nodename="st" />')
-            lines.append(f'    </image>')
-            lines.append(f'    <output name="normal_output" type="vector3" nodename="normal_tex" />')
-    
-        lines.append(f'  </nodegraph>')
-        lines.append(f'  <standard_surface name="{shader_name}" type="surfaceshader">')
-    
-        if base_color_path or base_color_value:
-            lines.append(f'    <input name="base_color" type="color3" output="base_color_output" nodegraph="{graph_name}" />')
-        if roughness_path or roughness_value is not None:
-            lines.append(f'    <input name="specular_roughness" type="float" output="roughness_output" nodegraph="{graph_name}" />')
-        if metalness_path or metalness_value is not None:
-            lines.append(f'    <input name="metalness" type="float" output="metalness_output" nodegraph="{graph_name}" />')
-        if transmission_path or transmission_value is not None:
-            lines.append(f'    <input name="transmission" type="float" output="transmission_output" nodegraph="{graph_name}" />')
-        if coat_path or coat_value is not None:
-            lines.append(f'    <input name="coat" type="float" output="coat_output" nodegraph="{graph_name}" />')
-        if normal_path:
-            lines.append(f'    <input name="normal" type="vector3" output="normal_output" nodegraph="{graph_name}" />')
-    
-        lines.append(f'  </standard_surface>')
-        lines.append(f'  <surfacematerial name="{mat}" type="material">')
-        lines.append(f'    <input name="surfaceshader" type="surfaceshader" nodename="{shader_name}" />')
-        lines.append(f'  </surfacematerial>')
-        lines.append('</materialx>')
-    
-        if output_dir:
-            filepath = os.path.join(output_dir, f"{mat}.mtlx")
-        else:
-            first_path = base_color_path or roughness_path or metalness_path or normal_path
-            outdir = os.path.dirname(first_path) if first_path else "C:/temp"
-            filepath = os.path.join(outdir, f"{mat}.mtlx")
-    
-        try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write("\n".join(lines))
-            print(f"MaterialXを書き出しました: {filepath}")
-        except Exception as e:
-            print(f"# Error: 書き出しに失敗しました: {e}")
-            return None
-    
-        return os.path.dirname(filepath)
 
-def maya_main_window():
-    return wrapInstance(int(omui.MQtUtil.mainWindow()), QWidget)
+def count_live_script_jobs():
+    """このツールが登録し、まだ残っているscriptJobの数"""
+    return sum(1 for job in SceneEventSubscriptions.live_jobs if cmds.scriptJob(exists=job))
 
 # USD Exporter tab
 class USDExporterTab(QWidget):
@@ -457,11 +110,31 @@ class USDExporterTab(QWidget):
         super().__init__(parent)
         self.output_dir = ""
         self.double2_values = [1.0, 1.0]
+        self.job = None
+        self.job_steps = None
+        self.snapshot = None
+        self.live_sync = None
+        self.step_timer = QTimer(self)
+        self.step_timer.timeout.connect(self.run_export_steps)
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.timeout.connect(self.run_live_sync)
         self.init_ui()
-        self.time_job   = cmds.scriptJob(event=["timeChanged", self.update_double_inputs], protected=True)
-        self.render_job_start = cmds.scriptJob(attributeChange=["defaultRenderGlobals.startFrame", self.update_double_inputs],protected=True)
-        self.render_job_end = cmds.scriptJob(attributeChange=["defaultRenderGlobals.endFrame", self.update_double_inputs],protected=True)
-        self.slider_job = cmds.scriptJob(event=["playbackRangeChanged", self.update_double_inputs], protected=True)
+        self.subscriptions = SceneEventSubscriptions(self, self.update_double_inputs)
+        self.subscriptions.subscribe(event="timeChanged")
+        self.subscriptions.subscribe(event="playbackRangeChanged")
+        self.subscriptions.subscribe(attributeChange="defaultRenderGlobals.startFrame")
+        self.subscriptions.subscribe(attributeChange="defaultRenderGlobals.endFrame")
+        # Structural edits make the cached snapshot of the dry run stale
+        self.snapshot_subscriptions = SceneEventSubscriptions(self, self.invalidate_snapshot)
+        for event in ("SceneOpened", "NewSceneOpened", "DagObjectCreated", "NameChanged", "Undo"):
+            self.snapshot_subscriptions.subscribe(event=event)
+        # Deletions and reparenting have no scriptJob event
+        self.snapshot_subscriptions.subscribe_message(om.MDGMessage.addNodeRemovedCallback, "dagNode")
+        self.snapshot_subscriptions.subscribe_message(om.MDagMessage.addAllDagChangesCallback)
+        # New or deleted keys and deformers change connections but not the hierarchy
+        self.animation_subscriptions = SceneEventSubscriptions(self, self.forget_snapshot_animation)
+        self.animation_subscriptions.subscribe_message(om.MDGMessage.addConnectionCallback)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -519,15 +192,128 @@ class USDExporterTab(QWidget):
         self.houdini_py_checkbox = QCheckBox("Houdini用Pythonを書き出す")
         self.houdini_py_checkbox.setChecked(False)
 
+        loader_layout = QHBoxLayout()
+        self.loader_combo = QComboBox()
+        self.loader_combo.addItem("グループごとのsublayerを連結", "chain")
+        self.loader_combo.addItem("1つのsublayerで読み込み、マスクで切り替え", "single")
+        self.loader_combo.addItem("1つのsublayerで読み込み、グループは遅延ロード", "lazy")
+        loader_layout.addWidget(QLabel("Houdiniローダー"))
+        loader_layout.addWidget(self.loader_combo)
+
+        self.batch_checkbox = QCheckBox("グループ内のメッシュをまとめて書き出す")
+        self.batch_checkbox.setChecked(False)
+
+        self.incremental_checkbox = QCheckBox("変更のあるアセットのみ書き出す")
+        self.incremental_checkbox.setChecked(False)
+
+        self.static_checkbox = QCheckBox("動きのないアセットはタイムサンプルなしで書き出す")
+        self.static_checkbox.setChecked(True)
+
+        self.instance_checkbox = QCheckBox("同じ形状のメッシュはインスタンスとして書き出す")
+        self.instance_checkbox.setChecked(False)
+
+        self.payload_checkbox = QCheckBox("グループとアセットをペイロードとして参照する (遅延ロード)")
+        self.payload_checkbox.setChecked(False)
+
+        self.usdz_checkbox = QCheckBox("アセットをUSDZにもパッケージする")
+        self.usdz_checkbox.setChecked(False)
+
+        self.reduce_checkbox = QCheckBox("タイムサンプルを許容誤差内で間引く")
+        self.reduce_checkbox.setChecked(False)
+
+        self.profile_checkbox = QCheckBox("プロファイルを記録する")
+        self.profile_checkbox.setChecked(False)
+
+        staging_layout = QHBoxLayout()
+        self.staging_checkbox = QCheckBox("ローカルに書き出してから書き出し先へ転送する")
+        self.staging_checkbox.setChecked(False)
+        self.streams_spinbox = QSpinBox()
+        self.streams_spinbox.setRange(1, 32)
+        self.streams_spinbox.setValue(4)
+        staging_layout.addWidget(self.staging_checkbox)
+        staging_layout.addWidget(QLabel("転送の並列数"))
+        staging_layout.addWidget(self.streams_spinbox)
+
+        format_layout = QHBoxLayout()
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("自動 (ジオメトリはUSDC)", None)
+        self.format_combo.addItem("USDA (テキスト)", "usda")
+        self.format_combo.addItem("USDC (バイナリ)", "usdc")
+        format_layout.addWidget(QLabel("ファイル形式"))
+        format_layout.addWidget(self.format_combo)
+
+        clip_layout = QHBoxLayout()
+        self.clip_spinbox = QSpinBox()
+        self.clip_spinbox.setRange(0, 100000)
+        self.clip_spinbox.setValue(0)
+        self.clip_spinbox.setSpecialValueText("無効")
+        clip_layout.addWidget(QLabel("クリップ分割フレーム数"))
+        clip_layout.addWidget(self.clip_spinbox)
+
+        worker_layout = QHBoxLayout()
+        self.worker_spinbox = QSpinBox()
+        self.worker_spinbox.setRange(1, os.cpu_count() or 1)
+        self.worker_spinbox.setValue(1)
+        # The profiler only sees this process, so it cannot cover the workers
+        self.worker_spinbox.valueChanged.connect(lambda workers: self.profile_checkbox.setEnabled(workers == 1))
+        worker_layout.addWidget(QLabel("並列ワーカー数 (mayapy)"))
+        worker_layout.addWidget(self.worker_spinbox)
+
         self.export_btn = QPushButton("USDを書き出す")
         self.export_btn.clicked.connect(self.export_usd)
+        self.dry_run_btn = QPushButton("ドライラン (書き出し計画と見積もり)")
+        self.dry_run_btn.clicked.connect(self.dry_run)
+        self.plan_label = QLabel("")
+        self.plan_label.setWordWrap(True)
+
+        live_layout = QHBoxLayout()
+        self.live_checkbox = QCheckBox("ライブ同期 (編集されたアセットを自動で書き出す)")
+        self.live_checkbox.setChecked(False)
+        self.live_checkbox.toggled.connect(self.toggle_live_sync)
+        self.live_materials_checkbox = QCheckBox("マテリアルも同期する")
+        self.live_materials_checkbox.setChecked(False)
+        live_layout.addWidget(self.live_checkbox)
+        live_layout.addWidget(self.live_materials_checkbox)
+        self.live_label = QLabel("")
+
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        self.cancel_btn = QPushButton("キャンセル")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_export)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_btn)
+        self.progress_label = QLabel("")
+        self.profile_label = QLabel("")
+        self.profile_label.setWordWrap(True)
 
         layout.addLayout(radio_layout)
         layout.addLayout(double_layout)
         layout.addWidget(self.folder_btn)
         layout.addWidget(self.folder_label)
         layout.addWidget(self.houdini_py_checkbox)
+        layout.addLayout(loader_layout)
+        layout.addWidget(self.batch_checkbox)
+        layout.addWidget(self.incremental_checkbox)
+        layout.addWidget(self.static_checkbox)
+        layout.addWidget(self.instance_checkbox)
+        layout.addWidget(self.payload_checkbox)
+        layout.addWidget(self.usdz_checkbox)
+        layout.addWidget(self.reduce_checkbox)
+        layout.addWidget(self.profile_checkbox)
+        layout.addLayout(staging_layout)
+        layout.addLayout(format_layout)
+        layout.addLayout(clip_layout)
+        layout.addLayout(worker_layout)
+        layout.addWidget(self.dry_run_btn)
+        layout.addWidget(self.plan_label)
         layout.addWidget(self.export_btn)
+        layout.addLayout(live_layout)
+        layout.addWidget(self.live_label)
+        layout.addLayout(progress_layout)
+        layout.addWidget(self.progress_label)
+        layout.addWidget(self.profile_label)
 
     def update_double_inputs(self):
         if self.radio1.isChecked():  # Current Frame
@@ -563,9 +349,95 @@ class USDExporterTab(QWidget):
         return [start, end]
 
 
+    def shutdown(self):
+        self.cancel_export()
+        self.live_checkbox.setChecked(False)
+        self.subscriptions.clear()
+        self.snapshot_subscriptions.clear()
+        self.animation_subscriptions.clear()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.subscriptions.resume()
+        self.snapshot_subscriptions.resume()
+        self.animation_subscriptions.resume()
+
+    def invalidate_snapshot(self):
+        self.snapshot = None
+
+    def forget_snapshot_animation(self):
+        if self.snapshot is not None:
+            self.snapshot.forget_animation()
+
+    def dry_run(self):
+        """キャッシュしたシーンの写しから書き出し計画を立て、見積もりを表示する"""
+        start = time.perf_counter()
+        # Edits made within the debounce window have not invalidated the snapshot yet
+        self.snapshot_subscriptions.flush()
+        self.animation_subscriptions.flush()
+        if self.snapshot is None or not self.snapshot.is_current():
+            self.snapshot = SceneSnapshot()
+        self.snapshot.forget_mesh_sizes()
+        plan = plan_from_selection(self.output_dir, frame_range=self.get_frame_range(),
+                                   file_format=self.format_combo.currentData(),
+                                   detect_static=self.static_checkbox.isChecked(), snapshot=self.snapshot)
+        if plan is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.plan_label.setText(f"{plan.summary()}\n(計画 {elapsed_ms:.0f} ms)")
+
+    def toggle_live_sync(self, checked):
+        if not checked:
+            self.live_timer.stop()
+            if self.live_sync is not None:
+                self.live_sync.stop()
+                self.live_sync = None
+                self.live_label.setText("")
+            return
+        if not self.output_dir:
+            cmds.warning("書き出し先フォルダを選択してください。")
+            self.live_checkbox.setChecked(False)
+            return
+        self.live_sync = LiveSync.from_selection(
+            self.output_dir, frame_range=tuple(self.get_frame_range()), file_format=self.format_combo.currentData(),
+            detect_static=self.static_checkbox.isChecked(), use_payloads=self.payload_checkbox.isChecked(),
+            export_houdini_py=self.houdini_py_checkbox.isChecked(), houdini_loader=self.loader_combo.currentData(),
+            materials=self.live_materials_checkbox.isChecked(), on_change=self.schedule_live_sync,
+            batch_export=self.batch_checkbox.isChecked(), clip_frames=self.clip_spinbox.value() or None,
+            instance_duplicates=self.instance_checkbox.isChecked(),
+            sample_tolerances={} if self.reduce_checkbox.isChecked() else None)
+        if self.live_sync is None:
+            self.live_checkbox.setChecked(False)
+            return
+        self.live_sync.start()
+
+    def schedule_live_sync(self):
+        # Restarting the single-shot timer debounces bursts of edits
+        self.live_timer.start(LIVE_SYNC_DELAY_MS)
+
+    def run_live_sync(self):
+        """アイドル時にキューを予算内で書き出し、残りがあればすぐに続ける"""
+        if self.live_sync is None:
+            return
+        if self.job is not None or cmds.play(q=True, state=True):
+            # Exports would fight the full export or stall playback; try again after the delay
+            self.live_timer.start(LIVE_SYNC_DELAY_MS)
+            return
+        try:
+            count = self.live_sync.process(budget=STEP_BUDGET_SEC)
+        except Exception:
+            self.live_checkbox.setChecked(False)
+            self.live_label.setText("ライブ同期に失敗しました。スクリプトエディタを確認してください。")
+            raise
+        pending = self.live_sync.pending
+        if pending:
+            self.live_label.setText(f"ライブ同期: 残り{pending}個")
+            self.live_timer.start(0)
+        elif count:
+            self.live_label.setText(f"ライブ同期: {time.strftime('%H:%M:%S')} に更新しました")
+
     def closeEvent(self, event):
-        if hasattr(self, "slider_job") and cmds.scriptJob(exists=self.slider_job):
-            cmds.scriptJob(kill=self.slider_job, force=True)
+        self.shutdown()
         super().closeEvent(event)
     
         
@@ -579,13 +451,91 @@ class USDExporterTab(QWidget):
         if not self.output_dir:
             cmds.warning("書き出し先フォルダを選択してください。")
             return
-        classifier = SceneClassifier()
-        classifier.classify()
-        
+        if self.job is not None:
+            cmds.warning("書き出し中です。")
+            return
+        if (self.houdini_py_checkbox.isChecked() and self.loader_combo.currentData() == "lazy"
+                and not self.payload_checkbox.isChecked()):
+            cmds.warning("遅延ロードのHoudiniローダーには、ペイロードとして参照する設定が必要です。")
+            return
+
         frame_range = self.get_frame_range()
         start_frame, end_frame = frame_range
+        staging = None
+        if self.staging_checkbox.isChecked():
+            staging = StagedOutput(self.output_dir, streams=self.streams_spinbox.value())
         
-        execution(self.output_dir, export_houdini_py=self.houdini_py_checkbox.isChecked(), frame_range=(start_frame, end_frame))
+        if self.worker_spinbox.value() > 1:
+            execution_parallel(self.output_dir, export_houdini_py=self.houdini_py_checkbox.isChecked(),
+                               frame_range=(start_frame, end_frame), batch_export=self.batch_checkbox.isChecked(),
+                               workers=self.worker_spinbox.value(), file_format=self.format_combo.currentData(),
+                               detect_static=self.static_checkbox.isChecked(), clip_frames=self.clip_spinbox.value() or None,
+                               instance_duplicates=self.instance_checkbox.isChecked(),
+                               use_payloads=self.payload_checkbox.isChecked(),
+                               houdini_loader=self.loader_combo.currentData(),
+                               incremental=self.incremental_checkbox.isChecked(),
+                               package_usdz=self.usdz_checkbox.isChecked(),
+                               sample_tolerances={} if self.reduce_checkbox.isChecked() else None, staging=staging)
+            return
+
+        self.job = ExportJob.from_selection(
+            self.output_dir, export_houdini_py=self.houdini_py_checkbox.isChecked(), frame_range=(start_frame, end_frame),
+            batch_export=self.batch_checkbox.isChecked(), incremental=self.incremental_checkbox.isChecked(),
+            file_format=self.format_combo.currentData(), detect_static=self.static_checkbox.isChecked(),
+            clip_frames=self.clip_spinbox.value() or None, instance_duplicates=self.instance_checkbox.isChecked(),
+            use_payloads=self.payload_checkbox.isChecked(), houdini_loader=self.loader_combo.currentData(),
+            package_usdz=self.usdz_checkbox.isChecked(), sample_tolerances={} if self.reduce_checkbox.isChecked() else None,
+            profile=self.profile_checkbox.isChecked(), staging=staging)
+        if self.job is None:
+            return
+        self.job_steps = self.job.run_steps()
+        self.progress_bar.setRange(0, max(self.job.progress.total, 1))
+        self.progress_bar.setValue(0)
+        self.export_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.step_timer.start(0)
+
+    def run_export_steps(self):
+        if self.job_steps is not None:
+            deadline = time.perf_counter() + STEP_BUDGET_SEC
+            try:
+                while time.perf_counter() < deadline:
+                    next(self.job_steps)
+            except StopIteration:
+                self.job_steps = None
+            except Exception:
+                self.job_steps = None
+                self.finish_export("書き出しに失敗しました。スクリプトエディタを確認してください。")
+                raise
+            self.progress_bar.setValue(self.job.progress.done)
+            self.progress_label.setText(self.job.progress.summary())
+            return
+
+        # Maya-side work is done; wait for the background writes without blocking the UI
+        if self.job.is_writing():
+            self.step_timer.setInterval(100)
+            self.progress_label.setText(f"{self.job.progress.summary()}  ファイル書き込み中...")
+            return
+        try:
+            self.job.wait()
+        finally:
+            self.finish_export("キャンセルしました。" if self.job.cancelled else "書き出しが完了しました。")
+
+    def cancel_export(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_btn.setEnabled(False)
+
+    def finish_export(self, message):
+        self.step_timer.stop()
+        if self.job is not None and self.job.profiler is not None:
+            self.job.profiler.deactivate()
+            self.profile_label.setText(self.job.profiler.summary())
+        self.job = None
+        self.job_steps = None
+        self.export_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.progress_label.setText(message)
 
     def close_window(self):
         self.parent().parent().close()
@@ -615,17 +565,37 @@ class MaterialXExporterTab(QWidget):
         self.select_output_button.setEnabled(False)
         self.select_output_button.clicked.connect(self.select_output_folder)
         self.folder_label = QLabel("未選択")
+
+        self.library_checkbox = QCheckBox("すべてのマテリアルを1つのライブラリに書き出す")
+        self.library_checkbox.setChecked(False)
+
+        self.mtlx_incremental_checkbox = QCheckBox("変更のないマテリアルはスキップする")
+        self.mtlx_incremental_checkbox.setChecked(False)
+
+        self.localize_checkbox = QCheckBox("テクスチャを出力先にまとめて相対パスにする")
+        self.localize_checkbox.setChecked(False)
+
+        self.mtlx_profile_checkbox = QCheckBox("プロファイルを記録する")
+        self.mtlx_profile_checkbox.setChecked(False)
+        self.mtlx_profile_label = QLabel("")
+        self.mtlx_profile_label.setWordWrap(True)
          
         # Layout
         layout.addWidget(self.custom_output_checkbox)
         layout.addWidget(self.select_output_button)
         layout.addWidget(self.folder_label)
+        layout.addWidget(self.library_checkbox)
+        layout.addWidget(self.mtlx_incremental_checkbox)
+        layout.addWidget(self.localize_checkbox)
+        layout.addWidget(self.mtlx_profile_checkbox)
         layout.addWidget(self.export_button)
         layout.addWidget(self.open_folder_button)
+        layout.addWidget(self.mtlx_profile_label)
                
 
     def export_materialx(self):
-        exporter = MaterialXExporter()
+        exporter = MaterialXExporter(incremental=self.mtlx_incremental_checkbox.isChecked(),
+                                     localize_textures=self.localize_checkbox.isChecked())
         selection = cmds.ls(selection=True, long=True)
     
         if not selection:
@@ -634,13 +604,29 @@ class MaterialXExporterTab(QWidget):
     
         manual_dir = getattr(self, 'manual_output_dir', None) if self.custom_output_checkbox.isChecked() else None
     
+        profiler = ExportProfiler().activate() if self.mtlx_profile_checkbox.isChecked() else None
         output_dirs = []
-        for obj in selection:
-            outdir = exporter.write_materialx(obj, manual_dir)
-            if outdir:
-                output_dirs.append(outdir)
+        try:
+            if self.library_checkbox.isChecked():
+                outdir = exporter.write_library(selection, manual_dir)
+                if outdir:
+                    output_dirs.append(outdir)
+            else:
+                for obj in selection:
+                    outdir = exporter.write_materialx(obj, manual_dir)
+                    if outdir and outdir not in output_dirs:
+                        output_dirs.append(outdir)
+            exporter.finish()
+        finally:
+            if profiler is not None:
+                profiler.deactivate()
         self.output_dirs = output_dirs
 
+        if profiler is not None:
+            if output_dirs:
+                profiler.write_report(manual_dir or output_dirs[0])
+            self.mtlx_profile_label.setText(profiler.summary())
+
             
     def toggle_custom_output(self):
         if self.custom_output_checkbox.isChecked():
@@ -697,6 +683,11 @@ class ExporterMainWindow(QDialog):
         main_layout.addWidget(self.tab_widget)
         main_layout.addWidget(close_button)
 
+    def closeEvent(self, event):
+        # Child tabs do not receive closeEvent when the window closes
+        self.usd_tab.shutdown()
+        super().closeEvent(event)
+
 
 # Callback GUI
 def show_exporter_gui():
@@ -710,5 +701,20 @@ def show_exporter_gui():
 
     win = ExporterMainWindow()
     win.show()
-    
-show_exporter_gui()
\ No newline at end of file
+
+
+def check_subscription_leaks(cycles=5):
+    """ウィンドウの開閉を繰り返し、残ったscriptJobの数を返す (0であること)"""
+    for _ in range(cycles):
+        show_exporter_gui()
+    for widget in QApplication.allWidgets():
+        if isinstance(widget, ExporterMainWindow):
+            widget.close()
+    leaked = count_live_script_jobs()
+    print(f"# 残っているscriptJob: {leaked} (開閉 {cycles}回)")
+    return leaked
+
+
+# Importing this module only defines the window; running it as a script opens it
+if __name__ == "__main__":
+    show_exporter_gui()
@@ -0,0 +1,31 @@
+"""mayapyで実行するヘッドレス書き出しワーカー
+
+    mayapy My_export_USD_Mtlx_worker.py <job.json> <result.json>
+"""
+import json
+import sys
+
+
+def main(argv):
+    job_path, result_path = argv[1], argv[2]
+    with open(job_path, encoding="utf-8") as f:
+        job = json.load(f)
+
+    import maya.standalone
+    maya.standalone.initialize(name="python")
+    try:
+        import maya.cmds as cmds
+        cmds.loadPlugin("mayaUsdPlugin", quiet=True)
+        cmds.file(job["scene"], open=True, force=True)
+
+        from My_export_USD_Mtlx_core import run_worker_tasks
+        results = run_worker_tasks(job)
+
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    finally:
+        maya.standalone.uninitialize()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
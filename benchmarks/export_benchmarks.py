@@ -0,0 +1,246 @@
+"""Maya (mayapy) とhythonで実行する、書き出し形式とローダーのベンチマーク
+
+    import export_benchmarks
+    export_benchmarks.benchmark_geo_export("D:/bench")
+    export_benchmarks.benchmark_usd_formats("D:/bench", hython="C:/.../Houdini 20.5/bin/hython.exe")
+
+シーンに bench_* のノードを作って計測し、終わると削除する。Mayaなしで計測するのは run_benchmarks.py。
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import maya.cmds as cmds
+from pxr import Sdf, Usd, UsdGeom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import My_export_USD_Mtlx_core as core  # noqa: E402
+
+
+def benchmark_geo_export(output_dir, mesh_counts=(10, 100, 500), frame_range=(1, 24)):
+    """メッシュ数ごとに1メッシュずつの書き出しとバッチ書き出しの時間を比較する"""
+    results = []
+    for count in mesh_counts:
+        group = cmds.group(empty=True, name=f"bench_geo_{count}")
+        for i in range(count):
+            cube = cmds.polyCube(name=f"bench_mesh_{count}_{i}")[0]
+            cmds.setKeyframe(cube, attribute="translateY", time=frame_range[0], value=0.0)
+            cmds.setKeyframe(cube, attribute="translateY", time=frame_range[1], value=float(i))
+            cmds.parent(cube, group)
+        mesh_transforms = cmds.listRelatives(group, children=True, fullPath=True, type="transform") or []
+
+        timings = {}
+        for mode, batch in (("per_mesh", False), ("batch", True)):
+            mode_dir = os.path.join(output_dir, f"bench_{count}", mode)
+            os.makedirs(mode_dir, exist_ok=True)
+            start = time.perf_counter()
+            core.export_group_meshes(mesh_transforms, mode_dir, frame_range=frame_range, batch_export=batch)
+            timings[mode] = time.perf_counter() - start
+
+        cmds.delete(group)
+        result = {"meshes": count, "per_mesh": timings["per_mesh"], "batch": timings["batch"],
+                  "speedup": timings["per_mesh"] / max(timings["batch"], 1e-9)}
+        results.append(result)
+        print(f"meshes={count:6d}  per_mesh={result['per_mesh']:8.2f}s  batch={result['batch']:8.2f}s  x{result['speedup']:.1f}")
+    return results
+
+
+STAGE_LOAD_SCRIPT = """import sys, time
+from pxr import Usd, UsdGeom
+start = time.perf_counter()
+stage = Usd.Stage.Open(sys.argv[1])
+for prim in stage.Traverse():
+    if prim.IsA(UsdGeom.Mesh):
+        attr = UsdGeom.Mesh(prim).GetPointsAttr()
+        for t in attr.GetTimeSamples() or [Usd.TimeCode.Default()]:
+            attr.Get(t)
+print(time.perf_counter() - start)
+"""
+
+
+def measure_stage_load(stage_path, hython=None):
+    """ステージを開いて全メッシュの全タイムサンプルを読む時間を計測する。hythonがあればHoudiniで計測する"""
+    if hython:
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False, encoding="utf-8") as f:
+            f.write(STAGE_LOAD_SCRIPT)
+        try:
+            proc = subprocess.run([hython, f.name, stage_path], stdout=subprocess.PIPE, text=True, check=True)
+            return float(proc.stdout.strip().splitlines()[-1])
+        finally:
+            os.remove(f.name)
+
+    start = time.perf_counter()
+    stage = Usd.Stage.Open(stage_path)
+    for prim in stage.Traverse():
+        if prim.IsA(UsdGeom.Mesh):
+            attr = UsdGeom.Mesh(prim).GetPointsAttr()
+            for t in attr.GetTimeSamples() or [Usd.TimeCode.Default()]:
+                attr.Get(t)
+    return time.perf_counter() - start
+
+
+def benchmark_usd_formats(output_dir, mesh_count=50, frame_range=(1, 100), hython=None):
+    """変形アニメーションのあるメッシュをUSDAとUSDCで書き出し、サイズと読み込み時間を比較する"""
+    group = cmds.group(empty=True, name="bench_format")
+    for i in range(mesh_count):
+        sphere = cmds.polySphere(name=f"bench_format_mesh_{i}", subdivisionsX=32, subdivisionsY=32)[0]
+        deformer, handle = cmds.nonLinear(sphere, type="sine")
+        cmds.setKeyframe(deformer, attribute="offset", time=frame_range[0], value=0.0)
+        cmds.setKeyframe(deformer, attribute="offset", time=frame_range[1], value=10.0)
+        cmds.parent(sphere, handle, group)
+    mesh_transforms = core.collect_mesh_transforms(group)
+
+    results = []
+    for file_format in ("usda", "usdc"):
+        format_dir = os.path.join(output_dir, "bench_format", file_format)
+        os.makedirs(format_dir, exist_ok=True)
+        start = time.perf_counter()
+        exported = core.export_group_meshes(mesh_transforms, format_dir, frame_range=frame_range, batch_export=True,
+                                            file_format=file_format)
+        export_time = time.perf_counter() - start
+        combine_path = core.write_combine_usd(exported, format_dir, combine_filename=f"bench_combine.{file_format}",
+                                              root_name="bench_format")
+
+        result = {"format": file_format, "meshes": len(exported), "export": export_time,
+                  "bytes": sum(os.path.getsize(path) for _, path in exported),
+                  "load": measure_stage_load(combine_path, hython=hython)}
+        results.append(result)
+        print(f"{file_format}  size={result['bytes'] / 1024 ** 2:8.2f}MB  export={export_time:7.2f}s  "
+              f"load={result['load']:7.2f}s")
+
+    cmds.delete(group)
+    return results
+
+
+STAGE_COMPOSE_SCRIPT = """import json, sys, time
+from pxr import Usd
+start = time.perf_counter()
+stage = Usd.Stage.Open(sys.argv[1], Usd.Stage.LoadAll if sys.argv[2] == "all" else Usd.Stage.LoadNone)
+prims = sum(1 for _ in stage.Traverse())
+seconds = time.perf_counter() - start
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+except ImportError:
+    peak = None
+print(json.dumps({"seconds": seconds, "prims": prims, "peak_memory_bytes": peak}))
+"""
+
+
+def measure_stage_composition(stage_path, load_all=True, python=None):
+    """ペイロードをロード/アンロードした状態でステージを合成し、時間・プリム数・最大メモリを返す
+
+    メモリはプロセス単位でしか測れないため、python (hythonなど) を渡すと別プロセスで計測する。
+    """
+    if python:
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False, encoding="utf-8") as f:
+            f.write(STAGE_COMPOSE_SCRIPT)
+        try:
+            proc = subprocess.run([python, f.name, stage_path, "all" if load_all else "none"],
+                                  stdout=subprocess.PIPE, text=True, check=True)
+            return json.loads(proc.stdout.strip().splitlines()[-1])
+        finally:
+            os.remove(f.name)
+
+    start = time.perf_counter()
+    stage = Usd.Stage.Open(stage_path, Usd.Stage.LoadAll if load_all else Usd.Stage.LoadNone)
+    prims = sum(1 for _ in stage.Traverse())
+    return {"seconds": time.perf_counter() - start, "prims": prims, "peak_memory_bytes": None}
+
+
+def benchmark_payload_composition(stage_path, python=None):
+    """ペイロードを全てロードした場合とアンロードした場合の合成コストを比較する"""
+    results = {}
+    for mode, load_all in (("loaded", True), ("unloaded", False)):
+        result = measure_stage_composition(stage_path, load_all=load_all, python=python)
+        results[mode] = result
+        memory = result["peak_memory_bytes"]
+        memory_text = f"{memory / 1024 ** 2:8.1f}MB" if memory else "       -"
+        print(f"{mode:8s}  compose={result['seconds']:7.3f}s  prims={result['prims']:7d}  peak={memory_text}")
+    return results
+
+
+LOADER_COOK_SCRIPT = """import json, runpy, sys, time
+import hou
+results = {}
+stage = hou.node("/stage")
+for mode, script in json.loads(sys.argv[1]).items():
+    for child in stage.children():
+        child.destroy()
+    runpy.run_path(script)
+    display = stage.displayNode()
+    start = time.perf_counter()
+    display.stage()
+    cook = time.perf_counter() - start
+    # Reloading the most upstream sublayer dirties everything below it
+    upstream = [node for node in stage.children() if node.type().name() == "sublayer"][0]
+    recook = None
+    if upstream.parm("reload") is not None:
+        upstream.parm("reload").pressButton()
+        start = time.perf_counter()
+        display.stage()
+        recook = time.perf_counter() - start
+    results[mode] = {"nodes": len(stage.children()), "cook": cook, "recook": recook}
+print(json.dumps(results))
+"""
+
+
+def write_benchmark_groups(output_dir, group_count):
+    """1つのキューブを持つグループのコンバインUSDをgroup_count個とgeo_combineを書き出す"""
+    geo_combine_list = []
+    for i in range(group_count):
+        name = f"bench_group_{i}"
+        group_dir = os.path.join(output_dir, name)
+        os.makedirs(group_dir, exist_ok=True)
+        layer = Sdf.Layer.CreateAnonymous(".usda")
+        Sdf.PrimSpec(layer, "cube", Sdf.SpecifierDef, "Cube")
+        layer.defaultPrim = "cube"
+        layer.Export(os.path.join(group_dir, "cube.usda"))
+        with contextlib.redirect_stdout(None):
+            core.write_combine_usd([("cube", "cube.usda")], group_dir, combine_filename=f"{name}_combine.usda",
+                                   root_name=name)
+        geo_combine_list.append((name, f"{name}/{name}_combine.usda"))
+    with contextlib.redirect_stdout(None):
+        core.write_combine_usd(geo_combine_list, output_dir, combine_filename="geo_combine.usda", kind="scene",
+                               add_prim_path=True)
+    return geo_combine_list
+
+
+def benchmark_houdini_loader(output_dir, group_counts=(10, 100, 500), hython=None):
+    """グループ数ごとに、連結したsublayerと1つのsublayerのローダーのクック時間をhythonで比較する"""
+    if not hython:
+        print("# hythonが指定されていないため、ローダーのクック時間は計測できません。")
+        return []
+    results = []
+    for count in group_counts:
+        bench_dir = os.path.join(output_dir, "bench_loader", str(count))
+        os.makedirs(bench_dir, exist_ok=True)
+        geo_combine_list = write_benchmark_groups(bench_dir, count)
+        scripts = {}
+        for mode in ("chain", "single"):
+            scripts[mode] = os.path.join(bench_dir, f"loader_{mode}.py")
+            with contextlib.redirect_stdout(None):
+                core.write_houdini_loader_script(geo_combine_list, bench_dir,
+                                                 script_name=os.path.basename(scripts[mode]), mode=mode,
+                                                 layer_files=["geo_combine.usda"])
+
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False, encoding="utf-8") as f:
+            f.write(LOADER_COOK_SCRIPT)
+        try:
+            proc = subprocess.run([hython, f.name, json.dumps(scripts)], stdout=subprocess.PIPE, text=True, check=True)
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        finally:
+            os.remove(f.name)
+
+        result = {"groups": count, **timings}
+        results.append(result)
+        for mode in ("chain", "single"):
+            timing = timings[mode]
+            recook = f"{timing['recook']:7.3f}s" if timing["recook"] is not None else "      -"
+            print(f"groups={count:5d}  {mode:6s}  nodes={timing['nodes']:4d}  cook={timing['cook']:7.3f}s  "
+                  f"recook={recook}")
+    return results
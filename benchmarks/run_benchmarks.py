@@ -0,0 +1,449 @@
+"""Mayaなしで書き出し処理の性能を計測するベンチマーク
+
+    python benchmarks/run_benchmarks.py --groups 10 --meshes 50 --output result.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+
+sim_maya の疑似 maya.cmds で合成したシーンに対して各処理を実行し、フェーズごとの時間と
+cmdsの呼び出し回数をJSONに書き出す。--baseline を指定するとそのシーン設定で計測し、
+呼び出し回数の増加や許容範囲を超えた時間の悪化、GUIの開閉で残ったscriptJobがあれば終了コード1を返す。
+pxr には usd-core を使う。GUIの確認には PySide6 を使い、なければ省略してSKIPPEDと表示し、終了コード2を返す。
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "sim_maya"), os.path.dirname(HERE)]
+
+from maya import _scene, cmds  # noqa: E402
+from pxr import Gf, Sdf, Vt  # noqa: E402
+import My_export_USD_Mtlx_core as core  # noqa: E402
+import export_benchmarks  # noqa: E402
+
+DEFAULT_CONFIG = {"groups": 10, "meshes": 50, "lights": 4, "cameras": 2, "materials": 20, "textures": 4,
+                  "animated": 0.2, "frame_range": [1, 24], "export_options": {}}
+# Per-export sleep for the pipeline phases
+PIPELINE_EXPORT_LATENCY = 0.002
+# Per-operation round trip of the simulated network share, and the transfer streams used against it
+SHARE_LATENCY = 0.0005
+STAGING_STREAMS = 4
+# Headless workers of the parallel phase
+PARALLEL_WORKERS = 2
+SIM_PYTHONPATH = os.pathsep.join([os.path.join(HERE, "sim_maya"), os.path.dirname(HERE)])
+# Window open/close cycles of the subscription leak check
+SUBSCRIPTION_CYCLES = 5
+# A production-sized deforming mesh for the time-sample reduction phase
+REDUCE_POINTS = 100000
+REDUCE_FRAMES = 96
+# Absolute slack so that phases of a few milliseconds do not fail on timer noise
+MIN_SLACK_SEC = 0.05
+# Imports the batch entry point in a fresh interpreter, as a farm job would
+COLD_START_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import My_export_USD_Mtlx_batch, My_export_USD_Mtlx_core\n"
+    "print(time.perf_counter() - start)\n"
+    "print(any(name.split('.')[0] in ('PySide6', 'shiboken6') for name in sys.modules))\n"
+)
+
+
+def measure(phases, name, func):
+    calls_before = _scene.CALLS.copy()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = func()
+    elapsed = time.perf_counter() - start
+    calls = dict(_scene.CALLS - calls_before)
+    phases[name] = {"seconds": round(elapsed, 4), "cmds_calls": sum(calls.values()),
+                    "cmds_by_command": dict(sorted(calls.items()))}
+    return value
+
+
+def measure_cold_start(phases):
+    env = dict(os.environ, PYTHONPATH=SIM_PYTHONPATH)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT], env=env, capture_output=True, text=True,
+                            check=True).stdout.split()
+    phases["cold_start"] = {"seconds": round(float(output[0]), 4),
+                            "process_seconds": round(time.perf_counter() - start, 4),
+                            "cmds_calls": 0, "cmds_by_command": {}, "qt_loaded": output[1] == "True"}
+
+
+def measure_subscription_leaks(phases):
+    """GUIの開閉を繰り返し、sim_mayaに残ったscriptJobとコールバックを数える。PySide6がなければ省略する"""
+    try:
+        from PySide6.QtWidgets import QApplication, QWidget
+    except ImportError:
+        print("# PySide6がないため、scriptJobのリークの確認を省略します")
+        phases["gui_subscriptions"] = {"seconds": 0.0, "cmds_calls": 0, "cmds_by_command": {}, "skipped": True}
+        return
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication([])
+    import My_export_USD_Mtlx_w6_GUI as gui
+    # Stands in for Maya's main window, which the sim does not have
+    host = QWidget()
+    callbacks_before = len(_scene.CALLBACKS)
+
+    def open_close():
+        for _ in range(SUBSCRIPTION_CYCLES):
+            window = gui.ExporterMainWindow(host)
+            window.show()
+            window.close()
+            window.deleteLater()
+            app.processEvents()
+    measure(phases, "gui_subscriptions", open_close)
+    phases["gui_subscriptions"].update(cycles=SUBSCRIPTION_CYCLES,
+                                       leaked_callbacks=len(_scene.CALLBACKS) - callbacks_before,
+                                       leaked_script_jobs=gui.count_live_script_jobs())
+    host.deleteLater()
+
+
+def measure_composition(phases, name, stage_path, load_all):
+    # A fresh interpreter per measurement so that peak memory belongs to this stage alone
+    result = export_benchmarks.measure_stage_composition(stage_path, load_all=load_all, python=sys.executable)
+    phases[name] = {"seconds": round(result["seconds"], 4), "cmds_calls": 0, "cmds_by_command": {},
+                    "prims": result["prims"], "peak_memory_bytes": result["peak_memory_bytes"]}
+
+
+class _SlowFile:
+    """バッファされたファイルのように、閉じるときと64KBごとの読み書きにだけ往復の時間がかかる"""
+
+    def __init__(self, file, latency):
+        self._file = file
+        self._latency = latency
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        time.sleep(self._latency * (len(data) >> 16))
+        return data
+
+    def write(self, data):
+        time.sleep(self._latency * (len(data) >> 16))
+        return self._file.write(data)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def close(self):
+        time.sleep(self._latency)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+@contextlib.contextmanager
+def simulated_share(root, latency):
+    """root以下へのファイル操作 (開く・読み書き・置き換え・USDの保存) ごとにlatencyだけ待つ
+
+    SMB/NFSの往復の代わり。Sdfを通らないUSDの読み込みなどは遅くならないので、直接書き出しには控えめに効く。
+    """
+    root = os.path.abspath(root)
+
+    def slow(path):
+        try:
+            slow_path = os.path.abspath(os.fspath(path)).startswith(root)
+        except TypeError:
+            return False
+        if slow_path:
+            time.sleep(latency)
+        return slow_path
+
+    originals = [(builtins, "open", builtins.open), (os, "replace", os.replace), (os, "makedirs", os.makedirs),
+                 (os, "remove", os.remove), (Sdf.Layer, "Export", Sdf.Layer.Export),
+                 (Sdf.Layer, "Save", Sdf.Layer.Save), (Sdf.Layer, "Reload", Sdf.Layer.Reload),
+                 (Sdf.Layer, "FindOrOpen", Sdf.Layer.FindOrOpen),
+                 (Sdf.Layer, "OpenAsAnonymous", Sdf.Layer.OpenAsAnonymous)]
+    open_file, replace, makedirs, remove, export, save, reload_layer, find_or_open, open_anonymous = \
+        [original for _, _, original in originals]
+
+    def slow_open(file, *args, **kwargs):
+        f = open_file(file, *args, **kwargs)
+        return _SlowFile(f, latency) if slow(file) else f
+
+    builtins.open = slow_open
+    os.replace = lambda src, dst, **kwargs: (slow(dst), replace(src, dst, **kwargs))[1]
+    os.makedirs = lambda name, *args, **kwargs: (slow(name), makedirs(name, *args, **kwargs))[1]
+    os.remove = lambda path, **kwargs: (slow(path), remove(path, **kwargs))[1]
+    Sdf.Layer.Export = lambda layer, path, *args, **kwargs: (slow(path), export(layer, path, *args, **kwargs))[1]
+    Sdf.Layer.Save = lambda layer, *args, **kwargs: (slow(layer.realPath), save(layer, *args, **kwargs))[1]
+    Sdf.Layer.Reload = lambda layer, *args, **kwargs: (slow(layer.realPath), reload_layer(layer, *args, **kwargs))[1]
+    Sdf.Layer.FindOrOpen = staticmethod(lambda path, *args, **kwargs: (slow(path), find_or_open(path, *args, **kwargs))[1])
+    Sdf.Layer.OpenAsAnonymous = staticmethod(
+        lambda path, *args, **kwargs: (slow(path), open_anonymous(path, *args, **kwargs))[1])
+    try:
+        yield
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def write_point_animation(path):
+    """止めと直線の移動を繰り返す、REDUCE_POINTS点のメッシュのpointsのレイヤーを書き出す"""
+    rng = random.Random(0)
+    base = Vt.Vec3fArray([Gf.Vec3f(rng.random(), rng.random(), rng.random()) for _ in range(REDUCE_POINTS)])
+    layer = Sdf.Layer.CreateNew(path)
+    prim = Sdf.CreatePrimInLayer(layer, "/mesh")
+    prim.specifier = Sdf.SpecifierDef
+    prim.typeName = "Mesh"
+    points = Sdf.AttributeSpec(prim, "points", Sdf.ValueTypeNames.Point3fArray)
+    for frame in range(REDUCE_FRAMES):
+        # Moves for half a second, then holds, as blocked animation does
+        offset = frame // 24 + min(frame % 24, 12) / 12.0
+        layer.SetTimeSample(points.path, float(frame + 1), base + Vt.Vec3fArray(len(base), Gf.Vec3f(offset, 0, 0)))
+    layer.Save()
+    return layer
+
+
+def measure_point_reduction(phases, work_dir):
+    """大きなpoints配列の間引きが、書き込みと共有への転送で省ける時間より安いかを測る"""
+    full_path = os.path.join(work_dir, "points_full.usdc")
+    start = time.perf_counter()
+    layer = write_point_animation(full_path)
+    write_seconds = time.perf_counter() - start
+    stats = measure(phases, "reduce_samples_points", lambda: core.reduce_time_samples(layer, {})).get("points", {})
+    reduced_path = os.path.join(work_dir, "points_reduced.usdc")
+    start = time.perf_counter()
+    layer.Export(reduced_path)
+    write_reduced_seconds = time.perf_counter() - start
+
+    def transfer_seconds(path):
+        # The simulated share pays one round trip per 64KB
+        return SHARE_LATENCY * (os.path.getsize(path) >> 16)
+    saved = write_seconds + transfer_seconds(full_path) - write_reduced_seconds - transfer_seconds(reduced_path)
+    phases["reduce_samples_points"].update(
+        points=REDUCE_POINTS, frames=REDUCE_FRAMES, numpy=core.numpy is not None,
+        skipped_attributes=stats.get("skipped", 0),
+        samples_before=stats.get("before", 0), samples_after=stats.get("after", 0),
+        bytes_before=os.path.getsize(full_path), bytes_after=os.path.getsize(reduced_path),
+        net_seconds=round(saved - phases["reduce_samples_points"]["seconds"], 4))
+
+
+def count_time_samples(directory):
+    """directory以下のUSDファイルにあるタイムサンプルの総数"""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            if os.path.splitext(file_name)[1] not in (".usda", ".usdc"):
+                continue
+            layer = Sdf.Layer.FindOrOpen(os.path.join(root, file_name))
+            paths = []
+            layer.Traverse(Sdf.Path.absoluteRootPath, paths.append)
+            total += sum(layer.GetNumTimeSamplesForPath(path) for path in paths if path.IsPropertyPath())
+    return total
+
+
+def run(config, work_dir):
+    _scene.build(**config)
+    frame_range = tuple(config["frame_range"]) if config.get("frame_range") else None
+    options = config.get("export_options", {})
+    roots = [_scene.scene.name(key, long=True) for key in _scene.roots()]
+    groups = [root for root in roots if root.startswith("|group_")]
+    meshes = [mesh for group in groups for mesh in cmds.listRelatives(group, children=True, fullPath=True)]
+    phases = {}
+    measure_cold_start(phases)
+    measure_subscription_leaks(phases)
+
+    index = measure(phases, "scene_index", core.SceneIndex)
+
+    def classify():
+        cmds.select(roots, replace=True)
+        core.SceneClassifier(index).classify()
+    measure(phases, "classify", classify)
+
+    def plan(snapshot=None):
+        cmds.select(roots, replace=True)
+        return core.plan_from_selection(work_dir, frame_range=frame_range, detect_static=True, snapshot=snapshot)
+    snapshot = core.SceneSnapshot(index)
+    measure(phases, "plan_snapshot", lambda: plan(snapshot))
+    measure(phases, "plan_cached", lambda: plan(snapshot))
+
+    export_dir = os.path.join(work_dir, "export")
+    cmds.select(roots, replace=True)
+    measure(phases, "execution", lambda: core.execution(export_dir, frame_range=frame_range, incremental=True,
+                                                        **options))
+    cmds.select(roots, replace=True)
+    measure(phases, "execution_unchanged", lambda: core.execution(export_dir, frame_range=frame_range,
+                                                                  incremental=True, **options))
+
+    payload_dir = os.path.join(work_dir, "export_payloads")
+    cmds.select(roots, replace=True)
+    measure(phases, "execution_payloads", lambda: core.execution(payload_dir, frame_range=frame_range,
+                                                                 **dict(options, use_payloads=True)))
+    # Maya's export work is simulated as GIL-free latency, which the post-processing pool can overlap with
+    _scene.EXPORT_LATENCY = PIPELINE_EXPORT_LATENCY
+    try:
+        for name, post_workers in (("pipeline_sequential", 0), ("pipeline_overlapped", None)):
+            cmds.select(roots, replace=True)
+            measure(phases, name, lambda: core.execution(os.path.join(work_dir, name), frame_range=frame_range,
+                                                         post_workers=post_workers, **options))
+    finally:
+        _scene.EXPORT_LATENCY = 0.0
+    reduce_dir = os.path.join(work_dir, "export_reduced")
+    cmds.select(roots, replace=True)
+    measure(phases, "execution_reduce_samples", lambda: core.execution(reduce_dir, frame_range=frame_range,
+                                                                       sample_tolerances={}, **options))
+    phases["execution_reduce_samples"].update(samples_before=count_time_samples(export_dir),
+                                              samples_after=count_time_samples(reduce_dir))
+    measure_point_reduction(phases, work_dir)
+    # Workers re-open the scene, which the sim rebuilds from the build() arguments
+    scene_path = os.path.join(work_dir, "scene.json")
+    with open(scene_path, "w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in config.items() if key != "export_options"}, f)
+    parallel_dir = os.path.join(work_dir, "export_parallel")
+    previous_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = SIM_PYTHONPATH
+    try:
+        cmds.select(roots, replace=True)
+        measure(phases, "execution_parallel", lambda: core.execution_parallel(
+            parallel_dir, frame_range=frame_range, workers=PARALLEL_WORKERS, mayapy=sys.executable, scene=scene_path))
+    finally:
+        if previous_path is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = previous_path
+    phases["execution_parallel"].update(
+        lights=len(os.listdir(os.path.join(parallel_dir, "Lights"))) if config.get("lights") else 0,
+        cameras=len(os.listdir(os.path.join(parallel_dir, "Cameras"))) if config.get("cameras") else 0)
+    # One mesh edit: live sync re-exports only that mesh and its layers, a rerun fingerprints every asset
+    live_dir = os.path.join(work_dir, "export_live")
+    cmds.select(roots, replace=True)
+    live = core.LiveSync.from_selection(live_dir, frame_range=frame_range)
+    measure(phases, "live_sync_initial", lambda: (live.start(), live.process()))
+    _scene.scene.set_attr(meshes[0], "translateX", 100.0)
+    measure(phases, "live_sync_edit", live.process)
+    with contextlib.redirect_stdout(io.StringIO()):
+        live.stop()
+    _scene.scene.set_attr(meshes[0], "translateX", 200.0)
+    cmds.select(roots, replace=True)
+    measure(phases, "execution_after_edit", lambda: core.execution(live_dir, frame_range=frame_range,
+                                                                   incremental=True))
+    # Writing straight to a share versus staging locally and transferring with parallel streams
+    share_root = os.path.join(work_dir, "share")
+    with simulated_share(share_root, SHARE_LATENCY):
+        cmds.select(roots, replace=True)
+        measure(phases, "share_direct", lambda: core.execution(os.path.join(share_root, "direct"),
+                                                               frame_range=frame_range, **options))
+        staging = core.StagedOutput(os.path.join(share_root, "staged"), streams=STAGING_STREAMS,
+                                    scratch_dir=os.path.join(work_dir, "scratch"))
+        cmds.select(roots, replace=True)
+        measure(phases, "share_staged", lambda: core.execution(staging.output_dir, frame_range=frame_range,
+                                                               staging=staging, **options))
+    measure_composition(phases, "compose_references", os.path.join(export_dir, "geo_combine.usda"), True)
+    measure_composition(phases, "compose_payloads_loaded", os.path.join(payload_dir, "geo_combine.usda"), True)
+    measure_composition(phases, "compose_payloads_unloaded", os.path.join(payload_dir, "geo_combine.usda"), False)
+
+    file_info_list = [(mesh.split("|")[-1], os.path.join(export_dir, f"{mesh.split('|')[-1]}.usdc"))
+                      for mesh in meshes]
+    measure(phases, "write_combine_usd", lambda: core.write_combine_usd(file_info_list, work_dir,
+                                                                        combine_filename="bench_combine.usda"))
+    geo_combine_list = [(group.split("|")[-1], f"{group.split('|')[-1]}/{group.split('|')[-1]}_combine.usda")
+                        for group in groups]
+    measure(phases, "write_houdini_loader_script",
+            lambda: core.write_houdini_loader_script(geo_combine_list, work_dir, script_name="bench_loader.py"))
+
+    mtlx_dir = os.path.join(work_dir, "mtlx")
+    os.makedirs(mtlx_dir, exist_ok=True)
+
+    def materialx_per_object():
+        exporter = core.MaterialXExporter()
+        for mesh in meshes:
+            exporter.write_materialx(mesh, mtlx_dir)
+    measure(phases, "materialx_per_object", materialx_per_object)
+    measure(phases, "materialx_library", lambda: core.MaterialXExporter().write_library(meshes, mtlx_dir))
+
+    return {"config": config, "phases": phases,
+            "total_seconds": round(sum(phase["seconds"] for phase in phases.values()), 4),
+            "total_cmds_calls": sum(phase["cmds_calls"] for phase in phases.values())}
+
+
+def compare(result, baseline, tolerance):
+    """ベースラインより悪化したフェーズの説明を返す"""
+    failures = []
+    for name, expected in baseline["phases"].items():
+        actual = result["phases"].get(name)
+        if actual is None:
+            failures.append(f"{name}: フェーズがありません")
+            continue
+        if actual.get("qt_loaded"):
+            failures.append(f"{name}: バッチの読み込みでQtが読み込まれています")
+        if actual.get("leaked_callbacks") or actual.get("leaked_script_jobs"):
+            failures.append(f"{name}: 開閉 {actual['cycles']}回でコールバック {actual['leaked_callbacks']}個、"
+                            f"scriptJob {actual['leaked_script_jobs']}個が残っています")
+        if actual.get("net_seconds", 0.0) < 0:
+            failures.append(f"{name}: 間引きに省けた時間より {-actual['net_seconds']:.3f}s 多くかかっています")
+        if actual["cmds_calls"] > expected["cmds_calls"]:
+            failures.append(f"{name}: cmds呼び出し {expected['cmds_calls']} -> {actual['cmds_calls']}")
+        limit = expected["seconds"] * (1 + tolerance) + MIN_SLACK_SEC
+        if actual["seconds"] > limit:
+            failures.append(f"{name}: {expected['seconds']:.3f}s -> {actual['seconds']:.3f}s (上限 {limit:.3f}s)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for key in ("groups", "meshes", "lights", "cameras", "materials", "textures"):
+        parser.add_argument(f"--{key}", type=int, default=DEFAULT_CONFIG[key])
+    parser.add_argument("--animated", type=float, default=DEFAULT_CONFIG["animated"],
+                        help="アニメーションするメッシュの割合")
+    parser.add_argument("--frames", type=int, nargs=2, default=DEFAULT_CONFIG["frame_range"])
+    parser.add_argument("--batch", action="store_true", help="グループ内のメッシュをまとめて書き出す")
+    parser.add_argument("--output", help="結果のJSONの書き出し先")
+    parser.add_argument("--baseline", help="比較するベースラインのJSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="時間の悪化の許容割合")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        config = baseline["config"]
+    else:
+        config = {key: getattr(args, key) for key in ("groups", "meshes", "lights", "cameras", "materials",
+                                                      "textures", "animated")}
+        config["frame_range"] = args.frames
+        config["export_options"] = {"batch_export": True} if args.batch else {}
+
+    work_dir = tempfile.mkdtemp(prefix="usd_bench_")
+    try:
+        result = run(config, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name, phase in result["phases"].items():
+        print(f"{name:<30} {phase['seconds']:>9.3f}s {phase['cmds_calls']:>9} cmds")
+    print(f"{'total':<30} {result['total_seconds']:>9.3f}s {result['total_cmds_calls']:>9} cmds")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+    failures = compare(result, baseline, args.tolerance) if baseline else []
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    # A check that could not run must not read as a pass
+    skipped = [name for name, phase in result["phases"].items() if phase.get("skipped")]
+    for name in skipped:
+        print(f"SKIPPED {name}")
+    if failures:
+        return 1
+    return 2 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
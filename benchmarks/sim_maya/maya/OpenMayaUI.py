@@ -0,0 +1,7 @@
+"""maya.OpenMayaUI の疑似実装。メインウィンドウはないので、GUIはトップレベルに開く"""
+
+
+class MQtUtil:
+    @staticmethod
+    def mainWindow():
+        return 0
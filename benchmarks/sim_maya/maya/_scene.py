@@ -0,0 +1,275 @@
+"""ベンチマーク用の疑似シーン。maya.cmds と maya.api.OpenMaya の代わりにこのデータを参照する"""
+import collections
+import itertools
+import uuid as uuid_module
+
+TEXTURE_SLOTS = ("baseColor", "specularRoughness", "metalness", "normalCamera", "transmission", "coat")
+DEFAULT_CAMERAS = ("persp", "top", "front", "side")
+SHAPE_TYPES = {"mesh", "camera", "directionalLight", "pointLight", "spotLight", "areaLight"}
+MATERIAL_TYPES = {"aiStandardSurface", "standardSurface", "lambert", "blinn"}
+TRANSFORM_ATTRS = ("translateX", "translateY", "translateZ", "rotateX", "rotateY", "rotateZ",
+                   "scaleX", "scaleY", "scaleZ", "visibility")
+
+# Unit cube shared by every mesh; each mesh scales it so content hashes differ
+CUBE_POINTS = [(-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (-0.5, 0.5, 0.5), (0.5, 0.5, 0.5),
+               (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (-0.5, -0.5, -0.5), (0.5, -0.5, -0.5)]
+CUBE_COUNTS = [4, 4, 4, 4, 4, 4]
+CUBE_INDICES = [0, 1, 3, 2, 2, 3, 5, 4, 4, 5, 7, 6, 6, 7, 1, 0, 1, 7, 5, 3, 6, 0, 2, 4]
+CUBE_UVS = ([0.375, 0.625, 0.375, 0.625, 0.375, 0.625, 0.375, 0.625],
+            [0.0, 0.0, 0.25, 0.25, 0.5, 0.5, 0.75, 0.75])
+
+# Every maya.cmds call is counted here by command name
+CALLS = collections.Counter()
+# Seconds each mayaUSDExport sleeps, standing in for Maya's native work that does not hold the GIL
+EXPORT_LATENCY = 0.0
+# Evaluation time of the current MDGContext; None is the normal context
+CONTEXT_TIME = None
+# Frame the time slider is on; None evaluates curves at their first key
+CURRENT_TIME = None
+CAMERA_ATTRS = {"horizontalFilmAperture": 1.417, "verticalFilmAperture": 0.945, "horizontalFilmOffset": 0.0,
+                "verticalFilmOffset": 0.0, "nearClipPlane": 0.1, "farClipPlane": 10000.0, "fStop": 5.6,
+                "focusDistance": 5.0, "orthographicWidth": 30.0, "orthographic": False}
+LIGHT_ATTRS = {"intensity": 1.0, "colorR": 1.0, "colorG": 1.0, "colorB": 1.0, "coneAngle": 0.698, "dropoff": 0.0,
+               "emitDiffuse": True, "emitSpecular": True, "useRayTraceShadows": False, "shadColorR": 0.0,
+               "shadColorG": 0.0, "shadColorB": 0.0, "lightRadius": 0.0, "lightAngle": 0.0, "penumbraAngle": 0.0,
+               "normalize": True}
+# Registered message callbacks: id -> (message, node key or None for every node, function)
+CALLBACKS = {}
+_callback_ids = itertools.count(1)
+
+
+def add_callback(message, key, function):
+    callback_id = next(_callback_ids)
+    CALLBACKS[callback_id] = (message, key, function)
+    return callback_id
+
+
+def notify(message, key, *args):
+    for callback_message, callback_key, function in list(CALLBACKS.values()):
+        if callback_message == message and callback_key in (None, key):
+            function(*args)
+
+
+class Scene:
+    def __init__(self):
+        self.types = {}
+        self.attrs = {}
+        self.uuids = {}
+        self.short = {}
+        self.children = collections.defaultdict(list)
+        self.inputs = collections.defaultdict(list)   # node -> [(dst attr, src node, src attr)]
+        self.outputs = collections.defaultdict(list)  # node -> [(src attr, dst node, dst attr)]
+        self.selection = []
+        self.scene_name = "/sim/benchmark_scene.mb"
+        self.playback_range = (1.0, 24.0)
+
+    def add(self, name, node_type, parent=None, **attrs):
+        """DAGノードはロングパス、DGノードは名前をキーにする"""
+        dag = parent is not None or node_type == "transform" or node_type in SHAPE_TYPES
+        key = f"{parent or ''}|{name}" if dag else name
+        self.types[key] = node_type
+        self.attrs[key] = dict(attrs)
+        self.uuids[key] = str(uuid_module.uuid5(uuid_module.NAMESPACE_URL, key)).upper()
+        self.short[name] = key
+        if dag:
+            self.children[parent or ""].append(key)
+            if parent:
+                notify("child_added", None, key, parent)
+                notify("dag_changed", None, "child_added", key, parent)
+        return key
+
+    def remove(self, key):
+        """ノードと子孫を削除し、Mayaと同じくDAGとノード削除のコールバックを呼ぶ"""
+        parent = self.parent(key) if self.is_dag(key) else None
+        for node in reversed([key] + (self.descendants(key) if self.is_dag(key) else [])):
+            for _, src, src_attr in self.inputs.pop(node, []):
+                self.outputs[src] = [edge for edge in self.outputs[src] if edge[1] != node]
+            for _, dst, _ in self.outputs.pop(node, []):
+                self.inputs[dst] = [edge for edge in self.inputs[dst] if edge[1] != node]
+            self.children.pop(node, None)
+            del self.types[node], self.attrs[node], self.uuids[node]
+            self.short.pop(self.name(node), None)
+            if node in self.selection:
+                self.selection.remove(node)
+            notify("node_removed", None, node)
+        if self.is_dag(key):
+            self.children[parent or ""].remove(key)
+            if parent:
+                notify("child_removed", None, key, parent)
+                notify("dag_changed", None, "child_removed", key, parent)
+
+    def set_attr(self, key, attr, value):
+        """値を変えて、Mayaと同じくダーティと属性変更のコールバックを呼ぶ"""
+        self.attrs[key][attr] = value
+        notify("dirty", key, key, attr)
+        notify("attribute_changed", key, key, attr)
+
+    def connect(self, src, src_attr, dst, dst_attr):
+        self.inputs[dst].append((dst_attr, src, src_attr))
+        self.outputs[src].append((src_attr, dst, dst_attr))
+        notify("connection", None, src, src_attr, dst, dst_attr, True)
+
+    def exists(self, name):
+        return name in self.types or name in self.short
+
+    def resolve(self, name):
+        if name in self.types:
+            return name
+        if name in self.short:
+            return self.short[name]
+        raise ValueError(f"No object matches name: {name}")
+
+    def name(self, key, long=False):
+        return key if long or not key.startswith("|") else key.rsplit("|", 1)[1]
+
+    def is_type(self, key, node_type):
+        actual = self.types[key]
+        if node_type == "shape":
+            return actual in SHAPE_TYPES
+        if node_type == "animCurve":
+            return actual.startswith("animCurve")
+        if node_type == "light":
+            return actual.endswith("Light")
+        return actual == node_type
+
+    def is_dag(self, key):
+        return key.startswith("|")
+
+    def parent(self, key):
+        parent = key.rsplit("|", 1)[0]
+        return parent or None
+
+    def descendants(self, key):
+        result = []
+        stack = list(reversed(self.children[key]))
+        while stack:
+            child = stack.pop()
+            result.append(child)
+            stack.extend(reversed(self.children[child]))
+        return result
+
+    def upstream(self, key):
+        """上流のノードを深さ優先でたどる (自分自身を含む)"""
+        seen = [key]
+        visited = {key}
+        stack = [key]
+        while stack:
+            for _, src, _ in self.inputs[stack.pop()]:
+                if src not in visited:
+                    visited.add(src)
+                    seen.append(src)
+                    stack.append(src)
+        return seen
+
+    def get(self, key, attr, time=None):
+        for dst_attr, src, _ in self.inputs[key]:
+            if dst_attr == attr and self.types[src].startswith("animCurve"):
+                return self.evaluate(src, time)
+        if attr not in self.attrs[key]:
+            raise ValueError(f"No object matches name: {key}.{attr}")
+        return self.attrs[key][attr]
+
+    def evaluate(self, curve, time):
+        keys = self.attrs[curve]["keys"]
+        time = CURRENT_TIME if time is None else time
+        if time is None or time <= keys[0][0]:
+            return keys[0][1]
+        for (t0, v0), (t1, v1) in zip(keys, keys[1:]):
+            if time <= t1:
+                return v0 + (v1 - v0) * (time - t0) / (t1 - t0)
+        return keys[-1][1]
+
+    def is_animated(self, key):
+        return any(self.types[node].startswith("animCurve") or self.types[node] == "time"
+                   for node in self.upstream(key))
+
+    def world_translate(self, key, time=None):
+        x = y = z = 0.0
+        while key:
+            if self.types[key] == "transform":
+                x += self.get(key, "translateX", time)
+                y += self.get(key, "translateY", time)
+                z += self.get(key, "translateZ", time)
+            key = self.parent(key)
+        return x, y, z
+
+
+scene = Scene()
+
+
+def transform_attrs(tx=0.0, ty=0.0, tz=0.0):
+    attrs = dict.fromkeys(TRANSFORM_ATTRS, 0.0)
+    attrs.update(translateX=tx, translateY=ty, translateZ=tz, scaleX=1.0, scaleY=1.0, scaleZ=1.0, visibility=True)
+    return attrs
+
+
+def build(groups=10, meshes=50, lights=4, cameras=2, materials=20, textures=4, animated=0.2, frame_range=(1, 24),
+          **unused):
+    """groups × meshes のメッシュ、ライト、カメラ、テクスチャ付きのマテリアルを持つシーンを作り直す"""
+    global scene, CURRENT_TIME
+    scene = Scene()
+    CURRENT_TIME = None
+    scene.add("time1", "time", outTime=float(frame_range[0]))
+    scene.playback_range = (float(frame_range[0]), float(frame_range[1]))
+    for name in DEFAULT_CAMERAS:
+        cam = scene.add(name, "transform", **transform_attrs())
+        scene.add(f"{name}Shape", "camera", parent=cam, focalLength=35.0, **CAMERA_ATTRS)
+
+    shading_groups = []
+    for m in range(materials):
+        material = scene.add(f"material_{m}", "aiStandardSurface", baseColor=[(0.8, 0.8, 0.8)],
+                             specularRoughness=0.2 + 0.01 * (m % 10), metalness=0.0, transmission=0.0, coat=0.0)
+        sg = scene.add(f"material_{m}SG", "shadingEngine")
+        scene.connect(material, "outColor", sg, "surfaceShader")
+        for t, slot in enumerate(TEXTURE_SLOTS[:textures]):
+            place = scene.add(f"material_{m}_place_{t}", "place2dTexture")
+            file_node = scene.add(f"material_{m}_file_{t}", "file",
+                                  fileTextureName=f"/mnt/nas/textures/material_{m}_{slot}.<UDIM>.exr")
+            scene.connect(place, "outUV", file_node, "uvCoord")
+            if slot == "normalCamera":
+                bump = scene.add(f"material_{m}_bump", "bump2d")
+                scene.connect(file_node, "outAlpha", bump, "bumpValue")
+                scene.connect(bump, "outNormal", material, slot)
+            else:
+                scene.connect(file_node, "outColor" if slot == "baseColor" else "outAlpha", material, slot)
+        shading_groups.append(sg)
+
+    every = max(1, round(1 / animated)) if animated else 0
+    for g in range(groups):
+        group = scene.add(f"group_{g}", "transform", **transform_attrs(tx=g * 10.0))
+        for i in range(meshes):
+            mesh = scene.add(f"mesh_{g}_{i}", "transform", parent=group, **transform_attrs(tx=float(i)))
+            shape = scene.add(f"mesh_{g}_{i}Shape", "mesh", parent=mesh, scale=1.0 + (g * meshes + i) % 7)
+            if shading_groups:
+                scene.connect(shape, "instObjGroups[0]", shading_groups[(g * meshes + i) % len(shading_groups)],
+                              "dagSetMembers")
+            if every and (g * meshes + i) % every == 0:
+                curve = scene.add(f"mesh_{g}_{i}_translateY", "animCurveTL",
+                                  keys=[(float(frame_range[0]), 0.0), (float(frame_range[1]), float(i))])
+                scene.connect("time1", "outTime", curve, "input")
+                scene.connect(curve, "output", mesh, "translateY")
+
+    light_types = ("directionalLight", "pointLight", "spotLight", "areaLight")
+    for k in range(lights):
+        light = scene.add(f"light_{k}", "transform", **transform_attrs(ty=5.0))
+        shape = scene.add(f"light_{k}Shape", light_types[k % len(light_types)], parent=light, **LIGHT_ATTRS)
+        if every and k % every == 0:
+            animate(shape, "intensity", frame_range, 1.0, 2.0)
+    for k in range(cameras):
+        cam = scene.add(f"camera_{k}", "transform", **transform_attrs(tz=20.0 + k))
+        scene.add(f"camera_{k}Shape", "camera", parent=cam, focalLength=35.0 + k, **CAMERA_ATTRS)
+        if every and k % every == 0:
+            animate(cam, "translateX", frame_range, 0.0, 10.0)
+    return scene
+
+
+def animate(key, attr, frame_range, start_value, end_value):
+    curve = scene.add(f"{scene.name(key)}_{attr}", "animCurveTU",
+                      keys=[(float(frame_range[0]), start_value), (float(frame_range[1]), end_value)])
+    scene.connect("time1", "outTime", curve, "input")
+    scene.connect(curve, "output", key, attr)
+
+
+def roots():
+    """既定のカメラ以外のトップレベルのトランスフォーム"""
+    return [key for key in scene.children[""] if scene.name(key) not in DEFAULT_CAMERAS]
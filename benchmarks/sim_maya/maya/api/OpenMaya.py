@@ -0,0 +1,257 @@
+"""maya.api.OpenMaya の疑似実装。書き出し処理が使うクラスだけを _scene のデータで再現する"""
+from maya import _scene
+
+
+class MFn:
+    kInvalid = 0
+    kBase = 1
+    kAnimCurveTimeToAngular = 2
+    kAnimCurveTimeToDistance = 3
+    kAnimCurveTimeToUnitless = 4
+    kAnimCurveTimeToTime = 5
+    kTime = 6
+    kMesh = 7
+
+
+API_TYPES = {"animCurveTA": MFn.kAnimCurveTimeToAngular, "animCurveTL": MFn.kAnimCurveTimeToDistance,
+             "animCurveTU": MFn.kAnimCurveTimeToUnitless, "animCurveTT": MFn.kAnimCurveTimeToTime,
+             "time": MFn.kTime, "mesh": MFn.kMesh}
+
+
+class MSpace:
+    kObject = 2
+    kWorld = 4
+
+
+class MObject:
+    def __init__(self, key):
+        self.key = key
+
+    def apiType(self):
+        return API_TYPES.get(_scene.scene.types[self.key], MFn.kBase)
+
+
+class MDagPath:
+    def __init__(self, key):
+        self.key = key.key if isinstance(key, MDagPath) else key
+
+    def fullPathName(self):
+        return self.key
+
+    def node(self):
+        return MObject(self.key)
+
+    def extendToShape(self):
+        scene = _scene.scene
+        shapes = [child for child in scene.children[self.key] if scene.types[child] != "transform"]
+        if shapes:
+            self.key = shapes[0]
+        return self
+
+
+class MTime:
+    def __init__(self, value=0.0, unit=None):
+        self.value = value
+
+    @staticmethod
+    def uiUnit():
+        return 6
+
+
+class MDGContext:
+    def __init__(self, time=None):
+        self.time = time.value if time is not None else None
+
+    def makeCurrent(self):
+        previous = MDGContext()
+        previous.time = _scene.CONTEXT_TIME
+        _scene.CONTEXT_TIME = self.time
+        return previous
+
+
+class MPlug:
+    def __init__(self, key, attr):
+        self.key = key
+        self.attr = attr
+
+    def elementByLogicalIndex(self, index):
+        return self
+
+    def asDouble(self):
+        return float(_scene.scene.get(self.key, self.attr, _scene.CONTEXT_TIME))
+
+    def asBool(self):
+        return bool(_scene.scene.get(self.key, self.attr, _scene.CONTEXT_TIME))
+
+    def asMObject(self):
+        # Only worldMatrix is read as data
+        x, y, z = _scene.scene.world_translate(self.key, _scene.CONTEXT_TIME)
+        return MMatrix([1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, x, y, z, 1.0])
+
+
+class MFnDependencyNode:
+    def __init__(self, obj):
+        self.key = obj.key
+
+    @property
+    def typeName(self):
+        return _scene.scene.types[self.key]
+
+    def findPlug(self, attr, want_networked):
+        return MPlug(self.key, attr)
+
+
+class MFnMatrixData:
+    def __init__(self, data):
+        self.data = data
+
+    def matrix(self):
+        return self.data
+
+
+class MNodeMessage:
+    kAttributeSet = 2048
+
+    @staticmethod
+    def addNodeDirtyPlugCallback(node, function, clientData=None):
+        return _scene.add_callback("dirty", node.key,
+                                   lambda key, attr: function(MObject(key), MPlug(key, attr), clientData))
+
+    @staticmethod
+    def addAttributeChangedCallback(node, function, clientData=None):
+        return _scene.add_callback("attribute_changed", node.key, lambda key, attr: function(
+            MNodeMessage.kAttributeSet, MPlug(key, attr), MPlug(key, attr), clientData))
+
+
+class MDagMessage:
+    kChildAdded = 2
+    kChildRemoved = 3
+
+    @staticmethod
+    def addChildAddedCallback(function, clientData=None):
+        return _scene.add_callback("child_added", None,
+                                   lambda child, parent: function(MDagPath(child), MDagPath(parent), clientData))
+
+    @staticmethod
+    def addAllDagChangesCallback(function, clientData=None):
+        messages = {"child_added": MDagMessage.kChildAdded, "child_removed": MDagMessage.kChildRemoved}
+        return _scene.add_callback("dag_changed", None, lambda message, child, parent: function(
+            messages[message], MDagPath(child), MDagPath(parent), clientData))
+
+    @staticmethod
+    def addChildRemovedCallback(function, clientData=None):
+        return _scene.add_callback("child_removed", None,
+                                   lambda child, parent: function(MDagPath(child), MDagPath(parent), clientData))
+
+
+class MDGMessage:
+    @staticmethod
+    def addConnectionCallback(function, clientData=None):
+        return _scene.add_callback("connection", None, lambda src, src_attr, dst, dst_attr, made: function(
+            MPlug(src, src_attr), MPlug(dst, dst_attr), made, clientData))
+
+    @staticmethod
+    def addNodeRemovedCallback(function, nodeType="dependNode", clientData=None):
+        return _scene.add_callback("node_removed", None, lambda key: function(MObject(key), clientData))
+
+
+class MMessage:
+    @staticmethod
+    def removeCallbacks(ids):
+        for callback_id in ids:
+            _scene.CALLBACKS.pop(callback_id, None)
+
+
+class MSelectionList:
+    def __init__(self):
+        self.keys = []
+
+    def add(self, name):
+        self.keys.append(_scene.scene.resolve(name))
+        return self
+
+    def getDependNode(self, index):
+        return MObject(self.keys[index])
+
+    def getDagPath(self, index):
+        return MDagPath(self.keys[index])
+
+
+class MPoint:
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x, self.y, self.z, self.w = x, y, z, w
+
+
+class MFnMesh:
+    def __init__(self, dag_path):
+        self.key = dag_path.key
+
+    def getVertices(self):
+        return list(_scene.CUBE_COUNTS), list(_scene.CUBE_INDICES)
+
+    def getPoints(self, space=MSpace.kObject):
+        scale = _scene.scene.attrs[self.key]["scale"]
+        return [MPoint(x * scale, y * scale, z * scale) for x, y, z in _scene.CUBE_POINTS]
+
+    def getUVs(self):
+        us, vs = _scene.CUBE_UVS
+        return list(us), list(vs)
+
+    @property
+    def numVertices(self):
+        return len(_scene.CUBE_POINTS)
+
+    @property
+    def numFaceVertices(self):
+        return len(_scene.CUBE_INDICES)
+
+    def numUVs(self, uvSet=""):
+        return len(_scene.CUBE_UVS[0])
+
+
+class MItDependencyGraph:
+    kUpstream = 1
+    kDownstream = 0
+    kDepthFirst = 0
+    kBreadthFirst = 1
+    kNodeLevel = 0
+    kPlugLevel = 1
+
+    def __init__(self, root, filter=MFn.kInvalid, direction=kUpstream, traversal=kDepthFirst, level=kNodeLevel):
+        self.nodes = _scene.scene.upstream(root.key)
+        self.position = 0
+
+    def isDone(self):
+        return self.position >= len(self.nodes)
+
+    def currentNode(self):
+        return MObject(self.nodes[self.position])
+
+    def next(self):
+        self.position += 1
+
+
+class MMatrix:
+    def __init__(self, values=None):
+        values = list(values) if values is not None else [float(i % 5 == 0) for i in range(16)]
+        self.rows = [values[i * 4:i * 4 + 4] for i in range(4)]
+
+    def getElement(self, row, col):
+        return self.rows[row][col]
+
+    def __mul__(self, other):
+        return MMatrix([sum(self.rows[r][k] * other.rows[k][c] for k in range(4)) for r in range(4) for c in range(4)])
+
+    def inverse(self):
+        # Gauss-Jordan elimination on [M | I]
+        rows = [row[:] + [float(r == c) for c in range(4)] for r, row in enumerate(self.rows)]
+        for col in range(4):
+            pivot = max(range(col, 4), key=lambda r: abs(rows[r][col]))
+            rows[col], rows[pivot] = rows[pivot], rows[col]
+            scale = rows[col][col]
+            rows[col] = [value / scale for value in rows[col]]
+            for r in range(4):
+                if r != col:
+                    factor = rows[r][col]
+                    rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+        return MMatrix([value for row in rows for value in row[4:]])
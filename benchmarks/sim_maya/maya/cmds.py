@@ -0,0 +1,290 @@
+"""maya.cmds の疑似実装。書き出し処理が使うコマンドだけを _scene のデータで再現する"""
+import builtins
+import functools
+import json
+
+from maya import _scene
+
+
+def _counted(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _scene.CALLS[func.__name__] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _items(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _split_plug(plug):
+    node, _, attr = plug.partition(".")
+    return node, attr or None
+
+
+def _attr_matches(attr, query):
+    return query is None or attr == query or attr.startswith(query + "[") or attr[:-1] == query
+
+
+@_counted
+def ls(*args, selection=False, long=False, dag=False, allPaths=False, type=None, showType=False,
+       noIntermediate=False, uuid=False, materials=False, **kwargs):
+    scene = _scene.scene
+    if selection:
+        nodes = list(scene.selection)
+    elif args:
+        nodes = [scene.resolve(name) for name in _items(args[0]) if scene.exists(name)]
+    else:
+        nodes = [key for key in scene.types if scene.is_dag(key)] if dag else list(scene.types)
+    if type:
+        nodes = [key for key in nodes if any(scene.is_type(key, t) for t in _items(type))]
+    if materials:
+        nodes = [key for key in nodes if scene.types[key] in _scene.MATERIAL_TYPES]
+    if uuid:
+        return [scene.uuids[key] for key in nodes]
+    result = []
+    for key in nodes:
+        result.append(scene.name(key, long))
+        if showType:
+            result.append(scene.types[key])
+    return result
+
+
+@_counted
+def listRelatives(nodes=None, shapes=False, fullPath=False, path=False, parent=False, children=False,
+                  allDescendents=False, type=None, noIntermediate=False, **kwargs):
+    scene = _scene.scene
+    result = []
+    for key in (scene.resolve(name) for name in _items(nodes)):
+        if parent:
+            related = [scene.parent(key)] if scene.parent(key) else []
+        elif allDescendents:
+            related = list(reversed(scene.descendants(key)))
+        else:
+            related = scene.children[key]
+        if shapes:
+            related = [child for child in related if scene.types[child] in _scene.SHAPE_TYPES]
+        if type:
+            related = [child for child in related if any(scene.is_type(child, t) for t in _items(type))]
+        result += [scene.name(child, fullPath or path) for child in related]
+    return result or None
+
+
+@_counted
+def nodeType(node):
+    return _scene.scene.types[_scene.scene.resolve(node)]
+
+
+@_counted
+def select(items=None, replace=True, clear=False, **kwargs):
+    scene = _scene.scene
+    selected = [] if clear else [scene.resolve(name) for name in _items(items)]
+    scene.selection = selected if replace or clear else scene.selection + selected
+
+
+@_counted
+def file(*args, q=False, sceneName=False, modified=False, open=False, **kwargs):
+    if q and sceneName:
+        return _scene.scene.scene_name
+    if q and modified:
+        return False
+    if open and args[0].endswith(".json"):
+        # Worker processes rebuild the benchmark scene from its build() arguments
+        with builtins.open(args[0], encoding="utf-8") as f:
+            _scene.build(**json.load(f))
+        _scene.scene.scene_name = args[0]
+    return None
+
+
+@_counted
+def loadPlugin(*args, **kwargs):
+    return None
+
+
+@_counted
+def currentUnit(q=False, linear=False, time=False, **kwargs):
+    return "film" if time else "cm"
+
+
+@_counted
+def currentTime(time=None, q=False, **kwargs):
+    if q:
+        return _scene.CURRENT_TIME if _scene.CURRENT_TIME is not None else 1.0
+    _scene.CURRENT_TIME = float(time)
+    return _scene.CURRENT_TIME
+
+
+@_counted
+def playbackOptions(q=False, min=False, max=False, **kwargs):
+    return _scene.scene.playback_range[1] if max else _scene.scene.playback_range[0]
+
+
+@_counted
+def scriptJob(event=None, attributeChange=None, kill=None, exists=None, force=False, protected=False, **kwargs):
+    """ジョブは_scene.CALLBACKSに登録する。イベントは発火しない"""
+    if exists is not None:
+        return exists in _scene.CALLBACKS
+    if kill is not None:
+        _scene.CALLBACKS.pop(kill, None)
+        return None
+    (flag, (target, function)), = ((flag, value) for flag, value in
+                                   (("event", event), ("attributeChange", attributeChange)) if value)
+    return _scene.add_callback(f"scriptJob:{flag}", target, lambda *args: function())
+
+
+@_counted
+def upAxis(q=False, axis=False, **kwargs):
+    return "y"
+
+
+@_counted
+def warning(message):
+    print(f"# Warning: {message}")
+
+
+@_counted
+def getAttr(plug, time=None, **kwargs):
+    node, attr = _split_plug(plug)
+    return _scene.scene.get(_scene.scene.resolve(node), attr, time)
+
+
+@_counted
+def listAttr(node, keyable=False, channelBox=False, **kwargs):
+    scene = _scene.scene
+    key = scene.resolve(node)
+    if channelBox:
+        return None
+    if scene.types[key] == "transform":
+        return list(_scene.TRANSFORM_ATTRS)
+    return [attr for attr in scene.attrs[key] if isinstance(scene.attrs[key][attr], (int, float))] or None
+
+
+@_counted
+def listConnections(nodes=None, source=True, destination=True, connections=False, plugs=False, type=None,
+                    **kwargs):
+    scene = _scene.scene
+    result = []
+    for item in _items(nodes):
+        node, attr = _split_plug(item)
+        key = scene.resolve(node)
+        edges = []
+        if source:
+            edges += [(own, other, other_attr) for own, other, other_attr in scene.inputs[key]]
+        if destination:
+            edges += [(own, other, other_attr) for own, other, other_attr in scene.outputs[key]]
+        for own_attr, other, other_attr in edges:
+            if not _attr_matches(own_attr, attr):
+                continue
+            if type and not scene.is_type(other, type):
+                continue
+            other_name = scene.name(other)
+            if connections:
+                result.append(f"{scene.name(key)}.{own_attr}")
+            result.append(f"{other_name}.{other_attr}" if plugs else other_name)
+    return result or None
+
+
+@_counted
+def listHistory(nodes=None, **kwargs):
+    scene = _scene.scene
+    result = []
+    for key in (scene.resolve(name) for name in _items(nodes)):
+        result += [scene.name(node) for node in scene.upstream(key) if scene.name(node) not in result]
+    return result or None
+
+
+@_counted
+def xform(node, q=False, matrix=False, worldSpace=False, **kwargs):
+    x, y, z = _scene.scene.world_translate(_scene.scene.resolve(node))
+    return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, x, y, z, 1.0]
+
+
+@_counted
+def keyframe(curve, q=False, timeChange=False, valueChange=False, **kwargs):
+    keys = _scene.scene.attrs[_scene.scene.resolve(curve)]["keys"]
+    return [value for key in keys for value in key]
+
+
+@_counted
+def keyTangent(curve, q=False, inAngle=False, outAngle=False, **kwargs):
+    return [0.0] * len(_scene.scene.attrs[_scene.scene.resolve(curve)]["keys"])
+
+
+@_counted
+def expression(expr, q=False, string=False, **kwargs):
+    return _scene.scene.attrs[_scene.scene.resolve(expr)].get("expression", "")
+
+
+@_counted
+def mayaUSDExport(file=None, selection=True, frameRange=None, **kwargs):
+    import time
+    from pxr import Sdf
+
+    if _scene.EXPORT_LATENCY:
+        time.sleep(_scene.EXPORT_LATENCY)
+
+    scene = _scene.scene
+    layer = Sdf.Layer.CreateAnonymous(".usda")
+    frames = list(range(int(frameRange[0]), int(frameRange[1]) + 1)) if frameRange else []
+    for selected in scene.selection:
+        for key in [selected] + scene.descendants(selected):
+            if scene.types[key] != "transform":
+                continue
+            _author_prim(layer, scene, key, frames)
+    if frames:
+        layer.startTimeCode, layer.endTimeCode = frames[0], frames[-1]
+    if layer.rootPrims:
+        layer.defaultPrim = layer.rootPrims[0].name
+    layer.Export(file)
+
+
+USD_LIGHT_TYPES = {"directionalLight": "DistantLight", "pointLight": "SphereLight",
+                   "spotLight": "SphereLight", "areaLight": "RectLight"}
+
+
+def _author_prim(layer, scene, key, frames):
+    from pxr import Gf, Sdf
+
+    parts = key.split("|")[1:]
+    for i in range(1, len(parts) + 1):
+        transform = "|" + "|".join(parts[:i])
+        path = Sdf.Path("/" + "/".join(parts[:i]))
+        if layer.GetPrimAtPath(path):
+            continue
+        spec = Sdf.CreatePrimInLayer(layer, path)
+        spec.specifier = Sdf.SpecifierDef
+        spec.typeName = "Xform"
+        translate = Sdf.AttributeSpec(spec, "xformOp:translate", Sdf.ValueTypeNames.Double3)
+        translate.default = Gf.Vec3d(*(scene.get(transform, f"translate{axis}") for axis in "XYZ"))
+        if frames and scene.is_animated(transform):
+            for frame in frames:
+                layer.SetTimeSample(translate.path, frame,
+                                    Gf.Vec3d(*(scene.get(transform, f"translate{axis}", frame) for axis in "XYZ")))
+        order = Sdf.AttributeSpec(spec, "xformOpOrder", Sdf.ValueTypeNames.TokenArray,
+                                  variability=Sdf.VariabilityUniform)
+        order.default = ["xformOp:translate"]
+
+    spec = layer.GetPrimAtPath(Sdf.Path("/" + "/".join(parts)))
+    # Shapes are merged into their transform like mayaUSDExport's mergeTransformAndShape
+    for shape in scene.children[key]:
+        shape_type = scene.types[shape]
+        if shape_type == "mesh":
+            spec.typeName = "Mesh"
+            scale = scene.attrs[shape]["scale"]
+            points = Sdf.AttributeSpec(spec, "points", Sdf.ValueTypeNames.Point3fArray)
+            points.default = [Gf.Vec3f(x * scale, y * scale, z * scale) for x, y, z in _scene.CUBE_POINTS]
+            counts = Sdf.AttributeSpec(spec, "faceVertexCounts", Sdf.ValueTypeNames.IntArray)
+            counts.default = _scene.CUBE_COUNTS
+            indices = Sdf.AttributeSpec(spec, "faceVertexIndices", Sdf.ValueTypeNames.IntArray)
+            indices.default = _scene.CUBE_INDICES
+        elif shape_type == "camera":
+            spec.typeName = "Camera"
+            focal = Sdf.AttributeSpec(spec, "focalLength", Sdf.ValueTypeNames.Float)
+            focal.default = scene.attrs[shape]["focalLength"]
+        elif shape_type in USD_LIGHT_TYPES:
+            spec.typeName = USD_LIGHT_TYPES[shape_type]
+            intensity = Sdf.AttributeSpec(spec, "inputs:intensity", Sdf.ValueTypeNames.Float)
+            intensity.default = scene.attrs[shape]["intensity"]